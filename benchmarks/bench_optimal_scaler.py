@@ -0,0 +1,79 @@
+##########################################################################################
+# Benchmark: get_optimal_scaler
+# Compares the old sampled get_optimal_scaler (10,000 point linspace, minimum of |df/ds|
+# over the samples that keep the image on the bed) with the closed form solve, and checks
+# both agree to within one sample step on random bed / image sizes.
+#
+# python benchmarks/bench_optimal_scaler.py [cases]
+##########################################################################################
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.svg_to_gcode import get_optimal_scaler
+
+
+SAMPLES = 10000
+
+
+# The get_optimal_scaler implementation the closed form replaced, kept here as the reference.
+def sampled_optimal_scaler(bed_size_x, bed_size_y, im_length_x, im_length_y, longest_edge):
+    X = bed_size_x
+    Y = bed_size_y
+    a = im_length_x
+    b = im_length_y
+    if ((X/Y)-1)*((a/b)-1) >= 0:
+        S = np.linspace(0, 1, SAMPLES)
+        dfds = np.array([-2*a*(X-s*a) - 2*b*(Y-s*b) for s in S])
+        condition = np.array([(Y - s*b) >= 0 and (X - s*a) >= 0 for s in S])
+        scaler_idx = np.argmin(np.abs(dfds)[condition])
+        scaler = S[scaler_idx]
+    else:
+        scale_x = longest_edge/im_length_x
+        scale_y = longest_edge/im_length_y
+        scaler = min(scale_x, scale_y)
+    return scaler
+
+
+def cases(count, rng):
+    # the canvas frontend sizes, then random beds and images of both orientations
+    yield 250, 200, 1024, 668, 150
+    yield 250, 200, 200, 250, 150
+    for _ in range(count):
+        X, Y = rng.uniform(50, 400, 2)
+        a, b = rng.uniform(1, 4000, 2)
+        yield X, Y, a, b, rng.uniform(10, 300)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.default_rng(0)
+    step = 1 / (SAMPLES - 1)
+
+    sampled_time = closed_time = 0.0
+    worst = 0.0
+    for args in cases(count, rng):
+        start = time.perf_counter()
+        reference = sampled_optimal_scaler(*args)
+        sampled_time += time.perf_counter() - start
+        start = time.perf_counter()
+        scaler = get_optimal_scaler(*args)
+        closed_time += time.perf_counter() - start
+
+        error = abs(scaler - reference)
+        worst = max(worst, error)
+        if error > step:
+            raise AssertionError(f'get_optimal_scaler{args} = {scaler}, sampled {reference}')
+
+    total = count + 2
+    print(f'{total} cases agree, largest difference {worst:.2e} (sample step {step:.2e})')
+    print(f'sampled {sampled_time / total * 1e6:.1f} us/call, closed form {closed_time / total * 1e6:.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+##########################################################################################
+# Benchmark: SVG path parsing
+# Compares the old parse_path (svgpathtools d() + regex + nested list building + float()
+# in the chomper) with tokenize_path on every SVG in svg/.
+#
+# python benchmarks/bench_parse_path.py [svg_dir] [repeats]
+##########################################################################################
+
+import glob
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import svgpathtools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.svg_interpreter import tokenize_path
+
+
+# The parse_path implementation tokenize_path replaced, kept here as the baseline.
+def legacy_parse_path(path):
+    path_data = path.d()
+    path_data = re.findall(r'[MmLlHhVvCcSsQqTtAaZz]|-?\d*\.?\d+|-?\.\d+', path_data)
+    path_commands = []
+    i = 0
+    while i < len(path_data):
+        cmd = path_data[i]
+        if cmd in 'MmLlHhVvCcSsQqTtAaZz':
+            command = [cmd]
+            i += 1
+            while i < len(path_data) and path_data[i] not in 'MmLlHhVvCcSsQqTtAaZz':
+                command.append(path_data[i])
+                i += 1
+            path_commands.append(command)
+        else:
+            i += 1
+    # The chomper then converted every token again
+    return [[command[0]] + [float(v) for v in command[1:]] for command in path_commands]
+
+
+def measure(fn, items, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            fn(item)
+    elapsed = (time.perf_counter() - start) / repeats
+
+    tracemalloc.start()
+    for item in items:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    svg_dir = sys.argv[1] if len(sys.argv) > 1 else 'svg'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f'{"file":<24}{"paths":>7}{"legacy ms":>12}{"new ms":>10}{"legacy KiB":>12}{"new KiB":>10}')
+    for svg_file in sorted(glob.glob(os.path.join(svg_dir, '*.svg'))):
+        try:
+            paths, attributes = svgpathtools.svg2paths(svg_file)
+        except Exception as e:
+            print(f'{os.path.basename(svg_file):<24} skipped ({e})')
+            continue
+        path_data = [attribute.get('d') or path.d() for path, attribute in zip(paths, attributes)]
+        if not path_data:
+            continue
+
+        legacy_time, legacy_peak = measure(legacy_parse_path, paths, repeats)
+        new_time, new_peak = measure(tokenize_path, path_data, repeats)
+        print(f'{os.path.basename(svg_file):<24}{len(paths):>7}'
+              f'{legacy_time * 1000:>12.2f}{new_time * 1000:>10.2f}'
+              f'{legacy_peak / 1024:>12.1f}{new_peak / 1024:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
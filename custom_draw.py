@@ -1,6 +1,6 @@
 import logging
 from lib import SVG_GCode
-from lib.pydexarm import Dexarm
+from lib.arm_session import get_session
 from lib.logger import formatLogger
 from lxml import etree
 import time
@@ -11,7 +11,11 @@ import time
 #import xmltodict
 
 serial_port = "COM5"
+send_rate = None  # cap on gcode lines per second for pens that need a slower pace, None sends as fast as the arm acks
+wait_for_moves = True  # end every job with M400, so a draw only returns once the arm has finished moving
 arm = None
+# The port stays open between draws and is shared with the other modules drawing on it, see get_session
+session = get_session(serial_port)
 svg_gcode = SVG_GCode(
     precision=10,
     z_feedrate=3000,
@@ -39,20 +43,39 @@ def draw(response):
 
 def plot_gcode(data):
     global arm
-    connect_arm()
-    if arm is not None:
+
+    def job(connected_arm):
+        #data = svg_gcode.path_to_gcode(paths=response, plot_image=False, plot_file=False, gcode_path='output.gcode')
+        # Paced by the arm's acks: several lines are kept in its buffers so the planner never runs dry
+        streamer = connected_arm.streamer(max_rate=send_rate)
         try:
-            #data = svg_gcode.path_to_gcode(paths=response, plot_image=False, plot_file=False, gcode_path='output.gcode')
-            time.sleep(0.2)
             for line in data:
                 logger.info(f'{line}\r')
-                arm._send_cmd(f'{line}\r')
-                time.sleep(0.1)
-            disconnect_arm()
-        except:
-            logging.error(f'Something went wrong while processing.')
-    else:
+                streamer.send(line)
+        except Exception:
+            # data is generated while the arm draws, so a conversion error stops it mid drawing: lift the pen (up in
+            # both absolute and relative mode) before giving up
+            streamer.send('G1 Z10')
+            streamer.flush()
+            raise
+        if wait_for_moves:
+            streamer.send('M400')
+        streamer.flush()
+        return streamer
+
+    try:
+        streamer = session.run(job)
+        arm = session.arm
+        logger.info(f'Job sent: {streamer.stats()}')
+    except ConnectionError:
         logging.error("No OnePlus Arm connected.")
+    except Exception:
+        logger.exception('Something went wrong while processing.')
+
+
+#draw_job: Draw a job compiled with svg_gcode.compile_svg / compile_paths, replayed straight from the file.
+def draw_job(job_path):
+    plot_gcode(svg_gcode.iter_job_gcode(job_path))
 
 
 def sendResponse(type='info', message='Message'):
@@ -66,8 +89,8 @@ def connect_arm():
     logger.info("connecting arm")
     global arm
     try:
-        arm = Dexarm(port=serial_port)
-        x, y, z, e, a, b, c = arm.get_current_position()
+        arm = session.ensure()
+        x, y, z, e, a, b, c = session.current_position()
         message = "OnePlus Arm connected x: {}, y: {}, z: {}, e: {}\na: {}, b: {}, c: {}".format(
             x, y, z, e, a, b, c)
         logger.info(message)
@@ -78,10 +101,10 @@ def connect_arm():
 def disconnect_arm():
     logger.info("disconnecting arm")
     global arm
-    if arm is not None:
+    if session.connected:
         # if arm.ser.is_open:
         #     arm.go_home()
-        arm.close()
+        session.close()
         arm = None
         return "Disconnected"
     else:
@@ -103,13 +126,13 @@ def send_gcode_file(gcode_path):
         coordinate_pairs = points.split(" ")
         # Parse each coordinate pair into its X and Y components
         coordinates = [pair.split(',') for pair in coordinate_pairs]
+        # draw returns once the arm has finished the polyline (M400), so the next one can follow right away
         draw(coordinates)
         #print(f"length of points: {len(points)}")
         #print(f"length of coordinate_pairs: {len(coordinate_pairs)}")
         #print(f"str coordinate_pairs: {str(coordinate_pairs)}")
         #print(f"str of coordinates: {str(coordinates)}").
         #print("=============")
-        time.sleep(2)
     #with open(gcode_path, 'r') as file:
     #    lines = file.readlines()
     #    print(len(lines))
@@ -127,7 +150,8 @@ def main():
     gcode_path = 'svg/img2img2.svg'
     #ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
     #send_gcode_file(gcode_path)
-    data = svg_gcode.svg_to_gcode(r"svg/abhi2.svg",False,False,True,r"output.gcode")
+    # lines are generated while the arm draws, so it starts on the first path right away
+    data = svg_gcode.iter_svg_gcode(r"svg/abhi2.svg")
     plot_gcode(data)
     
     #svg_gcode.path_to_gcode(r"svg/ho_no_ns.svg",False,False,True)
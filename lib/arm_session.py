@@ -0,0 +1,238 @@
+import re
+import threading
+import time
+
+import serial
+
+from .pydexarm import Dexarm, response_kind
+
+HEALTH_INTERVAL = 30.0  # seconds an idle session trusts its port before checking it again
+HEALTH_TIMEOUT = 2.0  # seconds the arm gets to answer a health check
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 0.5  # seconds before the first reconnect attempt, doubled for every further one
+
+MODULE_NAMES = ('PEN', 'LASER', 'PUMP', '3D')
+
+
+class ArmSession:
+    """ Long lived connection to one Dexarm
+
+    Opening the port resets the arm's USB serial and costs a round trip before anything can be drawn, so a session
+    keeps the port open between jobs. It caches the module type and last known position, checks that the arm still
+    answers when it sat idle for a while, and reconnects when the port went away. Jobs on one session run one at a
+    time.
+    """
+
+    def __init__(self, port, health_interval=HEALTH_INTERVAL, health_timeout=HEALTH_TIMEOUT,
+                 reconnect_attempts=RECONNECT_ATTEMPTS, reconnect_delay=RECONNECT_DELAY, arm_factory=Dexarm):
+        """
+        Args:
+            port (string): the serial port of the arm, e.g. "COM5"
+            health_interval (float): seconds of idling after which the next job first checks the arm answers
+            health_timeout (float): seconds the arm gets to answer a health check
+            reconnect_attempts (int): connection attempts before giving up
+            reconnect_delay (float): seconds before the first retry, doubled for every further one
+            arm_factory (callable): creates the arm for a port, Dexarm by default
+        """
+        self.port = port
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.arm_factory = arm_factory
+        self.arm = None
+        self.module_type = None
+        self.position = None  # x, y, z, e, a, b, c of the last health check, None while a job moved the arm since
+        self.last_seen = None  # time.monotonic() of the last response of the arm
+        self.connects = 0
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __repr__(self):
+        state = 'connected' if self.connected else 'disconnected'
+        return f'ArmSession({self.port!r}, {state}, module={self.module_type})'
+
+    @property
+    def connected(self):
+        return self.arm is not None and self.arm.ser.is_open
+
+    def _query(self, command):
+        """
+        Send a command and collect its response lines up to the ok, waiting at most health_timeout.
+        """
+        ser = self.arm.ser
+        timeout = ser.timeout
+        ser.timeout = self.health_timeout
+        try:
+            ser.reset_input_buffer()
+            ser.write(f'{command}\r'.encode())
+            deadline = time.monotonic() + self.health_timeout
+            lines = []
+            while time.monotonic() < deadline:
+                line = ser.readline().decode('utf-8', errors='replace').strip()
+                if not line:
+                    continue
+                if response_kind(line) == 'ok':
+                    self.last_seen = time.monotonic()
+                    return lines
+                lines.append(line)
+            raise TimeoutError(f'Arm on {self.port} did not answer {command}')
+        finally:
+            ser.timeout = timeout
+
+    def _read_position(self):
+        x, y, z, e, a, b, c = None, None, None, None, None, None, None
+        for line in self._query('M114'):
+            if line.find("X:") > -1:
+                x, y, z, e = (float(value) for value in re.findall(r"[-+]?\d*\.\d+|\d+", line)[:4])
+            if line.find("DEXARM Theta") > -1:
+                a, b, c = (float(value) for value in re.findall(r"[-+]?\d*\.\d+|\d+", line)[:3])
+        self.position = (x, y, z, e, a, b, c)
+        return self.position
+
+    def _read_module_type(self):
+        module_type = None
+        for line in self._query('M888'):
+            for name in MODULE_NAMES:
+                if line.find(name) > -1:
+                    module_type = name
+        self.module_type = module_type
+        return module_type
+
+    def connect(self):
+        """
+        Open the port (closing a previous connection), retrying with backoff, and cache position and module type.
+
+        Returns:
+            the connected Dexarm
+        """
+        with self.lock:
+            self._drop()
+            delay = self.reconnect_delay
+            for attempt in range(self.reconnect_attempts):
+                try:
+                    self.arm = self.arm_factory(self.port)
+                    self._read_position()
+                    self._read_module_type()
+                    self.connects += 1
+                    return self.arm
+                except (serial.SerialException, OSError, TimeoutError) as error:
+                    self._drop()
+                    if attempt + 1 == self.reconnect_attempts:
+                        raise ConnectionError(f'Could not connect to the arm on {self.port}: {error}') from error
+                    time.sleep(delay)
+                    delay *= 2
+
+    def health_check(self):
+        """
+        Whether the arm still answers (M114), refreshing the cached position.
+        """
+        with self.lock:
+            if not self.connected:
+                return False
+            try:
+                self._read_position()
+                return True
+            except (serial.SerialException, OSError, TimeoutError):
+                return False
+
+    def current_position(self):
+        """
+        The arm's position, from the cache when no job moved the arm since it was read.
+
+        Returns:
+            position x,y,z, extrusion e, and dexarm theta a,b,c
+        """
+        with self.lock:
+            self.ensure()
+            return self.position or self._read_position()
+
+    def ensure(self):
+        """
+        The connected arm, reconnecting when the port is closed or an idle arm stopped answering.
+        """
+        with self.lock:
+            if not self.connected:
+                return self.connect()
+            idle = self.last_seen is None or time.monotonic() - self.last_seen > self.health_interval
+            if idle and not self.health_check():
+                return self.connect()
+            return self.arm
+
+    def run(self, job):
+        """
+        Run job(arm) on the connected arm, holding the session for its whole duration.
+
+        A job failing with a connection error is not repeated (the arm may have drawn part of it), but the session
+        reconnects before the next one.
+        """
+        with self.lock:
+            arm = self.ensure()
+            self.position = None
+            try:
+                result = job(arm)
+            except (serial.SerialException, OSError):
+                self._drop()
+                raise
+            self.last_seen = time.monotonic()
+            return result
+
+    def stream(self, commands, **options):
+        """
+        Stream gcode commands to the arm, see Dexarm.stream.
+
+        Returns:
+            the GcodeStreamer with the statistics of the job
+        """
+        return self.run(lambda arm: arm.stream(commands, **options))
+
+    def _drop(self):
+        if self.arm is not None:
+            try:
+                self.arm.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.arm = None
+        self.position = None
+
+    def close(self):
+        """
+        Release the serial port. The next job reconnects.
+        """
+        with self.lock:
+            self._drop()
+            self.module_type = None
+            self.last_seen = None
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(port, **options):
+    """
+    The shared session of a port, created on first use.
+
+    Args:
+        port (string): the serial port of the arm
+        options: ArmSession arguments, only used when the session is created
+    """
+    with _sessions_lock:
+        if port not in _sessions:
+            _sessions[port] = ArmSession(port, **options)
+        return _sessions[port]
+
+
+def close_sessions():
+    """
+    Close every shared session.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
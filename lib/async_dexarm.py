@@ -0,0 +1,341 @@
+import asyncio
+import os
+import re
+import serial
+
+from collections import deque
+
+from .pydexarm import DexarmError, RX_BUFFER_SIZE, MAX_IN_FLIGHT, response_kind
+
+READ_TIMEOUT = 0.1  # seconds a polled read waits for data, bounds how long close() takes on ports without a file descriptor
+
+
+class _Command:
+
+    def __init__(self, command, size, future):
+        self.command = command
+        self.size = size
+        self.future = future
+        self.lines = []  # response lines before the ok
+        self.error = None
+
+
+class AsyncDexarm:
+    """ asyncio version of Dexarm
+
+    One reader task reads the port and resolves the future of the oldest outstanding command on every "ok", so
+    commands don't block a thread while they wait and any number of arms and requests can share one event loop.
+    Commands are written right away as long as the arm has room for them (see GcodeStreamer), so a status query
+    only waits for the commands queued in front of it, not for the moves to finish.
+
+    On POSIX the event loop watches the port's file descriptor, so no thread is tied up per arm. Ports without one
+    (e.g. lib.sim_port.SimulatedPort) are polled from the default executor with a READ_TIMEOUT read timeout.
+    """
+
+    def __init__(self, port, ser=None, rx_buffer_size=RX_BUFFER_SIZE, max_in_flight=MAX_IN_FLIGHT):
+        """
+        Args:
+            port (string): the serial port of Dexarm, e.g, "COM3", or a pyserial URL
+            ser (serial.Serial): an already open port to use instead, its read timeout is set to READ_TIMEOUT
+            rx_buffer_size (int): bytes of unacknowledged commands the arm can hold
+            max_in_flight (int): commands sent but not acknowledged yet
+        """
+        self.ser = ser if ser is not None else serial.serial_for_url(port, baudrate=115200, timeout=READ_TIMEOUT)
+        # A blocking read would keep the reader (and close()) waiting until the arm sends something
+        self.ser.timeout = READ_TIMEOUT
+        self.is_open = self.ser.isOpen()
+        self.rx_buffer_size = rx_buffer_size
+        self.max_in_flight = max_in_flight
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.error = None  # why the connection was lost, new commands raise ConnectionError once it is set
+        self._room = None
+        self._reader = None
+        self._chunks = None  # data of the watched file descriptor, None while polling
+        self._fd = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _start(self):
+        if self._reader is None:
+            loop = asyncio.get_running_loop()
+            self._room = asyncio.Condition()
+            if os.name == 'posix':
+                try:
+                    self._fd = self.ser.fileno()
+                    self._chunks = asyncio.Queue()
+                    loop.add_reader(self._fd, self._on_readable)
+                except (AttributeError, OSError, ValueError, NotImplementedError):
+                    self._fd = None
+                    self._chunks = None
+            self._reader = loop.create_task(self._read_loop())
+
+    def _on_readable(self):
+        try:
+            self._chunks.put_nowait(self.ser.read(max(1, self.ser.in_waiting)))
+        except Exception as error:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._chunks.put_nowait(error)
+
+    def _read_chunk(self):
+        return self.ser.read(max(1, self.ser.in_waiting))
+
+    async def _next_chunk(self):
+        if self._chunks is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self._read_chunk)
+        chunk = await self._chunks.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        return chunk
+
+    async def _read_loop(self):
+        buffer = b''
+        try:
+            while not self._closed:
+                chunk = await self._next_chunk()
+                if not chunk:
+                    continue
+                *lines, buffer = (buffer + chunk).split(b'\n')
+                for line in lines:
+                    await self._handle(line.decode('utf-8', errors='replace').strip())
+        except Exception as error:
+            if not self._closed:
+                # The transport is dead: fail what waits for an ok and refuse new commands
+                self.error = error
+                self._fail_pending(error)
+                async with self._room:
+                    self._room.notify_all()
+                raise
+
+    async def _handle(self, response):
+        if not response or not self.pending:
+            return
+        kind = response_kind(response)
+        entry = self.pending[0]
+        if kind == 'ok':
+            self.pending.popleft()
+            self.pending_bytes -= entry.size
+            if not entry.future.done():
+                if entry.error is not None:
+                    entry.future.set_exception(DexarmError(entry.command, entry.error))
+                else:
+                    entry.future.set_result(entry.lines)
+            async with self._room:
+                self._room.notify_all()
+        elif kind == 'error':
+            # The ok still follows, the future fails then so the acks stay in step
+            entry.error = response
+        elif kind == 'info':
+            entry.lines.append(response)
+
+    def _fail_pending(self, error):
+        while self.pending:
+            entry = self.pending.popleft()
+            if not entry.future.done():
+                entry.future.set_exception(ConnectionError(f'Arm connection lost: {error}'))
+        self.pending_bytes = 0
+
+    def _has_room(self, size):
+        return not self.pending or (len(self.pending) < self.max_in_flight and
+                                    self.pending_bytes + size <= self.rx_buffer_size)
+
+    async def _send_cmd(self, data, wait=True, timeout=None):
+        """
+        Send command to the arm.
+
+        Args:
+            data (string): the command
+            wait (bool): wait for the arm's "ok". If False, the command is only queued and the future of its
+                response is returned.
+            timeout (float): seconds to wait for the ok, None waits as long as it takes
+
+        Returns:
+            the response lines the arm sent before its ok (or their future when not waiting)
+        """
+        if self._closed:
+            raise ConnectionError('Arm connection is closed')
+        if self.error is not None:
+            raise ConnectionError(f'Arm connection lost: {self.error}')
+        self._start()
+        command = data.strip()
+        encoded = (command + '\r').encode()
+        async with self._room:
+            await self._room.wait_for(lambda: self.error is not None or self._has_room(len(encoded)))
+            if self.error is not None:
+                raise ConnectionError(f'Arm connection lost: {self.error}')
+            entry = _Command(command, len(encoded), asyncio.get_running_loop().create_future())
+            self.pending.append(entry)
+            self.pending_bytes += entry.size
+            self.ser.write(encoded)
+        if not wait:
+            return entry.future
+        # shield: a timed out caller must not cancel the entry, its ok still has to be matched
+        return await asyncio.wait_for(asyncio.shield(entry.future), timeout)
+
+    async def flush(self):
+        """
+        Wait until every queued command has been acknowledged.
+        """
+        if self.pending:
+            await asyncio.gather(*(entry.future for entry in list(self.pending)), return_exceptions=True)
+
+    async def go_home(self):
+        """
+        Go to home position and enable the motors. Should be called each time when power on.
+        """
+        await self._send_cmd("M1112\r")
+
+    async def set_workorigin(self):
+        """
+        Set the current position as the new work origin.
+        """
+        await self._send_cmd("G92 X0 Y0 Z0 E0\r")
+
+    async def set_acceleration(self, acceleration, travel_acceleration, retract_acceleration=60):
+        """
+        Set the preferred starting acceleration for moves of different types, see Dexarm.set_acceleration.
+        """
+        await self._send_cmd("M204" + "P" + str(acceleration) + "T" + str(travel_acceleration) +
+                             "R" + str(retract_acceleration) + "\r\n")
+
+    async def set_module_type(self, module_type):
+        """
+        Set the type of end effector, see Dexarm.set_module_type.
+        """
+        await self._send_cmd("M888 P" + str(module_type) + "\r")
+
+    async def get_module_type(self):
+        """
+        Get the type of end effector.
+
+        Returns:
+            string that indicates the type of the module
+        """
+        module_type = None
+        for serial_str in await self._send_cmd("M888\r"):
+            for name in ('PEN', 'LASER', 'PUMP', '3D'):
+                if serial_str.find(name) > -1:
+                    module_type = name
+        return module_type
+
+    async def move_to(self, x=None, y=None, z=None, e=None, feedrate=2000, mode="G1", wait=True):
+        """
+        Move to a cartesian position, see Dexarm.move_to.
+        """
+        cmd = mode + "F" + str(feedrate)
+        if x is not None:
+            cmd = cmd + "X" + str(round(x))
+        if y is not None:
+            cmd = cmd + "Y" + str(round(y))
+        if z is not None:
+            cmd = cmd + "Z" + str(round(z))
+        if e is not None:
+            cmd = cmd + "E" + str(round(e))
+        cmd = cmd + "\r"
+        return await self._send_cmd(cmd, wait=wait)
+
+    async def fast_move_to(self, x=None, y=None, z=None, feedrate=2000, wait=True):
+        """
+        Fast move to a cartesian position, i.e., in mode G0
+        """
+        return await self.move_to(x=x, y=y, z=z, feedrate=feedrate, mode="G0", wait=wait)
+
+    async def rotate_to(self, r=None, wait=True):
+        """
+        Rotates the rotary module to a given absolute degree
+        """
+        return await self._send_cmd("M2101 P" + str(r), wait=wait)
+
+    async def get_current_rotation(self, wait=True):
+        return await self._send_cmd("M2101\r", wait=wait)
+
+    async def get_current_position(self):
+        """
+        Get the current position
+
+        Returns:
+            position x,y,z, extrusion e, and dexarm theta a,b,c
+        """
+        x, y, z, e, a, b, c = None, None, None, None, None, None, None
+        for serial_str in await self._send_cmd('M114\r'):
+            if serial_str.find("X:") > -1:
+                temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
+                x, y, z, e = (float(value) for value in temp[:4])
+            if serial_str.find("DEXARM Theta") > -1:
+                temp = re.findall(r"[-+]?\d*\.\d+|\d+", serial_str)
+                a, b, c = (float(value) for value in temp[:3])
+        return x, y, z, e, a, b, c
+
+    async def dealy_ms(self, value):
+        """
+        Pauses the command queue and waits for a period of time in ms
+        """
+        await self._send_cmd("G4 P" + str(value) + '\r')
+
+    async def dealy_s(self, value):
+        """
+        Pauses the command queue and waits for a period of time in s
+        """
+        await self._send_cmd("G4 S" + str(value) + '\r')
+
+    async def soft_gripper_pick(self):
+        await self._send_cmd("M1001\r")
+
+    async def soft_gripper_place(self):
+        await self._send_cmd("M1000\r")
+
+    async def soft_gripper_nature(self):
+        await self._send_cmd("M1002\r")
+
+    async def soft_gripper_stop(self):
+        await self._send_cmd("M1003\r")
+
+    async def air_picker_pick(self):
+        await self._send_cmd("M1000\r")
+
+    async def air_picker_place(self):
+        await self._send_cmd("M1001\r")
+
+    async def air_picker_nature(self):
+        await self._send_cmd("M1002\r")
+
+    async def air_picker_stop(self):
+        await self._send_cmd("M1003\r")
+
+    async def laser_on(self, value=0):
+        await self._send_cmd("M3 S" + str(value) + '\r')
+
+    async def laser_off(self):
+        await self._send_cmd("M5\r")
+
+    async def conveyor_belt_forward(self, speed=0):
+        await self._send_cmd("M2012 F" + str(speed) + 'D0\r')
+
+    async def conveyor_belt_backward(self, speed=0):
+        await self._send_cmd("M2012 F" + str(speed) + 'D1\r')
+
+    async def conveyor_belt_stop(self, speed=0):
+        await self._send_cmd("M2013\r")
+
+    async def sliding_rail_init(self):
+        await self._send_cmd("M2005\r")
+
+    async def close(self):
+        """
+        Stop the reader task and release the serial port. Commands still waiting for their ok fail.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._chunks.put_nowait(b'')
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+        self._fail_pending('closed')
+        self.ser.close()
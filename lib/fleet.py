@@ -0,0 +1,270 @@
+import re
+import threading
+import time
+
+from collections import deque
+
+from .arm_session import ArmSession
+from .pydexarm import Dexarm
+
+COORDINATE_RE = re.compile(r'([XYZ])([-+]?(?:\d+\.?\d*|\.\d+))')
+MOVE_RE = re.compile(r'\s*G0*[0-35]\b')
+HOME_RE = re.compile(r'\s*M1112\b')
+
+
+def offset_gcode(lines, x=0, y=0, z=0):
+    """
+    Shift a gcode job by a calibration offset. Absolute (G90) moves get the offset added to their coordinates. A job
+    that moves relatively (G91, e.g. the svg jobs) gets one relative move by the offset before its first relative move
+    instead, for the axes no absolute move has shifted yet; the relative moves that follow then stay as they are. Arc /
+    cubic offsets (I J P Q) are relative already. Homing (M1112) returns the arm to its unshifted home.
+
+    Args:
+        lines (iterable of string): gcode lines
+        x, y, z (float): offset in mm
+
+    Returns:
+        generator of the shifted lines
+    """
+    offsets = {'X': x, 'Y': y, 'Z': z}
+    relative = False
+    shifted = set()  # axes whose current position already includes the offset
+
+    def shift(match):
+        value = match.group(2)
+        # At least the 0.01 mm the canvas jobs are written with
+        decimals = max(len(value.split('.')[1]) if '.' in value else 0, 2)
+        return f'{match.group(1)}{float(value) + offsets[match.group(1)]:.{decimals}f}'
+
+    for line in lines:
+        upper = line.upper()
+        tokens = upper.split()
+        if 'G90' in tokens:
+            relative = False
+        if 'G91' in tokens:
+            relative = True
+        if HOME_RE.match(upper):
+            shifted.clear()
+        if MOVE_RE.match(upper):
+            if relative:
+                axes = [axis for axis in 'XYZ' if offsets[axis] and axis not in shifted]
+                if axes:
+                    ending = '\n' if line.endswith('\n') else ''
+                    yield 'G0 ' + ' '.join(f'{axis}{offsets[axis]:.3f}' for axis in axes) + ending
+                shifted.update('XYZ')
+            else:
+                shifted.update(axis for axis, _ in COORDINATE_RE.findall(upper))
+                line = COORDINATE_RE.sub(shift, line)
+        yield line
+
+
+class FleetJob:
+    """ A drawing job queued on a Fleet
+    """
+
+    def __init__(self, commands, name=None, port=None):
+        """
+        Args:
+            commands (iterable of string, or callable returning one): the gcode of the job. A callable is only called
+                once an arm takes the job, so e.g. lambda: converter.iter_job_gcode(path) converts lazily
+            name (string): for logs and stats
+            port (string): run on this arm only, None for the first idle one
+        """
+        self.commands = commands
+        self.name = name
+        self.port = port
+        self.arm = None  # port of the arm that ran the job
+        self.result = None  # GcodeStreamer of the job
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        state = 'done' if self.done() else 'running' if self.started else 'queued'
+        return f'FleetJob({self.name!r}, {state}, arm={self.arm})'
+
+    @property
+    def queue_wait(self):
+        """
+        Seconds the job waited for an arm.
+        """
+        return (self.started if self.started is not None else time.monotonic()) - self.submitted
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, fn):
+        """
+        Call fn(job) once the job has finished (on the arm's sender thread), right away when it already has.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set_done(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish.
+
+        Returns:
+            the GcodeStreamer of the job, raising the job's error when it failed
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Job {self.name!r} did not finish in {timeout} s')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Fleet:
+    """ Runs drawing jobs on several Dexarms at once
+
+    Every arm has an ArmSession and a sender thread taking the next job from one shared queue as soon as the arm is
+    idle, so jobs run concurrently on as many arms as there are. Each arm's calibration offset is applied to the jobs
+    it draws. Utilization and queue wait are tracked per arm.
+    """
+
+    def __init__(self, ports, calibrations=None, arm_factory=Dexarm, session_options=None, stream_options=None):
+        """
+        Args:
+            ports (list of string): serial ports of the arms
+            calibrations (dict): port -> (x, y) or (x, y, z) offset in mm added to that arm's absolute moves
+            arm_factory (callable): creates the arm for a port, e.g. lib.sim_port.simulated_arm for testing
+            session_options (dict): ArmSession arguments
+            stream_options (dict): Dexarm.stream arguments, e.g. max_rate
+        """
+        self.calibrations = calibrations or {}
+        self.stream_options = stream_options or {}
+        self.sessions = {port: ArmSession(port, arm_factory=arm_factory, **(session_options or {})) for port in ports}
+        self.arm_stats = {port: {'jobs': 0, 'errors': 0, 'busy_seconds': 0.0, 'queue_wait_seconds': 0.0}
+                          for port in ports}
+        self.started = time.monotonic()
+        self._queue = deque()
+        self._running = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._run_arm, args=(port,), name=f'fleet {port}', daemon=True)
+                         for port in ports]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, commands, name=None, port=None):
+        """
+        Queue a job, see FleetJob.
+
+        Returns:
+            the FleetJob
+        """
+        if port is not None and port not in self.sessions:
+            raise ValueError(f'No arm on {port}, the fleet has {list(self.sessions)}')
+        job = FleetJob(commands, name=name, port=port)
+        with self._cond:
+            if self._closing:
+                raise RuntimeError('Fleet is closed')
+            self._queue.append(job)
+            self._cond.notify_all()
+        return job
+
+    def _take(self, port):
+        with self._cond:
+            while True:
+                for job in self._queue:
+                    if job.port is None or job.port == port:
+                        self._queue.remove(job)
+                        self._running += 1
+                        return job
+                if self._closing:
+                    return None
+                self._cond.wait()
+
+    def _run_arm(self, port):
+        session = self.sessions[port]
+        stats = self.arm_stats[port]
+        while (job := self._take(port)) is not None:
+            job.arm = port
+            job.started = time.monotonic()
+            try:
+                commands = job.commands() if callable(job.commands) else job.commands
+                if port in self.calibrations:
+                    commands = offset_gcode(commands, *self.calibrations[port])
+                job.result = session.stream(commands, **self.stream_options)
+            except Exception as error:
+                job.error = error
+                stats['errors'] += 1
+            job.finished = time.monotonic()
+            with self._cond:
+                stats['jobs'] += 1
+                stats['busy_seconds'] += job.finished - job.started
+                stats['queue_wait_seconds'] += job.started - job.submitted
+                self._running -= 1
+                self._cond.notify_all()
+            job._set_done()
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued job has finished.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._queue and not self._running, timeout):
+                raise TimeoutError(f'{len(self._queue) + self._running} jobs still unfinished')
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until an arm has no job to run, e.g. to hand the fleet jobs only as fast as it draws them.
+
+        Returns:
+            whether an arm is idle
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._running + len(self._queue) < len(self.sessions), timeout)
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def stats(self):
+        """
+        Per arm: jobs, errors, busy_seconds, utilization (busy share of the fleet's lifetime) and mean_queue_wait.
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._cond:
+            return {port: dict(stats, utilization=stats['busy_seconds'] / elapsed,
+                               mean_queue_wait=stats['queue_wait_seconds'] / stats['jobs'] if stats['jobs'] else 0.0)
+                    for port, stats in self.arm_stats.items()}
+
+    def close(self, cancel=False):
+        """
+        Stop the sender threads once the queue is drained (or drop the queued jobs with cancel) and release the
+        arms.
+        """
+        cancelled = []
+        with self._cond:
+            self._closing = True
+            if cancel:
+                cancelled, self._queue = list(self._queue), deque()
+            self._cond.notify_all()
+        for job in cancelled:
+            job.error = RuntimeError('Job cancelled, the fleet was closed')
+            job._set_done()
+        for thread in self._threads:
+            thread.join()
+        for session in self.sessions.values():
+            session.close()
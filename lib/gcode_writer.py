@@ -0,0 +1,135 @@
+import os
+import tempfile
+import numpy as np
+
+# Bulk gcode output. Coordinates are formatted a whole batch at a time (one % over a repeated line template, which runs
+# in C), lines are encoded into a large buffer and written with one writelines / sendall per buffer.
+
+BATCH_SIZE = 8192  # moves formatted per % call
+BUFFER_SIZE = 1 << 20  # bytes collected before they are written out
+
+# Read once, while importing is still single threaded, see process_umask
+_IMPORT_UMASK = os.umask(0)
+os.umask(_IMPORT_UMASK)
+
+
+#format_moves: One '<command> X.. Y..' line per point, at fixed precision, as a single string.
+def format_moves(command, points, precision=3):
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    template = f'{command} X%.{precision}f Y%.{precision}f\n'
+    return ''.join((template * len(chunk)) % tuple(chunk.ravel().tolist())
+                   for chunk in (pts[start:start + BATCH_SIZE] for start in range(0, len(pts), BATCH_SIZE)))
+
+
+#process_umask: The umask of the process. Reading it with os.umask means setting it, which would race with other
+# threads creating files, so it comes from /proc/self/status where there is one (Linux), else from the umask the
+# process had when this module was imported.
+def process_umask():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    return _IMPORT_UMASK
+
+
+#new_file_mode: Permissions of a newly created file under the process umask. mkstemp files are 0600, so files written
+# through a temporary file get these before they are renamed into place.
+def new_file_mode():
+    return 0o666 & ~process_umask()
+
+
+class GcodeWriter:
+
+    # target: a file path (written to a temporary file next to it and renamed into place on close, so readers never
+    # see half a job), a binary file-like object such as io.BytesIO, or a connected socket.
+    def __init__(self, target, precision=3, fsync=False):
+        self.precision = precision
+        self.fsync = fsync
+        self.bytes_written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._path = None
+        self._temp_path = None
+        if isinstance(target, (str, os.PathLike)):
+            self._path = os.fspath(target)
+            fd, self._temp_path = tempfile.mkstemp(
+                prefix=f'.{os.path.basename(self._path)}.', suffix='.tmp', dir=os.path.dirname(self._path) or '.')
+            os.chmod(self._temp_path, new_file_mode())
+            self._file = os.fdopen(fd, 'wb')
+            self._send = self._file.writelines
+        elif hasattr(target, 'sendall'):
+            self._file = None
+            self._send = lambda chunks: target.sendall(b''.join(chunks))
+        elif hasattr(target, 'write'):
+            self._file = None
+            self._send = target.writelines if hasattr(target, 'writelines') else lambda chunks: target.write(b''.join(chunks))
+        else:
+            raise TypeError(f'Cannot write gcode to {type(target).__name__}, use a path, a binary file or a socket')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _append(self, text):
+        data = text.encode('ascii')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= BUFFER_SIZE:
+            self.flush()
+
+    #write_lines: Gcode lines (with or without their newline), e.g. the output of svg_to_gcode / path_to_gcode.
+    def write_lines(self, lines):
+        batch = []
+        for line in lines:
+            batch.append(line if line.endswith('\n') else line + '\n')
+            if len(batch) >= BATCH_SIZE:
+                self._append(''.join(batch))
+                batch = []
+        if batch:
+            self._append(''.join(batch))
+
+    #write_moves: A (N,2) array of points as '<command> X.. Y..' lines, formatted at the writer's precision.
+    def write_moves(self, command, points):
+        self._append(format_moves(command, points, self.precision))
+
+    def flush(self):
+        if self._buffer:
+            self._send(self._buffer)
+            self.bytes_written += self._buffered
+            self._buffer = []
+            self._buffered = 0
+
+    #close: Flush, and for a path target move the finished file into place.
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            os.replace(self._temp_path, self._path)
+
+    #abort: Drop a partly written path target, leaving any previous file untouched.
+    def abort(self):
+        self._buffer = []
+        self._buffered = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._temp_path)
+
+
+#write_gcode: Write a whole job to a path, binary file or socket in one go. Returns the number of bytes written.
+def write_gcode(lines, target, precision=3):
+    with GcodeWriter(target, precision=precision) as writer:
+        writer.write_lines(lines)
+    return writer.bytes_written
@@ -0,0 +1,144 @@
+import mmap
+import os
+import struct
+import tempfile
+import numpy as np
+
+from .gcode_writer import new_file_mode
+from .toolpath import Toolpath
+
+# Compiled jobs: the bed toolpaths of a converted drawing, saved so it can be drawn again without parsing, flattening,
+# filling or ordering anything. The arrays are stored exactly as a Toolpath holds them, so replay memory maps the file
+# and hands views of the mapping to the gcode emitter; nothing is read or copied up front, large jobs start right
+# away and any number of sender processes replaying the same file share its pages through the OS cache.
+#
+# Layout (little endian, every section starting on an 8 byte boundary):
+#   header        magic, version, job kind, flags, group count, path count, vertex count
+#   bounds        min x, min y, max x, max y of all vertices (float64, bed mm)
+#   groups        group count + 1 int64 path offsets; a group is one toolpath of the conversion (e.g. one svg path)
+#   offsets       path count + 1 int64 vertex offsets
+#   flags         path count uint8 path flags
+#   coords        vertex count x 2 float64
+#   kinds, aux    vertex count uint8 move kinds and vertex count x 4 float64 curve parameters, with HAS_CURVES only
+
+MAGIC = b'SKBTJOB\0'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIQQQ')
+
+SVG_JOB = 0  # emitted like svg_to_gcode
+CANVAS_JOB = 1  # emitted like path_to_gcode
+
+HAS_CURVES = 1
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+class CompiledJob:
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f'{self.path} is not a compiled job')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.kind, flags, groups, paths, vertices = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f'{self.path} is not a compiled job')
+        if version != VERSION:
+            self._map.close()
+            raise ValueError(f'{self.path} is a version {version} job, only version {VERSION} can be read')
+
+        position = HEADER.size
+
+        def section(dtype, count, shape=None):
+            nonlocal position
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=position)
+            position += _padded(array.nbytes)
+            return array if shape is None else array.reshape(shape)
+
+        self.bounds = tuple(section('<f8', 4).tolist())
+        self.group_offsets = section('<i8', groups + 1)
+        offsets = section('<i8', paths + 1)
+        path_flags = section('u1', paths)
+        coords = section('<f8', 2 * vertices, (-1, 2))
+        kinds = aux = None
+        if flags & HAS_CURVES:
+            kinds = section('u1', vertices)
+            aux = section('<f8', 4 * vertices, (-1, 4))
+        if position > size:
+            self._map.close()
+            raise ValueError(f'{self.path} is truncated')
+        self.toolpath = Toolpath(coords, offsets, path_flags, kinds, aux)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.group_offsets) - 1
+
+    def __repr__(self):
+        return f'CompiledJob({self.path!r}, {len(self)} groups, {self.toolpath!r})'
+
+    #groups: The toolpath of every group, as views into the mapped file.
+    def groups(self):
+        starts = self.group_offsets[:-1].tolist()
+        stops = self.group_offsets[1:].tolist()
+        for start, stop in zip(starts, stops):
+            yield self.toolpath.paths(start, stop)
+
+    #close: Drop the job's arrays and unmap the file. Arrays still held elsewhere keep the mapping alive until they
+    # are garbage collected.
+    def close(self):
+        self.toolpath = None
+        self.group_offsets = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+
+#write_job: Save toolpaths (one group each) as a compiled job, written next to path and renamed into place so a sender
+# replaying the previous version never sees half a file. Returns the number of bytes written.
+def write_job(path, toolpaths, kind=SVG_JOB):
+    groups = [toolpath for toolpath in toolpaths]
+    toolpath = Toolpath.concatenate(groups)
+    group_offsets = np.concatenate([[0], np.cumsum([len(group) for group in groups], dtype=np.int64)])
+    flags = HAS_CURVES if toolpath.kinds is not None else 0
+    if toolpath.vertex_count:
+        bounds = np.concatenate([toolpath.coords.min(axis=0), toolpath.coords.max(axis=0)])
+    else:
+        bounds = np.zeros(4)
+
+    sections = [bounds.astype('<f8'), group_offsets.astype('<i8'), toolpath.offsets.astype('<i8'),
+                toolpath.flags.astype('u1'), toolpath.coords.astype('<f8')]
+    if flags & HAS_CURVES:
+        sections += [toolpath.kinds.astype('u1'), toolpath.aux.astype('<f8')]
+
+    path = os.fspath(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+                                     dir=os.path.dirname(path) or '.')
+    try:
+        os.chmod(temp_path, new_file_mode())
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, kind, flags, len(groups), len(toolpath), toolpath.vertex_count))
+            for array in sections:
+                data = np.ascontiguousarray(array).tobytes()
+                f.write(data)
+                f.write(bytes(_padded(len(data)) - len(data)))
+            written = f.tell()
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return written
+
+
+def read_job(path):
+    return CompiledJob(path)
@@ -0,0 +1,544 @@
+import functools
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .fleet import Fleet
+from .pydexarm import Dexarm
+from .svg_to_gcode import SVG_GCode
+
+QUEUE_CAPACITY = 64  # jobs converting or waiting for an arm before submit refuses more
+POLL_INTERVAL = 0.2  # seconds the dispatcher waits for an idle arm or a queued job before checking for shutdown
+
+# Job states
+CONVERTING = 'converting'
+QUEUED = 'queued'
+PLOTTING = 'plotting'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def compile_svg_job(svg_path, job_path, options):
+    """
+    Convert an svg file to a compiled job, in a worker process of the pipeline.
+    """
+    SVG_GCode(**options).compile_svg(svg_path, job_path)
+    return job_path
+
+
+def compile_paths_job(paths, job_path, options):
+    """
+    Convert canvas paths to a compiled job, in a worker process of the pipeline.
+    """
+    SVG_GCode(**options).compile_paths(paths, job_path)
+    return job_path
+
+
+def _remove_job_file(job_path):
+    # The sender and a cancelling pipeline may both get here
+    if job_path is not None:
+        try:
+            os.remove(job_path)
+        except FileNotFoundError:
+            pass
+
+
+class MemoryBackend:
+    """ Bounded priority queue of converted jobs inside this process
+
+    Higher priorities are taken first, equal priorities in submission order. Removed (cancelled) jobs are skipped.
+    Besides the queue it holds the state of every job that left it and the cancel marks, so pipelines of one process
+    can share a MemoryBackend and draw each other's jobs.
+    """
+
+    def __init__(self, capacity=QUEUE_CAPACITY):
+        self.capacity = capacity
+        self._heap = []
+        self._payloads = {}
+        self._states = {}
+        self._cancelled = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def put(self, job_id, priority, payload):
+        with self._cond:
+            if len(self._payloads) >= self.capacity:
+                raise queue.Full(f'Job queue is full ({self.capacity} jobs)')
+            self._payloads[job_id] = payload
+            heapq.heappush(self._heap, (-priority, next(self._seq), job_id))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        The (job id, payload) of the next job, None when there was none within timeout.
+        """
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    if job_id in self._payloads:
+                        return job_id, self._payloads.pop(job_id)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def remove(self, job_id):
+        """
+        Take a job out of the queue, whether it was still in there.
+        """
+        with self._cond:
+            return self._payloads.pop(job_id, None) is not None
+
+    def set_state(self, job_id, state):
+        with self._cond:
+            self._states[job_id] = dict(state)
+
+    def state(self, job_id):
+        """
+        The last state dict (status, arm, result, error) set for a job, None when there is none.
+        """
+        with self._cond:
+            state = self._states.get(job_id)
+            return dict(state) if state is not None else None
+
+    def cancel(self, job_id):
+        with self._cond:
+            self._cancelled.add(job_id)
+
+    def cancelled(self, job_id):
+        with self._cond:
+            return job_id in self._cancelled
+
+    def forget(self, job_id):
+        """
+        Drop the state and cancel mark of a finished job.
+        """
+        with self._cond:
+            self._states.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+
+class RedisBackend:
+    """ Bounded priority queue of converted jobs in Redis
+
+    Jobs are members of a sorted set (score from priority and a sequence number) with their payload in a hash. Job
+    states and cancel marks live in Redis as well, so pipelines in other processes or on other machines sharing the
+    backend take each other's jobs and the submitting pipeline still learns how its jobs ended. Works with any redis-py
+    compatible client, e.g. fakeredis.FakeRedis in tests.
+    """
+
+    def __init__(self, client, name='sketchbot', capacity=QUEUE_CAPACITY):
+        """
+        Args:
+            client: a redis.Redis (or compatible) client
+            name (string): prefix of the keys used
+            capacity (int): jobs the queue holds before put refuses more
+        """
+        self.client = client
+        self.capacity = capacity
+        self.queue_key = f'{name}:queue'
+        self.payload_key = f'{name}:payloads'
+        self.state_key = f'{name}:states'
+        self.cancelled_key = f'{name}:cancelled'
+        self.seq_key = f'{name}:seq'
+
+    @classmethod
+    def from_url(cls, url, **options):
+        import redis
+        return cls(redis.Redis.from_url(url), **options)
+
+    def __len__(self):
+        return self.client.zcard(self.queue_key)
+
+    def put(self, job_id, priority, payload):
+        from redis.exceptions import WatchError
+        # Lower scores are popped first: priority first, then submission order
+        score = -priority * 2 ** 32 + self.client.incr(self.seq_key)
+        with self.client.pipeline() as transaction:
+            while True:
+                # The job is only added if the queue didn't change since its length was checked, otherwise retried
+                try:
+                    transaction.watch(self.queue_key)
+                    if transaction.zcard(self.queue_key) >= self.capacity:
+                        raise queue.Full(f'Job queue is full ({self.capacity} jobs)')
+                    transaction.multi()
+                    transaction.hset(self.payload_key, job_id, json.dumps(payload))
+                    transaction.zadd(self.queue_key, {job_id: score})
+                    transaction.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def get(self, timeout=None):
+        popped = self.client.bzpopmin(self.queue_key, timeout=0 if timeout is None else max(timeout, 0.01))
+        if popped is None:
+            return None
+        job_id = popped[1].decode() if isinstance(popped[1], bytes) else popped[1]
+        transaction = self.client.pipeline()
+        transaction.hget(self.payload_key, job_id)
+        transaction.hdel(self.payload_key, job_id)
+        payload, _ = transaction.execute()
+        if payload is None:
+            return None
+        return job_id, json.loads(payload)
+
+    def remove(self, job_id):
+        if not self.client.zrem(self.queue_key, job_id):
+            return False
+        self.client.hdel(self.payload_key, job_id)
+        return True
+
+    def set_state(self, job_id, state):
+        self.client.hset(self.state_key, job_id, json.dumps(state))
+
+    def state(self, job_id):
+        state = self.client.hget(self.state_key, job_id)
+        return json.loads(state) if state is not None else None
+
+    def cancel(self, job_id):
+        self.client.sadd(self.cancelled_key, job_id)
+
+    def cancelled(self, job_id):
+        return bool(self.client.sismember(self.cancelled_key, job_id))
+
+    def forget(self, job_id):
+        transaction = self.client.pipeline()
+        transaction.hdel(self.state_key, job_id)
+        transaction.srem(self.cancelled_key, job_id)
+        transaction.execute()
+
+
+class PipelineJob:
+    """ A drawing job going through a JobPipeline
+    """
+
+    def __init__(self, job_id, kind, priority, options):
+        self.id = job_id
+        self.kind = kind  # 'svg' or 'paths'
+        self.priority = priority
+        self.options = options  # SVG_GCode arguments
+        self.status = CONVERTING
+        self.job_path = None
+        self.arm = None  # port of the arm that drew the job
+        self.result = None  # GcodeStreamer.stats() of the plot
+        self.error = None
+        self.future = None
+        self.submitted = time.monotonic()
+        self.converted = None
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return f'PipelineJob({self.id!r}, {self.status}, arm={self.arm})'
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the job is drawn, failed or cancelled.
+
+        Returns:
+            the GcodeStreamer.stats() of the plot, raising the job's error when it failed or was cancelled
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Job {self.id} did not finish in {timeout} s')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class JobPipeline:
+    """ Converts and draws jobs off the request thread
+
+    Conversion (SVG_GCode) runs in a process pool and produces compiled jobs (see job_file). Converted jobs wait in a
+    bounded priority queue (MemoryBackend, or RedisBackend to share it between processes) until one of the arms of the
+    pipeline's Fleet is idle; a dispatcher thread then hands the next one to the fleet, which streams it over that arm's
+    ArmSession with the arm's calibration. Jobs can be cancelled in every stage.
+
+    The queue entries carry everything an arm needs (job file and converter options), and the job's state is reported
+    to the backend, so pipelines sharing a backend draw each other's jobs; a watcher thread passes the states of jobs
+    drawn elsewhere on to this pipeline's PipelineJobs. Pipelines on different machines need a job_dir they all reach.
+    """
+
+    def __init__(self, ports, converter_options=None, backend=None, workers=None, capacity=QUEUE_CAPACITY,
+                 arm_factory=Dexarm, calibrations=None, stream_options=None, job_dir=None):
+        """
+        Args:
+            ports (list of string): serial ports of the arms
+            converter_options (dict): default SVG_GCode arguments of the jobs, json serializable for a RedisBackend
+            backend: queue of converted jobs, a MemoryBackend of the given capacity by default
+            workers (int): conversion processes, one per cpu by default
+            capacity (int): jobs converting or queued before submit refuses more (queue.Full)
+            arm_factory (callable): creates the arm for a port, e.g. lib.sim_port.simulated_arm for testing
+            calibrations (dict): port -> (x, y) or (x, y, z) offset in mm, see offset_gcode
+            stream_options (dict): Dexarm.stream arguments, e.g. max_rate
+            job_dir (string): where compiled jobs are kept until drawn, a temporary directory by default
+        """
+        self.converter_options = converter_options or {}
+        self.backend = backend if backend is not None else MemoryBackend(capacity)
+        self.capacity = capacity
+        self._temp_dir = tempfile.TemporaryDirectory(prefix='sketchbot-jobs-') if job_dir is None else None
+        self.job_dir = job_dir if job_dir is not None else self._temp_dir.name
+        self.jobs = {}
+        self.fleet = Fleet(ports, calibrations=calibrations, arm_factory=arm_factory, stream_options=stream_options)
+        # spawn: forking would copy the pipeline's threads' locks, e.g. a held one of the arms' serial sessions
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.RLock()  # reentrant: cancelling a future runs its done callback right away
+        self._closing = threading.Event()
+        self._cancelling = set()  # ids of jobs cancelled after they left the queue
+        self._plotting = {}  # job id -> FleetJob of the jobs this pipeline handed to its fleet
+        self._threads = [threading.Thread(target=self._run_dispatcher, name='pipeline dispatcher', daemon=True),
+                         threading.Thread(target=self._run_watcher, name='pipeline watcher', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _converting(self):
+        return sum(job.status == CONVERTING for job in self.jobs.values())
+
+    def _submit(self, kind, convert, source, priority, options):
+        with self._lock:
+            if self._closing.is_set():
+                raise RuntimeError('Pipeline is closed')
+            if self._converting() + len(self.backend) >= self.capacity:
+                raise queue.Full(f'Job pipeline is full ({self.capacity} jobs)')
+            job = PipelineJob(uuid.uuid4().hex, kind, priority, dict(self.converter_options, **(options or {})))
+            job.job_path = os.path.join(self.job_dir, f'{job.id}.job')
+            self.jobs[job.id] = job
+            job.future = self._pool.submit(convert, source, job.job_path, job.options)
+        job.future.add_done_callback(lambda future: self._converted(job, future))
+        return job
+
+    def submit_svg(self, svg_path, priority=0, options=None):
+        """
+        Queue an svg file for conversion and drawing.
+
+        Args:
+            svg_path (string): the svg file
+            priority (int): higher priorities are drawn first
+            options (dict): SVG_GCode arguments overriding converter_options
+
+        Returns:
+            the PipelineJob
+        """
+        return self._submit('svg', compile_svg_job, svg_path, priority, options)
+
+    def submit_paths(self, paths, priority=0, options=None):
+        """
+        Queue canvas paths (see SVG_GCode.path_to_gcode) for conversion and drawing, see submit_svg.
+        """
+        return self._submit('paths', compile_paths_job, paths, priority, options)
+
+    def _converted(self, job, future):
+        with self._lock:
+            if job.status != CONVERTING:
+                # Cancelled while it was being converted
+                _remove_job_file(job.job_path)
+                return
+            job.converted = time.monotonic()
+            if future.cancelled():
+                self._finish(job, CANCELLED, RuntimeError(f'Job {job.id} was cancelled'))
+                return
+            if future.exception() is not None:
+                self._finish(job, FAILED, future.exception())
+                return
+            try:
+                payload = {'job_path': job.job_path, 'options': job.options}
+                self.backend.set_state(job.id, {'status': QUEUED})
+                job.status = QUEUED
+                self.backend.put(job.id, job.priority, payload)
+            except Exception as error:
+                self._finish(job, FAILED, error)
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        _remove_job_file(job.job_path)
+        self.backend.forget(job.id)
+        self._cancelling.discard(job.id)
+        job._done.set()
+
+    def _update(self, job, state, error=None):
+        """
+        Take over the state reported for a job of this pipeline.
+        """
+        with self._lock:
+            if job.done():
+                return
+            status = state['status']
+            job.arm = state.get('arm', job.arm)
+            if status == PLOTTING and job.status == QUEUED:
+                job.status = PLOTTING
+                job.started = time.monotonic()
+            elif status in (DONE, FAILED, CANCELLED):
+                job.started = job.started if job.started is not None else time.monotonic()
+                job.result = state.get('result')
+                if error is None and status == FAILED:
+                    error = RuntimeError(state.get('error'))
+                if error is None and status == CANCELLED:
+                    error = RuntimeError(f'Job {job.id} was cancelled')
+                self._finish(job, status, error)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: before conversion it is never converted, when queued it is dropped, while plotting no further
+        lines are sent (the moves already sent to the arm still finish).
+
+        Returns:
+            whether the job was still pending
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.done():
+                return False
+            if job.status == CONVERTING:
+                # A conversion that already started runs to its end, its job file is dropped then
+                job.status = CANCELLED
+                job.future.cancel()
+                self._finish(job, CANCELLED, RuntimeError(f'Job {job.id} was cancelled'))
+            elif job.status == QUEUED and self.backend.remove(job.id):
+                self._finish(job, CANCELLED, RuntimeError(f'Job {job.id} was cancelled'))
+            else:
+                # An arm has it: it stops at its next check and the job is reported cancelled
+                self._cancelling.add(job.id)
+                self.backend.cancel(job.id)
+            return True
+
+    def status(self, job_id):
+        return self.jobs[job_id].status
+
+    def _report(self, job_id, state, error=None):
+        self.backend.set_state(job_id, state)
+        job = self.jobs.get(job_id)
+        if job is not None:
+            self._update(job, state, error)
+
+    def _cancelled(self, job_id):
+        return job_id in self._cancelling or self.backend.cancelled(job_id)
+
+    def _lines(self, job_id, payload):
+        """
+        The gcode of a queued job, read once the fleet's arm starts drawing it. Cancels of this pipeline are seen at
+        the next line, the backend (another pipeline's) is asked every POLL_INTERVAL.
+        """
+        with self._lock:
+            # Held by the dispatcher until the FleetJob is recorded
+            arm = self._plotting[job_id].arm
+        if self._cancelled(job_id):
+            return
+        self._report(job_id, {'status': PLOTTING, 'arm': arm})
+        next_check = time.monotonic() + POLL_INTERVAL
+        for line in SVG_GCode(**payload['options']).iter_job_gcode(payload['job_path']):
+            if job_id in self._cancelling:
+                return
+            if time.monotonic() >= next_check:
+                if self.backend.cancelled(job_id):
+                    return
+                next_check = time.monotonic() + POLL_INTERVAL
+            yield line
+
+    def _plotted(self, job_id, payload, fleet_job):
+        _remove_job_file(payload['job_path'])
+        if fleet_job.error is not None:
+            error = fleet_job.error
+            state = {'status': FAILED, 'arm': fleet_job.arm, 'error': f'{type(error).__name__}: {error}'}
+        else:
+            error = None
+            status = CANCELLED if self._cancelled(job_id) else DONE
+            state = {'status': status, 'arm': fleet_job.arm, 'result': fleet_job.result.stats()}
+        self._report(job_id, state, error)
+        with self._lock:
+            del self._plotting[job_id]
+
+    def _run_dispatcher(self):
+        # Jobs are only taken off the (possibly shared) queue when an arm is free to draw them
+        while not self._closing.is_set():
+            if not self.fleet.wait_idle(POLL_INTERVAL):
+                continue
+            taken = self.backend.get(timeout=POLL_INTERVAL)
+            if taken is None:
+                continue
+            job_id, payload = taken
+            if self.backend.cancelled(job_id):
+                _remove_job_file(payload['job_path'])
+                self._report(job_id, {'status': CANCELLED})
+                continue
+            with self._lock:
+                fleet_job = self.fleet.submit(functools.partial(self._lines, job_id, payload), name=job_id)
+                self._plotting[job_id] = fleet_job
+            fleet_job.add_done_callback(functools.partial(self._plotted, job_id, payload))
+
+    def _run_watcher(self):
+        # Jobs of this pipeline drawn by another one sharing the backend
+        while not self._closing.wait(POLL_INTERVAL):
+            with self._lock:
+                waiting = [job for job in self.jobs.values()
+                           if job.status in (QUEUED, PLOTTING) and job.id not in self._plotting]
+            for job in waiting:
+                state = self.backend.state(job.id)
+                if state is not None and state['status'] != job.status:
+                    self._update(job, state)
+
+    def stats(self):
+        """
+        Number of jobs per state, and mean seconds spent converting, queued and plotting by the finished jobs. The
+        Fleet.stats of the pipeline's arms are under 'arms'.
+        """
+        with self._lock:
+            jobs = list(self.jobs.values())
+        counts = {state: sum(job.status == state for job in jobs)
+                  for state in (CONVERTING, QUEUED, PLOTTING, DONE, FAILED, CANCELLED)}
+        drawn = [job for job in jobs if job.status == DONE]
+
+        def mean(values):
+            return sum(values) / len(values) if values else 0.0
+
+        return dict(counts,
+                    mean_convert_seconds=mean([job.converted - job.submitted for job in drawn]),
+                    mean_queue_seconds=mean([job.started - job.converted for job in drawn]),
+                    mean_plot_seconds=mean([job.finished - job.started for job in drawn]),
+                    arms=self.fleet.stats())
+
+    def close(self, cancel=False, timeout=None):
+        """
+        Wait for the submitted jobs to be drawn (or cancel them) and shut down the workers, dispatcher and arms.
+        Raises TimeoutError, leaving the pipeline running, when the jobs don't finish within timeout seconds.
+        """
+        if cancel:
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in list(self.jobs.values()):
+            if not job._done.wait(None if deadline is None else max(deadline - time.monotonic(), 0)):
+                unfinished = sum(not job.done() for job in self.jobs.values())
+                raise TimeoutError(f'{unfinished} jobs still unfinished')
+        self._closing.set()
+        for thread in self._threads:
+            thread.join()
+        self.fleet.close()
+        self._pool.shutdown(cancel_futures=True)
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
@@ -1,15 +1,205 @@
 import serial
 import re
+import time
+
+from collections import deque
+
+RX_BUFFER_SIZE = 128  # bytes of the firmware's serial receive buffer (Marlin RX_BUFFER_SIZE)
+MAX_IN_FLIGHT = 4  # commands the firmware queues before it stops answering ok (Marlin BUFSIZE)
+
+ADVANCED_OK_RE = re.compile(r'\bP(\d+)\s+B(\d+)')
+
+
+def response_kind(response):
+    """
+    What a response line of the arm is.
+
+    Returns:
+        'ok', 'busy' (keepalive while a long command runs), 'error' or 'info' (anything else, e.g. the M114 position)
+    """
+    if response.startswith('ok'):
+        return 'ok'
+    if 'busy' in response:
+        return 'busy'
+    if response.lower().startswith('error') or response.startswith('Resend') or 'Unknown command' in response:
+        return 'error'
+    return 'info'
+
+
+class DexarmError(Exception):
+    """ Error reported by the arm for a streamed command
+    """
+
+    def __init__(self, command, message):
+        super().__init__(f'{command.strip()!r}: {message.strip()}')
+        self.command = command
+        self.message = message
+
+
+class GcodeStreamer:
+    """ Pipelined gcode sender for an open Dexarm serial port
+
+    Instead of waiting for the "ok" of every command, commands are written as long as the bytes and commands not yet
+    acknowledged fit the firmware's receive buffer and command queue, so the planner always has the next moves when it
+    finishes one. Acks arrive in order, so each "ok" belongs to the oldest outstanding command. When the firmware
+    reports its free planner / queue slots with the ok (Marlin ADVANCED_OK), no more commands than it has room for are
+    kept in flight.
+    """
+
+    def __init__(self, ser, rx_buffer_size=RX_BUFFER_SIZE, max_in_flight=MAX_IN_FLIGHT, raise_errors=True,
+                 max_rate=None, verbose=False):
+        """
+        Args:
+            ser (serial.Serial): the open serial port of the arm
+            rx_buffer_size (int): bytes of unacknowledged commands the firmware can hold
+            max_in_flight (int): commands sent but not acknowledged yet
+            raise_errors (bool): raise DexarmError when the arm reports an error, otherwise only collect it in errors
+            max_rate (float): send at most this many commands per second (for pens that need it), None for no cap
+            verbose (bool): print the responses other than ok / busy
+        """
+        self.ser = ser
+        self.rx_buffer_size = rx_buffer_size
+        self.max_in_flight = max_in_flight
+        self.raise_errors = raise_errors
+        self.max_rate = max_rate
+        self.verbose = verbose
+        self.pending = deque()  # (command, bytes) of every command waiting for its ok, oldest first
+        self.pending_bytes = 0
+        self.queue_free = None  # free command slots of the last advanced ok
+        self.planner_free = None  # free planner blocks of the last advanced ok
+        self.pending_at_ack = 0  # commands still outstanding when the last advanced ok arrived
+        self.errors = []  # (command, message) of every error reported
+        self.sent = 0
+        self.acked = 0
+        self.bytes_sent = 0
+        self.busy_count = 0
+        self.started = None
+        self.last_ack = None
+
+    def _has_room(self, size):
+        if not self.pending:
+            return True
+        window = self.max_in_flight
+        if self.queue_free is not None:
+            # The free slots were counted with pending_at_ack commands outstanding, anything sent since uses them up.
+            # A move needs a planner block as well as a queue slot, so a full planner holds back further commands.
+            window = min(window, self.pending_at_ack + min(self.queue_free, self.planner_free))
+        return len(self.pending) < window and self.pending_bytes + size <= self.rx_buffer_size
+
+    def send(self, command):
+        """
+        Queue a command, blocking only while the arm has no room for it.
+
+        Args:
+            command (string): one gcode line, with or without its line ending. Blank lines and comments are skipped.
+        """
+        command = command.split(';', 1)[0].strip()
+        if not command:
+            return
+        data = (command + '\r').encode()
+        if len(data) > self.rx_buffer_size:
+            raise ValueError(f'Command of {len(data)} bytes does not fit the {self.rx_buffer_size} byte receive buffer')
+        while not self._has_room(len(data)):
+            self.read_response()
+        if self.max_rate and self.started is not None:
+            delay = self.started + self.sent / self.max_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.ser.write(data)
+        self.pending.append((command, len(data)))
+        self.pending_bytes += len(data)
+        self.sent += 1
+        self.bytes_sent += len(data)
+
+    def send_all(self, commands):
+        """
+        Stream commands and wait until the arm acknowledged the last one.
+
+        Returns:
+            the streamer, for its statistics
+        """
+        for command in commands:
+            self.send(command)
+        self.flush()
+        return self
+
+    def flush(self):
+        """
+        Wait for the ok of every outstanding command.
+        """
+        while self.pending:
+            self.read_response()
+
+    def read_response(self):
+        """
+        Read and handle one response line of the arm.
+        """
+        response = self.ser.readline().decode('utf-8', errors='replace').strip()
+        if not response:
+            if self.pending:
+                raise TimeoutError(f'No response from the arm for {self.pending[0][0]!r}')
+            return
+        kind = response_kind(response)
+        if kind == 'ok':
+            self._ack(response)
+        elif kind == 'busy':
+            # The arm is still working on a long move, the outstanding commands are fine
+            self.busy_count += 1
+        elif kind == 'error':
+            command = self.pending[0][0] if self.pending else ''
+            self.errors.append((command, response))
+            if self.raise_errors:
+                raise DexarmError(command, response)
+        elif self.verbose:
+            print("read：", response)
+
+    def _ack(self, response):
+        if not self.pending:
+            return
+        _, size = self.pending.popleft()
+        self.pending_bytes -= size
+        self.acked += 1
+        self.last_ack = time.perf_counter()
+        advanced = ADVANCED_OK_RE.search(response)
+        if advanced:
+            self.planner_free, self.queue_free = int(advanced.group(1)), int(advanced.group(2))
+            self.pending_at_ack = len(self.pending)
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    @property
+    def commands_per_second(self):
+        """
+        Acknowledged commands per second since the first command was sent.
+        """
+        if self.started is None or self.last_ack is None or self.last_ack <= self.started:
+            return 0.0
+        return self.acked / (self.last_ack - self.started)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'acked': self.acked,
+            'bytes_sent': self.bytes_sent,
+            'errors': len(self.errors),
+            'busy': self.busy_count,
+            'commands_per_second': self.commands_per_second,
+        }
 
 
 class Dexarm:
     """ Python class for Dexarm
     """
 
-    def __init__(self, port):
+    def __init__(self, port, ser=None):
         """
         Args:
             port (string): the serial port of Dexarm, e.g, "COM3"
+            ser (serial.Serial): an already open port (or lib.sim_port.SimulatedPort) to use instead of opening port
         """
         """
         # This is the original implementation, commented out for test
@@ -24,12 +214,15 @@ class Dexarm:
 
         """
 
-        self.ser = serial.Serial(port=port,
-                                 baudrate=115200,
-                                 parity=serial.PARITY_NONE,
-                                 stopbits=serial.STOPBITS_ONE,
-                                 bytesize=serial.EIGHTBITS,
-                                 timeout=3000)
+        if ser is not None:
+            self.ser = ser
+        else:
+            self.ser = serial.Serial(port=port,
+                                     baudrate=115200,
+                                     parity=serial.PARITY_NONE,
+                                     stopbits=serial.STOPBITS_ONE,
+                                     bytesize=serial.EIGHTBITS,
+                                     timeout=3000)
 
         self.is_open = self.ser.isOpen()
 
@@ -61,6 +254,32 @@ class Dexarm:
                 else:
                     print("read：", serial_str)
 
+    def streamer(self, rx_buffer_size=RX_BUFFER_SIZE, max_in_flight=MAX_IN_FLIGHT, raise_errors=True, max_rate=None):
+        """
+        Pipelined sender on this arm's port, see GcodeStreamer. Don't mix it with the other commands until it is
+        flushed, they would read its acks.
+        """
+        self.ser.reset_input_buffer()
+        return GcodeStreamer(self.ser, rx_buffer_size=rx_buffer_size, max_in_flight=max_in_flight,
+                             raise_errors=raise_errors, max_rate=max_rate)
+
+    def stream(self, commands, rx_buffer_size=RX_BUFFER_SIZE, max_in_flight=MAX_IN_FLIGHT, raise_errors=True,
+               max_rate=None):
+        """
+        Send many commands (e.g. a gcode job) keeping several in flight instead of waiting for every ok.
+
+        Args:
+            commands (iterable of string): gcode lines
+            rx_buffer_size (int): bytes of unacknowledged commands the arm can hold
+            max_in_flight (int): commands sent but not acknowledged yet
+            raise_errors (bool): stop with DexarmError on the first error the arm reports
+            max_rate (float): send at most this many commands per second, None for no cap
+
+        Returns:
+            the GcodeStreamer, with the errors and statistics (commands_per_second) of the job
+        """
+        return self.streamer(rx_buffer_size, max_in_flight, raise_errors, max_rate).send_all(commands)
+
     def go_home(self):
         """
         Go to home position and enable the motors. Should be called each time when power on.
@@ -1,6 +1,5 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from more_itertools import windowed
 
 T = np.array([[0, -1], [1, 0]])
 
@@ -50,52 +49,226 @@ def np_seg_intersect(a, b, considerCollinearOverlapAsIntersect = False):
     return None
 
 
-def cast_rays(segarr, coords, ray_distance = 2, debug =False):
+#scanline_hatches: All hatch segments of a shape in one go, as a (K,2,2) array plus the ray index of every hatch.
+# Instead of intersecting every ray with every segment, an edge table maps each segment to the range of rays its
+# y-extent spans (searchsorted on the sorted ray positions), and only those (ray, segment) pairs are intersected,
+# all at once, with the same arithmetic as np_seg_intersect. Intersections are then sorted per ray and paired up.
+def scanline_hatches(segarr, coords, ray_distance = 2):
+    segarr = np.asarray(segarr, dtype=float).reshape(-1, 2, 2)
+    coords = np.asarray(coords, dtype=float)
 
     # create rays through the complete shape
     minx = coords[:,0].min()
     maxx = coords[:,0].max()
     miny = coords[:,1].min()
     maxy = coords[:,1].max()
+    ray_ys = np.arange(miny, maxy, ray_distance)
+
+    empty = np.empty((0, 2, 2)), np.empty(0, dtype=np.intp)
+    if len(ray_ys) == 0 or len(segarr) == 0:
+        return empty
+
+    # Edge table: the rays every segment can cross (with some slack, the exact test follows)
+    seg_ymin = segarr[:, :, 1].min(axis=1)
+    seg_ymax = segarr[:, :, 1].max(axis=1)
+    slack = 1e-9 * max(1.0, abs(maxy - miny))
+    first = np.searchsorted(ray_ys, seg_ymin - slack, side='left')
+    last = np.searchsorted(ray_ys, seg_ymax + slack, side='right')
+    spans = np.maximum(last - first, 0)
+    seg_idx = np.repeat(np.arange(len(segarr)), spans)
+    if len(seg_idx) == 0:
+        return empty
+    ray_idx = np.arange(len(seg_idx)) - np.repeat(np.cumsum(spans) - spans, spans) + np.repeat(first, spans)
+
+    # np_seg_intersect(segment, ray), vectorized over the candidate pairs
+    a0 = segarr[seg_idx, 0]
+    r = segarr[seg_idx, 1] - a0
+    s0 = maxx - minx
+    v0 = minx - a0[:, 0]
+    v1 = ray_ys[ray_idx] - a0[:, 1]
+    num = v0 * -r[:, 1] + v1 * r[:, 0]
+    denom = r[:, 0] * -0.0 + r[:, 1] * s0
+    hit = ~np.isclose(denom, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = num / denom
+        t = (v0 * -0.0 + v1 * s0) / denom
+    hit &= (u >= 0) & (u <= 1) & (t >= 0) & (t <= 1)
+    xs = minx + s0 * u[hit]
+    rays = ray_idx[hit]
+
+    # Order the coordinates on the x axis, per ray
+    order = np.lexsort((xs, rays))
+    xs, rays = xs[order], rays[order]
+    group_start = np.searchsorted(rays, rays, side='left')
+    group_end = np.searchsorted(rays, rays, side='right')
+    rank = np.arange(len(rays)) - group_start
+    # Every other window of two consecutive intersections is inside the shape
+    pair = (rank % 2 == 0) & (np.arange(len(rays)) + 1 < group_end)
+    starts = np.flatnonzero(pair)
+    s, e, pair_rays = xs[starts], xs[starts + 1], rays[starts]
+    # Overlap: skip a hatch identical to the previous one on the same ray
+    keep = np.ones(len(starts), dtype=bool)
+    keep[1:] = ~((pair_rays[1:] == pair_rays[:-1]) & (s[1:] == s[:-1]) & (e[1:] == e[:-1]))
+    s, e, pair_rays = s[keep], e[keep], pair_rays[keep]
 
+    ys = ray_ys[pair_rays]
+    hatches = np.stack([np.stack([s, ys], axis=1), np.stack([e, ys], axis=1)], axis=1)
+    return hatches, pair_rays
 
-    for y_ray in np.arange(miny,maxy,ray_distance):
 
-        rays = np.array([[[ minx ,  y_ray ],
-            [ maxx ,  y_ray  ]]])
+def cast_rays(segarr, coords, ray_distance = 2, debug =False):
+    hatches, _ = scanline_hatches(segarr, coords, ray_distance)
+
+    if debug:
+        minx = coords[:,0].min()
+        maxx = coords[:,0].max()
+        for y_ray in np.arange(coords[:,1].min(), coords[:,1].max(), ray_distance):
+            plt.plot([minx, maxx], [y_ray, y_ray], c='r', alpha=0.1)
 
+    for (s, y_ray), (e, _) in hatches:
         if debug:
-            plt.plot(rays[:,:,0].flatten(),rays[:,:,1].flatten(),c='r',alpha=0.1)
-
-        intersection_coords = []
-        for i in range(segarr.shape[0]):
-            intersect = np_seg_intersect(segarr[i,:,:], rays[0,:])
-            #if debug:
-            #    print(intersect)
-            if intersect is None:
-                #plt.plot(segarr[i,:,0], segarr[i,:,1],c='grey')
-                pass
+            plt.plot([s,e],[y_ray,y_ray],c='k',alpha=0.2)
+        yield ([s,y_ray],[e,y_ray])
+
+
+#connectors_inside: For every connector from starts[i] to ends[i], whether it stays inside the shape: it must not cross
+# the outline (touching it at its own endpoints, which are hatch ends on the outline, is fine) and its midpoint must be
+# inside (even-odd) or on the outline.
+def connectors_inside(segarr, starts, ends, eps=1e-6):
+    segarr = np.asarray(segarr, dtype=float).reshape(-1, 2, 2)
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    if len(segarr) == 0:
+        return np.zeros(len(starts), dtype=bool)
+
+    a0 = segarr[None, :, 0]
+    r = segarr[None, :, 1] - a0
+    d = (ends - starts)[:, None, :]
+    w = a0 - starts[:, None, :]
+    denom = d[..., 0] * r[..., 1] - d[..., 1] * r[..., 0]
+    scale = np.hypot(d[..., 0], d[..., 1]) * np.hypot(r[..., 0], r[..., 1])
+    parallel = np.abs(denom) <= 1e-12 * scale
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = (w[..., 0] * r[..., 1] - w[..., 1] * r[..., 0]) / denom
+        t = (w[..., 0] * d[..., 1] - w[..., 1] * d[..., 0]) / denom
+    crossing = ~parallel & (u > eps) & (u < 1 - eps) & (t >= -eps) & (t <= 1 + eps)
+
+    mid = (starts + ends) / 2
+    mx, my = mid[:, None, 0], mid[:, None, 1]
+    x0, y0 = segarr[None, :, 0, 0], segarr[None, :, 0, 1]
+    x1, y1 = segarr[None, :, 1, 0], segarr[None, :, 1, 1]
+    straddle = (y0 > my) != (y1 > my)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at = x0 + (my - y0) * (x1 - x0) / (y1 - y0)
+    inside = np.count_nonzero(straddle & (x_at > mx), axis=1) % 2 == 1
+
+    # Distance of the midpoint to the outline, for connectors running along it
+    length2 = r[..., 0] ** 2 + r[..., 1] ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.clip(((mx - x0) * r[..., 0] + (my - y0) * r[..., 1]) / length2, 0, 1)
+    k = np.where(length2 > 0, k, 0)
+    dist = np.hypot(x0 + k * r[..., 0] - mx, y0 + k * r[..., 1] - my).min(axis=1)
+    extent = np.ptp(segarr.reshape(-1, 2), axis=0).max()
+    on_edge = dist <= eps * max(extent, 1.0)
+
+    return ~crossing.any(axis=1) & (inside | on_edge)
+
+
+#serpentine_fill: Boustrophedon fill. Hatches run left to right on even rays and right to left on odd rays, and a
+# hatch is joined to an overlapping hatch on the next ray when the connecting move stays inside the shape, so a region
+# is filled in one pen down. Returns a list of (N,2) polylines; with serpentine=False every hatch is its own polyline,
+# drawn left to right like cast_rays. Hatches shorter than min_length are dropped, and so are the zero length ones of
+# rays through a vertex where the outline turns back, which would only split the chains.
+def serpentine_fill(segarr, coords, ray_distance = 2, serpentine = True, min_length = 0):
+    segarr = np.asarray(segarr, dtype=float).reshape(-1, 2, 2)
+    hatches, rays = scanline_hatches(segarr, coords, ray_distance)
+    if len(hatches):
+        length = hatches[:, 1, 0] - hatches[:, 0, 0]
+        long_enough = (length >= min_length) & (length > 1e-9 * max(np.ptp(np.asarray(coords)[:, 0]), 1.0))
+        hatches, rays = hatches[long_enough], rays[long_enough]
+    if not serpentine or len(hatches) == 0:
+        return list(hatches)
+
+    hatches = np.where((rays % 2 == 1)[:, None, None], hatches[:, ::-1], hatches)
+    lo = hatches[:, :, 0].min(axis=1)
+    hi = hatches[:, :, 0].max(axis=1)
+    seg_ymin = segarr[:, :, 1].min(axis=1)
+    seg_ymax = segarr[:, :, 1].max(axis=1)
+    bounds = np.searchsorted(rays, np.arange(rays[-1] + 2))
+
+    chain_of = np.empty(len(hatches), dtype=np.intp)
+    chains = []
+    for k in range(rays[0], rays[-1] + 1):
+        cur = np.arange(bounds[k], bounds[k + 1])
+        prev = np.arange(bounds[k - 1], bounds[k]) if k > rays[0] else cur[:0]
+        linked = {}
+        if len(cur) and len(prev):
+            # Overlapping hatch pairs of the two rays, shortest connector first
+            h, g = np.meshgrid(prev, cur, indexing='ij')
+            h, g = h.ravel(), g.ravel()
+            overlap = (lo[g] <= hi[h]) & (lo[h] <= hi[g])
+            h, g = h[overlap], g[overlap]
+            if len(h):
+                starts, ends = hatches[h, 1], hatches[g, 0]
+                y_lo, y_hi = hatches[prev[0], 0, 1], hatches[cur[0], 0, 1]
+                strip = segarr[(seg_ymax >= y_lo) & (seg_ymin <= y_hi)]
+                ok = connectors_inside(strip, starts, ends)
+                length = np.hypot(*(ends - starts).T)
+                used = set()
+                for i in np.flatnonzero(ok)[np.argsort(length[ok], kind='stable')]:
+                    if h[i] not in used and g[i] not in linked:
+                        used.add(h[i])
+                        linked[g[i]] = h[i]
+        for g in cur:
+            if g in linked:
+                chain_of[g] = chain_of[linked[g]]
+                chains[chain_of[g]].append(g)
             else:
+                chain_of[g] = len(chains)
+                chains.append([g])
+
+    return [hatches[chain].reshape(-1, 2) for chain in chains]
+
 
-                intersection_coords.append(intersect)
-                #plt.scatter([intersect[0]],[intersect[1]],c='k')
-                #plt.plot(segarr[i,:,0], segarr[i,:,1],c='red')
+#rotation_matrices: (A,2,2) matrices rotating points counter clockwise by each of the angles (degrees).
+def rotation_matrices(angles):
+    theta = np.radians(np.asarray(angles, dtype=float).reshape(-1))
+    c, s = np.cos(theta), np.sin(theta)
+    return np.stack([np.stack([c, -s], axis=-1), np.stack([s, c], axis=-1)], axis=-2)
 
-        if len(intersection_coords)>1:
-            # Order the coordinates on the x axis
-            intersection_x_coords = np.array(intersection_coords)[:,0]
-            intersection_x_coords.sort()
 
-            prev = None
-            for i,(s,e) in enumerate( windowed(intersection_x_coords,2) ):
+#hatch_fill: Fill a shape with hatches at any angle (degrees, 0 being horizontal), several angles giving a cross-hatch.
+# The segment array is rotated by all angles at once and the rotated copies are stacked along y, a few rays apart and
+# each starting exactly on a ray, so one scanline pass hatches every angle. The polylines are then moved and rotated
+# back in one batch. Returns the (N,2) polylines of every angle, in the order of the angles.
+def hatch_fill(segarr, ray_distance = 2, angles = (0,), serpentine = True, min_length = 0):
+    segarr = np.asarray(segarr, dtype=float).reshape(-1, 2, 2)
+    angles = np.asarray(angles, dtype=float).reshape(-1)
+    if len(segarr) == 0 or len(angles) == 0:
+        return []
 
-                if i%2==0:
-                    #print(y_ray,s,e,prev)
-                    if prev is not None and (s,e)==prev: # Overlap
-                        continue
+    # Hatching at angle a is horizontal hatching of the shape rotated by -a
+    rotated = np.einsum('aij,skj->aski', rotation_matrices(-angles), segarr)
+    low = rotated[..., 1].min(axis=(1, 2))
+    rows = np.ceil((rotated[..., 1].max(axis=(1, 2)) - low) / ray_distance) + 2
+    base = np.concatenate([[0], np.cumsum(rows)[:-1]]) * ray_distance
+    shift = base - low
+    rotated[..., 1] += shift[:, None, None]
 
-                    if debug:
-                        plt.plot([s,e],[y_ray,y_ray],c='k',alpha=0.2)
-                    yield ([s,y_ray],[e,y_ray])
+    stacked = rotated.reshape(-1, 2, 2)
+    polylines = serpentine_fill(stacked, stacked.reshape(-1, 2), ray_distance, serpentine=serpentine,
+                                min_length=min_length)
+    if not polylines:
+        return []
 
-                    prev = (s,e)
+    # Every polyline stays within its copy, its first point tells which one
+    copy = np.searchsorted(base, [polyline[0, 1] + ray_distance / 2 for polyline in polylines], side='right') - 1
+    order = np.argsort(copy, kind='stable')
+    polylines = [polylines[i] for i in order]
+    copy = copy[order]
+    sizes = [len(polyline) for polyline in polylines]
+    points = np.concatenate(polylines)
+    point_copy = np.repeat(copy, sizes)
+    points[:, 1] -= shift[point_copy]
+    points = np.einsum('nij,nj->ni', rotation_matrices(angles)[point_copy], points)
+    return np.split(points, np.cumsum(sizes)[:-1])
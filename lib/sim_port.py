@@ -0,0 +1,204 @@
+import math
+import queue
+import re
+import threading
+import time
+
+from collections import deque
+
+from .pydexarm import Dexarm, RX_BUFFER_SIZE
+
+PLANNER_SIZE = 16  # motion blocks the simulated firmware plans ahead (Marlin BLOCK_BUFFER_SIZE)
+BUSY_INTERVAL = 2.0  # seconds between busy keepalives while a command waits (Marlin DEFAULT_KEEPALIVE_INTERVAL)
+
+WORD_RE = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+
+
+class SimulatedPort:
+    """ A serial port with a simulated Dexarm behind it
+
+    Behaves like a pyserial port (write, readline, read, in_waiting, timeout...) talking to Marlin-like firmware: a
+    limited receive buffer, an "ok" once a command is taken into the planner, a planner of PLANNER_SIZE moves executed
+    in real time (scaled by time_scale), M114 / M888 / M400 / G4 answered like the arm does, busy keepalives and
+    "Unknown command" errors. Lets the senders, sessions and fleet run without hardware.
+    """
+
+    def __init__(self, port='sim', time_scale=1.0, rx_buffer_size=RX_BUFFER_SIZE, planner_size=PLANNER_SIZE,
+                 module_type='PEN', timeout=None):
+        """
+        Args:
+            port (string): name of the port
+            time_scale (float): simulated seconds per real second of arm motion, 0 moves instantly
+            rx_buffer_size (int): bytes the receive buffer holds, anything beyond is lost (counted in overflows)
+            planner_size (int): moves the firmware plans ahead before it holds back its ok
+            module_type (string): what M888 reports
+            timeout (float): read timeout in seconds, None blocks
+        """
+        self.name = port
+        self.port = port
+        self.time_scale = time_scale
+        self.rx_buffer_size = rx_buffer_size
+        self.planner_size = planner_size
+        self.module_type = module_type
+        self.timeout = timeout
+        self.is_open = True
+        self.received = []  # every command the firmware processed, in order
+        self.overflows = 0  # bytes lost to a full receive buffer
+        self.position = [0.0, 300.0, 0.0, 0.0]
+        self.relative = False
+        self.feedrate = 2000.0
+        self._rx = bytearray()
+        self._output = queue.Queue()
+        self._pending = b''
+        self._planner = deque()
+        self._lock = threading.Condition()
+        self._firmware = threading.Thread(target=self._run_firmware, name=f'{port} firmware', daemon=True)
+        self._steppers = threading.Thread(target=self._run_steppers, name=f'{port} steppers', daemon=True)
+        self._firmware.start()
+        self._steppers.start()
+
+    def isOpen(self):
+        return self.is_open
+
+    @property
+    def in_waiting(self):
+        return len(self._pending) + sum(len(line) for line in list(self._output.queue))
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError(f'{self.name} is closed')
+        with self._lock:
+            room = self.rx_buffer_size - len(self._rx)
+            self._rx += data[:max(room, 0)]
+            self.overflows += max(len(data) - max(room, 0), 0)
+            self._lock.notify_all()
+        return len(data)
+
+    def _next_line(self):
+        if self._pending:
+            line, self._pending = self._pending, b''
+            return line
+        try:
+            return self._output.get(timeout=self.timeout)
+        except queue.Empty:
+            return b''
+
+    def readline(self):
+        if not self.is_open:
+            raise OSError(f'{self.name} is closed')
+        return self._next_line()
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise OSError(f'{self.name} is closed')
+        data = self._next_line()
+        while len(data) < size and not self._output.empty():
+            data += self._output.get()
+        data, self._pending = data[:size], data[size:]
+        return data
+
+    def reset_input_buffer(self):
+        self._pending = b''
+        while not self._output.empty():
+            self._output.get()
+
+    def close(self):
+        with self._lock:
+            self.is_open = False
+            self._lock.notify_all()
+
+    def _reply(self, text):
+        self._output.put(text.encode() + b'\n')
+
+    def _wait(self, condition, keepalive=True):
+        # Keepalive like the firmware does while a command is held back
+        while not condition():
+            if not self._lock.wait(BUSY_INTERVAL) and keepalive:
+                self._reply('echo:busy: processing')
+            if not self.is_open:
+                return False
+        return True
+
+    def _run_firmware(self):
+        with self._lock:
+            while True:
+                if not self._wait(lambda: b'\r' in self._rx or b'\n' in self._rx, keepalive=False):
+                    return
+                end = min(i for i in (self._rx.find(b'\r'), self._rx.find(b'\n')) if i >= 0)
+                command = bytes(self._rx[:end]).decode('utf-8', errors='replace').split(';', 1)[0].strip()
+                del self._rx[:end + 1]
+                self._lock.notify_all()
+                if command and self._process(command) is False:
+                    return
+
+    def _process(self, command):
+        self.received.append(command)
+        tokens = command.upper().split()
+        words = dict(WORD_RE.findall(command.upper()))
+        code = re.match(r'[GM]\d+', tokens[0])
+        code = code.group(0) if code else tokens[0]
+        if 'G90' in tokens:
+            self.relative = False
+        if 'G91' in tokens:
+            self.relative = True
+        if code in ('G0', 'G1', 'G2', 'G3', 'G5'):
+            target = list(self.position)
+            for i, axis in enumerate('XYZE'):
+                if axis in words:
+                    value = float(words[axis])
+                    target[i] = target[i] + value if self.relative else value
+            if 'F' in words:
+                self.feedrate = float(words['F'])
+            distance = math.dist(self.position[:3], target[:3])
+            if not self._wait(lambda: len(self._planner) < self.planner_size):
+                return False
+            self._planner.append(distance / max(self.feedrate, 1e-9) * 60)
+            self.position = target
+        elif code == 'G4':
+            seconds = float(words.get('S', 0)) + float(words.get('P', 0)) / 1000
+            if not self._wait(lambda: len(self._planner) < self.planner_size):
+                return False
+            self._planner.append(seconds)
+        elif code == 'G92':
+            for i, axis in enumerate('XYZE'):
+                if axis in words:
+                    self.position[i] = float(words[axis])
+        elif code == 'M1112':
+            if not self._wait(lambda: not self._planner):
+                return False
+            self.position = [0.0, 300.0, 0.0, self.position[3]]
+        elif code == 'M400':
+            if not self._wait(lambda: not self._planner):
+                return False
+        elif code == 'M114':
+            x, y, z, e = self.position
+            self._reply(f'X:{x:.2f} Y:{y:.2f} Z:{z:.2f} E:{e:.2f} Count A:0 B:0 C:0')
+            self._reply('DEXARM Theta A:0.00  Theta B:0.00  Theta C:0.00')
+        elif code == 'M888' and 'P' not in words:
+            self._reply(self.module_type)
+        elif not re.match(r'[GM]\d+$', code):
+            self._reply(f'echo:Unknown command: "{command}"')
+        self._reply('ok')
+        self._lock.notify_all()
+
+    def _run_steppers(self):
+        while True:
+            with self._lock:
+                if not self._wait(lambda: self._planner, keepalive=False):
+                    return
+                duration = self._planner[0]
+            if self.time_scale:
+                time.sleep(duration * self.time_scale)
+            with self._lock:
+                self._planner.popleft()
+                self._lock.notify_all()
+
+
+def simulated_arm(port='sim', **options):
+    """
+    A Dexarm on a SimulatedPort, e.g. as the arm_factory of an ArmSession or Fleet.
+
+    Args:
+        options: SimulatedPort arguments
+    """
+    return Dexarm(port, ser=SimulatedPort(port, **options))
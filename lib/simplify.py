@@ -0,0 +1,89 @@
+import heapq
+import numpy as np
+
+# Polyline simplification, run on toolpaths before they are turned into gcode.
+# Every function returns a boolean keep mask over the points, first and last point are always kept.
+
+
+#rdp_mask: Ramer-Douglas-Peucker. Each split scans its whole point range with one numpy expression.
+def rdp_mask(points, tolerance):
+    pts = np.asarray(points, dtype=float)
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        start = pts[i]
+        chord = pts[j] - start
+        rel = pts[i + 1:j] - start
+        length = np.hypot(chord[0], chord[1])
+        if length == 0:
+            # Closed run, measure from the start point
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = np.abs(chord[0] * rel[:, 1] - chord[1] * rel[:, 0]) / length
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            split = i + 1 + k
+            keep[split] = True
+            stack.append((i, split))
+            stack.append((split, j))
+    return keep
+
+
+def _triangle_areas(pts, prev_idx, idx, next_idx):
+    a, b, c = pts[prev_idx], pts[idx], pts[next_idx]
+    return np.abs((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) -
+                  (c[..., 0] - a[..., 0]) * (b[..., 1] - a[..., 1])) / 2
+
+
+#visvalingam_mask: Visvalingam-Whyatt. Repeatedly drops the point whose triangle with its neighbours has the smallest
+# area, until every remaining triangle is at least tolerance^2 (so tolerance stays a length like for rdp).
+def visvalingam_mask(points, tolerance):
+    pts = np.asarray(points, dtype=float)
+    n = len(pts)
+    keep = np.ones(n, dtype=bool)
+    if n <= 2:
+        return keep
+    threshold = tolerance ** 2
+    prev = np.arange(-1, n - 1)
+    nxt = np.arange(1, n + 1)
+    inner = np.arange(1, n - 1)
+    areas = np.full(n, np.inf)
+    areas[inner] = _triangle_areas(pts, inner - 1, inner, inner + 1)
+    heap = [(area, i) for i, area in zip(inner.tolist(), areas[inner].tolist()) if area < threshold]
+    heapq.heapify(heap)
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            continue  # stale entry
+        keep[i] = False
+        p, q = prev[i], nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                # A neighbour never gets a smaller area than the point just removed
+                areas[j] = max(float(_triangle_areas(pts, prev[j], j, nxt[j])), area)
+                if areas[j] < threshold:
+                    heapq.heappush(heap, (areas[j], j))
+    return keep
+
+
+SIMPLIFY_METHODS = {
+    'rdp': rdp_mask,
+    'visvalingam': visvalingam_mask,
+}
+
+
+def simplify_polyline(points, tolerance, method='rdp'):
+    if method not in SIMPLIFY_METHODS:
+        raise ValueError(f'Unknown simplification method {method}, use one of {list(SIMPLIFY_METHODS)}')
+    return SIMPLIFY_METHODS[method](points, tolerance)
+
@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+# Uniform grid index over a fixed set of 2D points, used for path ordering and endpoint merging.
+# Points can be removed (and put back) while querying, so greedy tours stay O(1) per pick on average.
+
+
+class PointGrid:
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        n = len(self.points)
+        if n:
+            self.origin = self.points.min(axis=0)
+            extent = self.points.max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        if cell_size is None:
+            # Aim for about one point per cell
+            area = max(extent[0] * extent[1], max(extent[0], extent[1]) ** 2 / max(n, 1))
+            cell_size = math.sqrt(area / max(n, 1))
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+
+        keys = np.floor((self.points - self.origin) / self.cell_size).astype(np.int64)
+        self.keys = [tuple(key) for key in keys.tolist()]
+        self.cells = {}
+        for i, key in enumerate(self.keys):
+            self.cells.setdefault(key, set()).add(i)
+        self.alive = np.ones(n, dtype=bool)
+        self.count = n
+        self.span = (keys.max(axis=0) + 1).tolist() if n else [1, 1]
+
+    def __len__(self):
+        return self.count
+
+    def cell_of(self, point):
+        return tuple(np.floor((np.asarray(point, dtype=float) - self.origin) / self.cell_size).astype(np.int64).tolist())
+
+    def remove(self, i):
+        if not self.alive[i]:
+            return
+        cell = self.cells[self.keys[i]]
+        cell.discard(i)
+        if not cell:
+            del self.cells[self.keys[i]]
+        self.alive[i] = False
+        self.count -= 1
+
+    def restore(self, i):
+        if self.alive[i]:
+            return
+        self.cells.setdefault(self.keys[i], set()).add(i)
+        self.alive[i] = True
+        self.count += 1
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    #nearest: Index of and distance to the closest remaining point, (None, inf) when the grid is empty.
+    # Rings of cells are scanned outwards until the ring's lower distance bound exceeds the best match.
+    def nearest(self, point):
+        if self.count == 0:
+            return None, math.inf
+        q = np.asarray(point, dtype=float)
+        # A query outside the grid starts at the closest cell inside it, the rings in between would all be empty.
+        # The ring bound still holds: a cell r rings from there is at least r - 1 cells away from the query.
+        cx, cy = self.cell_of(q)
+        cx = min(max(cx, 0), self.span[0] - 1)
+        cy = min(max(cy, 0), self.span[1] - 1)
+        max_r = max(cx, self.span[0] - cx, cy, self.span[1] - cy) + 1
+        best, best_d = None, math.inf
+        for r in range(max_r + 1):
+            if best is not None and (r - 1) * self.cell_size >= best_d:
+                break
+            candidates = [i for key in self._ring(cx, cy, r) for i in self.cells.get(key, ())]
+            if candidates:
+                d = np.hypot(self.points[candidates, 0] - q[0], self.points[candidates, 1] - q[1])
+                k = int(np.argmin(d))
+                if d[k] < best_d:
+                    best, best_d = candidates[k], float(d[k])
+        return best, best_d
+
+    #within: Indices of the remaining points at most radius away from point.
+    def within(self, point, radius):
+        q = np.asarray(point, dtype=float)
+        lo = self.cell_of(q - radius)
+        hi = self.cell_of(q + radius)
+        candidates = [i for x in range(lo[0], hi[0] + 1) for y in range(lo[1], hi[1] + 1)
+                      for i in self.cells.get((x, y), ())]
+        if not candidates:
+            return []
+        d = np.hypot(self.points[candidates, 0] - q[0], self.points[candidates, 1] - q[1])
+        return [i for i, di in zip(candidates, d.tolist()) if di <= radius]
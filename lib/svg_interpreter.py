@@ -5,29 +5,115 @@ import xml.etree.ElementTree as et
 import re
 import numpy as np
 import sys
+import math
+from array import array
+
+from .toolpath import Toolpath, LINE, ARC, CUBIC, CLOSED
+
+
+_BERNSTEIN_CACHE = {}
+
+
+#bernstein_basis: Bernstein basis matrix of shape (steps, degree+1) sampled at np.linspace(0, 1, steps), cached per (degree, steps).
+def bernstein_basis(degree, steps=10):
+    key = (degree, steps)
+    basis = _BERNSTEIN_CACHE.get(key)
+    if basis is None:
+        t = np.linspace(0, 1, steps)[:, None]
+        k = np.arange(degree + 1)[None, :]
+        binom = np.array([math.comb(degree, i) for i in range(degree + 1)], dtype=float)
+        basis = binom * np.power(t, k) * np.power(1 - t, degree - k)
+        basis.setflags(write=False)
+        _BERNSTEIN_CACHE[key] = basis
+    return basis
+
+
+#elevate_quadratics: Exact degree elevation of (N,3,2) quadratic control points to (N,4,2) cubic control points.
+def elevate_quadratics(segments):
+    q = np.asarray(segments, dtype=float)
+    c = np.empty((q.shape[0], 4, 2))
+    c[:, 0] = q[:, 0]
+    c[:, 1] = q[:, 0] + (2 / 3) * (q[:, 1] - q[:, 0])
+    c[:, 2] = q[:, 2] + (2 / 3) * (q[:, 1] - q[:, 2])
+    c[:, 3] = q[:, 2]
+    return c
+
+
+#flatten_beziers: Flatten a batch of bezier segments, (N,4,2) cubics or (N,3,2) quadratics, with one matrix product.
+# Returns the flat (N*steps, 2) coordinate array and (N+1,) offsets, segment i being coords[offsets[i]:offsets[i+1]].
+def flatten_beziers(segments, steps=10):
+    segments = np.asarray(segments, dtype=float)
+    if segments.size == 0:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.intp)
+    if segments.ndim != 3 or segments.shape[1] not in (3, 4) or segments.shape[2] != 2:
+        raise Exception(
+            'Can only interpolate cubic and quadratic splines ((N,4,2) or (N,3,2) arrays, got: %s' % str(segments.shape))
+    basis = bernstein_basis(segments.shape[1] - 1, steps)
+    coords = np.einsum('sk,nkd->nsd', basis, segments).reshape(-1, 2)
+    offsets = np.arange(segments.shape[0] + 1, dtype=np.intp) * steps
+    return coords, offsets
+
+
+#flatten_beziers_adaptive: Like flatten_beziers, but every segment gets just enough uniform samples to keep the polyline
+# within `tolerance` (chordal deviation, same units as the control points) of the curve.
+# Sample counts come from Wang's bound d(d-1)/8 * max|P[i] - 2P[i+1] + P[i+2]| / n^2, segments whose control polygon is
+# already within tolerance of the chord are emitted as a single line.
+def flatten_beziers_adaptive(segments, tolerance, max_steps=1000):
+    segments = np.asarray(segments, dtype=float)
+    if segments.size == 0:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.intp)
+    if segments.ndim != 3 or segments.shape[1] not in (3, 4) or segments.shape[2] != 2:
+        raise Exception(
+            'Can only interpolate cubic and quadratic splines ((N,4,2) or (N,3,2) arrays, got: %s' % str(segments.shape))
+    if tolerance <= 0:
+        raise ValueError(f'Flattening tolerance must be positive, got {tolerance}')
+    degree = segments.shape[1] - 1
+
+    second_diff = segments[:, :-2] - 2 * segments[:, 1:-1] + segments[:, 2:]
+    bound = np.max(np.hypot(second_diff[..., 0], second_diff[..., 1]), axis=1)
+    n = np.ceil(np.sqrt(degree * (degree - 1) * bound / (8 * tolerance)))
+
+    # Distance of the inner control points to the chord (or to the start point for closed segments)
+    chord = segments[:, -1] - segments[:, 0]
+    chord_len = np.hypot(chord[:, 0], chord[:, 1])
+    inner = segments[:, 1:-1] - segments[:, :1]
+    cross = np.abs(chord[:, None, 0] * inner[..., 1] - chord[:, None, 1] * inner[..., 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist = np.where(chord_len[:, None] > 0, cross / chord_len[:, None], np.hypot(inner[..., 0], inner[..., 1]))
+    flat = np.max(dist, axis=1) <= tolerance
+
+    n = np.where(flat | ~np.isfinite(n), 1, np.clip(n, 1, max_steps)).astype(np.intp)
+    offsets = np.zeros(len(n) + 1, dtype=np.intp)
+    np.cumsum(n + 1, out=offsets[1:])
+    seg_idx = np.repeat(np.arange(len(n)), n + 1)
+    t = ((np.arange(offsets[-1]) - offsets[seg_idx]) / n[seg_idx])[:, None]
+    k = np.arange(degree + 1)[None, :]
+    binom = np.array([math.comb(degree, i) for i in range(degree + 1)], dtype=float)
+    basis = binom * np.power(t, k) * np.power(1 - t, degree - k)
+    coords = np.einsum('sk,skd->sd', basis, segments[seg_idx])
+    return coords, offsets
+
+
+#flatten_segments: Fixed-precision or, when a tolerance is given, adaptive flattening.
+def flatten_segments(segments, PRECISION=10, TOLERANCE=None):
+    if TOLERANCE is None:
+        return flatten_beziers(segments, steps=PRECISION)
+    return flatten_beziers_adaptive(segments, TOLERANCE)
 
 
 def interpolateBezier(points, steps=10, t=None):
-    points = tuple(points)
-    if len(points) == 3:
-        def mapper(t, p): return (1-t)**2 * p[0] + 2*(1-t)*t*p[1] + t**2*p[2]
-    elif len(points) == 4:
-        def mapper(t, p): return (np.power((1-t), 3)*p[0] +
-                                  3 * np.power((1-t), 2) * t * p[1] +
-                                  3*(1-t)*np.power(t, 2)*p[2] +
-                                  np.power(t, 3)*p[3])
-    else:
+    points = np.asarray(tuple(points), dtype=float)
+    if len(points) not in (3, 4):
         raise Exception(
             'Can only interpolate cubic and quadratic splines (3 or 4 parameters, got: %s' % str(points))
 
     if t is not None:
-        return mapper(t, [q[0] for q in points]), mapper(t, [q[1] for q in points])
-    xGen = (mapper(t, [q[0] for q in points])
-            for t in np.linspace(0, 1, steps))
-    yGen = (mapper(t, [q[1] for q in points])
-            for t in np.linspace(0, 1, steps))
-
-    return zip(xGen, yGen)
+        degree = len(points) - 1
+        weights = np.array([math.comb(degree, i) * np.power(t, i) * np.power(1 - t, degree - i)
+                            for i in range(degree + 1)])
+        return weights @ points[:, 0], weights @ points[:, 1]
+    coords, _ = flatten_beziers(points[None], steps)
+    return zip(coords[:, 0], coords[:, 1])
 
 
 def parse_coord(inp):
@@ -38,89 +124,390 @@ def _parse_coord(x, y):
     return np.array([float(x),  float(y)])
 
 
-def path_to_cordinate_chomper(shape_path, PRECISION=5, verbose=False):
-    prev = None
+#path_to_coordinate_array: Resample a canvas stroke (list of {'x','y'} points) into one (len*PRECISION, 2) array.
+# Every point is joined to the previous one by a degenerate cubic, the first one starting from NaN (pen up).
+def path_to_coordinate_array(shape_path, PRECISION=5, TOLERANCE=None):
+    points = np.array([[float(p['x']), float(p['y'])] for p in shape_path], dtype=float).reshape(-1, 2)
+    prev = np.vstack([[np.nan, np.nan], points])[:-1]
+    segments = np.stack([prev, points, points, points], axis=1)
+    coords, _ = flatten_segments(segments, PRECISION, TOLERANCE)
+    return coords
+
 
-    for path in shape_path:
-        dxdy = _parse_coord(path['x'], path['y'])
-        # print(dxdy)
+def path_to_cordinate_chomper(shape_path, PRECISION=5, verbose=False, TOLERANCE=None):
+    yield from path_to_coordinate_array(shape_path, PRECISION=PRECISION, TOLERANCE=TOLERANCE)
 
-        if prev is None:
-            prev = [np.nan, np.nan]
 
-        for x, y in interpolateBezier(  # Resample the bezier curve
-            [
-                prev,
-                dxdy,
-                dxdy,
-                dxdy,
-            ], steps=PRECISION
+_PATH_ARITY = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+_PATH_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_PATH_NUMBER_RE = re.compile(_PATH_NUMBER)
+_PATH_FLAG_RE = re.compile(r'[01]')
+_PATH_SEPARATOR_RE = re.compile(r'[\s,]*')
+_PATH_SEGMENT_RE = re.compile(r'([MmLlHhVvCcSsQqTtAaZz])([^MmLlHhVvCcSsQqTtAaZz]*)')
+_NO_ARGS = np.empty((1, 0))
 
-        ):
-            yield np.array([x, y])
-        prev = dxdy
+
+def _tokenize_args(cmd, args):
+    # One linear scan: number, separators, number... (a single regex over the whole run backtracks exponentially on
+    # malformed data). Arc flags are single characters and may be written without separators ("a1 1 0 015 5")
+    values = []
+    arc = cmd in 'Aa'
+    pos = _PATH_SEPARATOR_RE.match(args).end()
+    while pos < len(args):
+        if arc and len(values) % 7 in (3, 4):
+            match = _PATH_FLAG_RE.match(args, pos)
+        else:
+            match = _PATH_NUMBER_RE.match(args, pos)
+        if match is None:
+            raise ValueError(f'Invalid path data after {cmd}: {args[pos:pos + 20]!r}')
+        values.append(match.group())
+        pos = _PATH_SEPARATOR_RE.match(args, match.end()).end()
+    return values
+
+
+#tokenize_path: Single pass tokenizer for an SVG path `d` attribute.
+# Returns a list of (command, args) tuples where args is a float array of shape (repeats, arity), e.g. ('c', (2, 6)).
+# All numbers of the path are converted in one go and args are views into that array. Implicit command repetition,
+# compact arc flags and exponents are handled, Z gets a (1, 0) array.
+def tokenize_path(d):
+    head = _PATH_SEPARATOR_RE.match(d).end()
+    segments = _PATH_SEGMENT_RE.findall(d, head)
+    if head + sum(1 + len(args) for _, args in segments) != len(d):
+        raise ValueError(f'Invalid path data before the first command: {d[:20]!r}')
+
+    # Numbers are packed straight into a double array, which numpy then wraps without copying.
+    # Runs of the same command ("C ... C ...") are merged, except for moveto which starts a new subpath.
+    tokens = array('d')
+    groups = []
+    for cmd, args in segments:
+        values = _tokenize_args(cmd, args)
+        tokens.extend(map(float, values))
+        if groups and groups[-1][0] == cmd and cmd not in 'MmZz':
+            groups[-1][1] += len(values)
+        else:
+            groups.append([cmd, len(values)])
+    numbers = np.frombuffer(tokens, dtype=float) if tokens else np.empty(0)
+
+    commands = []
+    offset = 0
+    for cmd, count in groups:
+        arity = _PATH_ARITY[cmd.upper()]
+        if arity == 0:
+            if count:
+                raise ValueError(f'Command {cmd} takes no arguments, got {count}')
+            commands.append((cmd, _NO_ARGS))
+            continue
+        if count == 0 or count % arity:
+            raise ValueError(f'Command {cmd} expects a multiple of {arity} numbers, got {count}')
+        args = numbers[offset:offset + count].reshape(-1, arity)
+        offset += count
+        if cmd in 'Mm' and len(args) > 1:
+            # Extra coordinate pairs after a moveto are implicit linetos
+            commands.append((cmd, args[:1]))
+            commands.append(('L' if cmd == 'M' else 'l', args[1:]))
+        else:
+            commands.append((cmd, args))
+    return commands
+
+
+#arc_center_parameters: SVG endpoint arc parameterization to center parameterization (SVG 1.1 appendix F.6.5).
+# Returns (cx, cy, rx, ry, phi, theta1, dtheta) with angles in radians, or None when the arc degenerates into a line.
+def arc_center_parameters(p0, rx, ry, phi, large_arc, sweep, p1):
+    x1, y1 = p0
+    x2, y2 = p1
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or (x1 == x2 and y1 == y2):
+        return None
+    phi = math.radians(phi % 360)
+    cos_phi, sin_phi = math.cos(phi), math.sin(phi)
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p = cos_phi * dx + sin_phi * dy
+    y1p = -sin_phi * dx + cos_phi * dy
+    # Scale up radii that are too small to span the endpoints
+    lam = (x1p / rx) ** 2 + (y1p / ry) ** 2
+    if lam > 1:
+        rx *= math.sqrt(lam)
+        ry *= math.sqrt(lam)
+    num = (rx * ry) ** 2 - (rx * y1p) ** 2 - (ry * x1p) ** 2
+    den = (rx * y1p) ** 2 + (ry * x1p) ** 2
+    coef = math.sqrt(max(num, 0) / den)
+    if bool(large_arc) == bool(sweep):
+        coef = -coef
+    cxp = coef * rx * y1p / ry
+    cyp = -coef * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (x1 + x2) / 2
+    cy = sin_phi * cxp + cos_phi * cyp + (y1 + y2) / 2
+    theta1 = math.atan2((y1p - cyp) / ry, (x1p - cxp) / rx)
+    theta2 = math.atan2((-y1p - cyp) / ry, (-x1p - cxp) / rx)
+    dtheta = theta2 - theta1
+    if sweep and dtheta < 0:
+        dtheta += 2 * math.pi
+    elif not sweep and dtheta > 0:
+        dtheta -= 2 * math.pi
+    return cx, cy, rx, ry, phi, theta1, dtheta
+
+
+#arc_to_beziers: Approximate an SVG elliptical arc by (k,4,2) cubic segments of at most 90 degrees each.
+def arc_to_beziers(p0, rx, ry, phi, large_arc, sweep, p1):
+    params = arc_center_parameters(p0, rx, ry, phi, large_arc, sweep, p1)
+    if params is None:
+        return np.array([[p0, p0, p1, p1]], dtype=float)
+    cx, cy, rx, ry, phi, theta1, dtheta = params
+    n = max(1, math.ceil(abs(dtheta) / (math.pi / 2) - 1e-9))
+    delta = dtheta / n
+    k = 4 / 3 * math.tan(delta / 4)
+    a0 = theta1 + delta * np.arange(n)
+    a1 = a0 + delta
+    unit = np.empty((n, 4, 2))
+    unit[:, 0] = np.stack([np.cos(a0), np.sin(a0)], axis=1)
+    unit[:, 1] = unit[:, 0] + k * np.stack([-np.sin(a0), np.cos(a0)], axis=1)
+    unit[:, 3] = np.stack([np.cos(a1), np.sin(a1)], axis=1)
+    unit[:, 2] = unit[:, 3] - k * np.stack([-np.sin(a1), np.cos(a1)], axis=1)
+    rotation = np.array([[math.cos(phi), -math.sin(phi)], [math.sin(phi), math.cos(phi)]])
+    segments = (unit * [rx, ry]) @ rotation.T + [cx, cy]
+    segments[0, 0] = p0
+    segments[-1, 3] = p1
+    return segments
+
+
+#quadratic_elevation_error: Max distance between quadratics (N,3,2) and their cubic elevations (N,4,2), sampled.
+def quadratic_elevation_error(quadratics, cubics, steps=9):
+    q, _ = flatten_beziers(quadratics, steps)
+    c, _ = flatten_beziers(cubics, steps)
+    return np.max(np.hypot(*(q - c).T).reshape(-1, steps), axis=1)
+
+
+#arc_bezier_error: Max radial distance between the cubics (N,4,2) arc_to_beziers produced and the true ellipse.
+def arc_bezier_error(segments, params, steps=9):
+    cx, cy, rx, ry, phi, _, _ = params
+    pts, _ = flatten_beziers(segments, steps)
+    rotation = np.array([[math.cos(phi), math.sin(phi)], [-math.sin(phi), math.cos(phi)]])
+    local = (pts - [cx, cy]) @ rotation.T
+    radial = np.abs(np.hypot(local[:, 0] / rx, local[:, 1] / ry) - 1) * max(rx, ry)
+    return np.max(radial.reshape(-1, steps), axis=1)
 
 
 #adding print to debug
-def svg_to_coordinate_chomper(inp, PRECISION=10, verbose=False):
-    print(f"Debug: Starting svg_to_coordinate_chomper with PRECISION={PRECISION}, verbose={verbose}")
-    current_pos = [0, 0]
-    for command in inp:
-        cmd = command[0]
-        #print(f"Debug: Processing command: {command}")
-        if cmd == 'M':  # Move to absolute
-            current_pos = [float(command[1]), float(command[2])]
-            #print(f"Debug: Move to {current_pos}")
-            yield 'UP'
-            yield current_pos
-            yield 'DOWN'
-        elif cmd == 'L':  # Line to absolute
-            for i in range(1, len(command), 2):
-                x = float(command[i])
-                y = float(command[i + 1])
-                current_pos = [x, y]
-                #print`(f"Debug: Line to {current_pos}")
-                yield current_pos
-        elif cmd == 'H':  # Horizontal line to absolute
-            for i in range(1, len(command)):
-                x = float(command[i])
-                current_pos[0] = x
-                #print(f"Debug: Horizontal line to {current_pos}")
-                yield current_pos
-        elif cmd == 'V':  # Vertical line to absolute
-            for i in range(1, len(command)):
-                y = float(command[i])
-                current_pos[1] = y
-                #print(f"Debug: Vertical line to {current_pos}")
-                yield current_pos
-        elif cmd == 'Z':  # Close path
-            #print("Debug: Close path")
-            yield 'Z'
-        elif cmd == 'c':  # Relative cubic Bézier curve
-            for i in range(1, len(command), 6):
-                x1 = current_pos[0] + float(command[i])
-                y1 = current_pos[1] + float(command[i + 1])
-                x2 = current_pos[0] + float(command[i + 2])
-                y2 = current_pos[1] + float(command[i + 3])
-                x = current_pos[0] + float(command[i + 4])
-                y = current_pos[1] + float(command[i + 5])
-                current_pos = [x, y]
-                #print(f"Debug: Relative cubic Bézier to {current_pos} with control points {[(x1, y1), (x2, y2)]}")
-                yield current_pos
-        elif cmd == 'C':  # Absolute cubic Bézier curve
-            for i in range(1, len(command), 6):
-                x1 = float(command[i])
-                y1 = float(command[i + 1])
-                x2 = float(command[i + 2])
-                y2 = float(command[i + 3])
-                x = float(command[i + 4])
-                y = float(command[i + 5])
-                current_pos = [x, y]
-                #print(f"Debug: Absolute cubic Bézier to {current_pos} with control points {[(x1, y1), (x2, y2)]}")
-                yield current_pos
+#svg_to_coordinate_chomper: Walk tokenize_path output and yield 'UP' / 'DOWN' / 'Z' sentinels and [x, y] coordinates.
+# With ARC_TOLERANCE set, arcs whose radii differ by at most that much are not flattened but yielded as
+# ('ARC', end, center, ccw) tuples, ccw meaning increasing angle in the path's own coordinate frame.
+# With CUBIC_TOLERANCE set, cubic segments are yielded as ('CUBIC', end, control1, control2) tuples instead of being
+# flattened. Quadratics and arcs only pass as cubics if their cubic form is within CUBIC_TOLERANCE of the original.
+def svg_to_coordinate_chomper(inp, PRECISION=10, verbose=False, TOLERANCE=None, ARC_TOLERANCE=None, CUBIC_TOLERANCE=None):
+    if verbose:
+        print(f"Debug: Starting svg_to_coordinate_chomper with PRECISION={PRECISION}, TOLERANCE={TOLERANCE}, verbose={verbose}")
+    events, curves, as_cubic = path_events(inp, ARC_TOLERANCE, CUBIC_TOLERANCE)
+
+    # Second pass: flatten all curves (that are not passed through as cubics) at once and replay the events.
+    # Index of every flattened curve in the flattened batch
+    flat_index = np.cumsum(~as_cubic) - 1
+    coords, offsets = flatten_segments(curves[~as_cubic], PRECISION, TOLERANCE)
+    for event in events:
+        if isinstance(event, int):
+            if as_cubic[event]:
+                _, p1, p2, p3 = curves[event].tolist()
+                yield ('CUBIC', p3, p1, p2)
+                continue
+            i = flat_index[event]
+            # The first sample is the start point, which was already yielded.
+            yield from coords[offsets[i] + 1:offsets[i + 1]].tolist()
         else:
-            raise ValueError(f'Unknown command {command[0]}')
-        
+            yield event
+
+
+#path_events: First pass of svg_to_coordinate_chomper / svg_to_toolpath: walk the commands and collect every curve of
+# the path as a cubic, so they can be flattened in one batch. Returns the events ('UP' / 'DOWN' / 'Z', [x, y] points,
+# ('ARC', ...) tuples, and integers referring to curves[i]), the (K,4,2) curves, and which of them pass as cubics.
+def path_events(inp, ARC_TOLERANCE=None, CUBIC_TOLERANCE=None):
+    current_pos = [0.0, 0.0]
+    start_pos = current_pos
+    # Last control points, for the reflection in S/s and T/t
+    cubic_ctrl = None
+    quad_ctrl = None
+    # curve_errors[i] is how far curves[i] is from the original segment (non-zero for converted quadratics and arcs).
+    events = []
+    curves = []
+    curve_errors = []
+    for cmd, args in inp:
+        CMD = cmd.upper()
+        #print(f"Debug: Processing command: {cmd} {args}")
+        for row in args.tolist():
+            ox, oy = current_pos if cmd.islower() else (0.0, 0.0)
+            next_cubic_ctrl = None
+            next_quad_ctrl = None
+            if CMD == 'M':  # Move to
+                target = [ox + row[0], oy + row[1]]
+                if events and target == current_pos:
+                    # A move to where the pen already is would only lift and lower it: the subpath goes on from
+                    # there instead, as it did when svgpathtools rewrote the d attribute. After a Z it is no longer
+                    # closed then.
+                    if events[-1] == 'Z':
+                        events.pop()
+                else:
+                    current_pos = target
+                    #print(f"Debug: Move to {current_pos}")
+                    events.extend(('UP', current_pos, 'DOWN'))
+                start_pos = current_pos
+            elif CMD == 'L':  # Line to
+                current_pos = [ox + row[0], oy + row[1]]
+                events.append(current_pos)
+            elif CMD == 'H':  # Horizontal line to
+                current_pos = [ox + row[0], current_pos[1]]
+                events.append(current_pos)
+            elif CMD == 'V':  # Vertical line to
+                current_pos = [current_pos[0], oy + row[0]]
+                events.append(current_pos)
+            elif CMD == 'Z':  # Close path
+                #print("Debug: Close path")
+                if current_pos != start_pos:
+                    events.append(start_pos)
+                current_pos = start_pos
+                events.append('Z')
+            elif CMD in 'CS':  # Cubic Bézier curve, S reflects the previous second control point
+                if CMD == 'C':
+                    p1 = [ox + row[0], oy + row[1]]
+                    row = row[2:]
+                elif cubic_ctrl is not None:
+                    p1 = [2 * current_pos[0] - cubic_ctrl[0], 2 * current_pos[1] - cubic_ctrl[1]]
+                else:
+                    p1 = current_pos
+                p2 = [ox + row[0], oy + row[1]]
+                p3 = [ox + row[2], oy + row[3]]
+                curves.append([current_pos, p1, p2, p3])
+                curve_errors.append(0.0)
+                events.append(len(curves) - 1)
+                current_pos = p3
+                next_cubic_ctrl = p2
+            elif CMD in 'QT':  # Quadratic Bézier curve, T reflects the previous control point
+                if CMD == 'Q':
+                    q1 = [ox + row[0], oy + row[1]]
+                    row = row[2:]
+                elif quad_ctrl is not None:
+                    q1 = [2 * current_pos[0] - quad_ctrl[0], 2 * current_pos[1] - quad_ctrl[1]]
+                else:
+                    q1 = current_pos
+                q2 = [ox + row[0], oy + row[1]]
+                cubic = elevate_quadratics([[current_pos, q1, q2]])
+                curves.append(cubic[0])
+                curve_errors.append(0.0 if CUBIC_TOLERANCE is None else
+                                    quadratic_elevation_error([[current_pos, q1, q2]], cubic)[0])
+                events.append(len(curves) - 1)
+                current_pos = q2
+                next_quad_ctrl = q1
+            elif CMD == 'A':  # Elliptical arc, approximated by cubics unless it is circular
+                end = [ox + row[5], oy + row[6]]
+                rx, ry = abs(row[0]), abs(row[1])
+                params = None
+                if ARC_TOLERANCE is not None and abs(rx - ry) <= ARC_TOLERANCE:
+                    params = arc_center_parameters(current_pos, (rx + ry) / 2, (rx + ry) / 2, 0, row[3], row[4], end)
+                if params is not None:
+                    events.append(('ARC', end, [params[0], params[1]], params[6] > 0))
+                else:
+                    segments = arc_to_beziers(current_pos, row[0], row[1], row[2], row[3], row[4], end)
+                    errors = np.zeros(len(segments))
+                    if CUBIC_TOLERANCE is not None:
+                        ellipse = arc_center_parameters(current_pos, row[0], row[1], row[2], row[3], row[4], end)
+                        if ellipse is not None:
+                            errors = arc_bezier_error(segments, ellipse)
+                    for segment, error in zip(segments, errors):
+                        curves.append(segment)
+                        curve_errors.append(error)
+                        events.append(len(curves) - 1)
+                current_pos = end
+            else:
+                raise ValueError(f'Unknown command {cmd}')
+            cubic_ctrl = next_cubic_ctrl
+            quad_ctrl = next_quad_ctrl
+
+    curves = np.array(curves, dtype=float).reshape(-1, 4, 2)
+    if CUBIC_TOLERANCE is None:
+        as_cubic = np.zeros(len(curves), dtype=bool)
+    else:
+        as_cubic = np.array(curve_errors, dtype=float) <= CUBIC_TOLERANCE
+    return events, curves, as_cubic
+
+
+#svg_to_toolpath: svg_to_coordinate_chomper straight into a Toolpath, one path per subpath. Flattened curves go in
+# as whole arrays, arcs and cubics that are passed through become ARC / CUBIC vertices.
+def svg_to_toolpath(inp, PRECISION=10, TOLERANCE=None, ARC_TOLERANCE=None, CUBIC_TOLERANCE=None):
+    events, curves, as_cubic = path_events(inp, ARC_TOLERANCE, CUBIC_TOLERANCE)
+    flat_index = np.cumsum(~as_cubic) - 1
+    coords, offsets = flatten_segments(curves[~as_cubic], PRECISION, TOLERANCE)
+
+    pieces = []  # (K,2) vertex arrays, with kinds / aux for the curved ones
+    kinds = []
+    aux = []
+    points = []  # straight line vertices not in pieces yet
+    path_offsets = []
+    flags = []
+    count = 0
+    curved = False
+
+    def flush():
+        nonlocal count
+        if points:
+            pieces.append(np.array(points, dtype=float))
+            kinds.append(np.full(len(points), LINE, dtype=np.uint8))
+            aux.append(None)
+            count += len(points)
+            points.clear()
+
+    for event in events:
+        if isinstance(event, int):
+            if not path_offsets:
+                continue
+            if as_cubic[event]:
+                flush()
+                _, p1, p2, p3 = curves[event]
+                pieces.append(p3[None])
+                kinds.append(np.array([CUBIC], dtype=np.uint8))
+                aux.append(np.concatenate([p1, p2])[None])
+                count += 1
+                curved = True
+                continue
+            i = flat_index[event]
+            flush()
+            flat = coords[offsets[i] + 1:offsets[i + 1]]
+            pieces.append(flat)
+            kinds.append(np.full(len(flat), LINE, dtype=np.uint8))
+            aux.append(None)
+            count += len(flat)
+        elif isinstance(event, tuple):  # ('ARC', end, center, ccw)
+            if not path_offsets:
+                continue
+            flush()
+            _, end, center, ccw = event
+            pieces.append(np.array([end], dtype=float))
+            kinds.append(np.array([ARC], dtype=np.uint8))
+            aux.append(np.array([[center[0], center[1], 1.0 if ccw else 0.0, 0.0]]))
+            count += 1
+            curved = True
+        elif isinstance(event, list):
+            if path_offsets:
+                points.append(event)
+        elif event == 'UP':
+            flush()
+            path_offsets.append(count)
+            flags.append(0)
+        elif event == 'Z':
+            if path_offsets:
+                flags[-1] |= CLOSED
+    flush()
+
+    path_offsets.append(count)
+    if not pieces:
+        return Toolpath.empty()
+    # Subpaths without a single vertex (M right after M) are left out
+    path_offsets = np.array(path_offsets)
+    keep = np.diff(path_offsets) > 0
+    offsets = np.concatenate([[0], path_offsets[1:][keep]])
+    flags = np.array(flags, dtype=np.uint8)[keep]
+    vertices = np.concatenate(pieces)
+    if not curved:
+        return Toolpath(vertices, offsets, flags)
+    return Toolpath(vertices, offsets, flags, np.concatenate(kinds),
+                    np.concatenate([np.zeros((len(k), 4)) if a is None else a for k, a in zip(kinds, aux)]))
+
 # def svg_to_coordinate_chomper(inp, yield_control=False, PRECISION=5, verbose=False):
 #     prev = None
 #     print(inp)
@@ -376,14 +763,12 @@ def repart(inp):
             yield p
 
 
-def path_to_segment_blocks(shape_paths, precision=5):
+def path_to_segment_blocks(shape_paths, precision=5, tolerance=None):
     for i, path in enumerate(shape_paths):
-        coordinates = []
-        for (x, y) in path_to_cordinate_chomper(shape_path=path['paths'], PRECISION=precision):
-            coordinates.append([x, y])
+        coordinates = path_to_coordinate_array(path['paths'], PRECISION=precision, TOLERANCE=tolerance)
         # print(coordinates)
         if len(coordinates) > 0:
-            yield np.array(list(coordinates_to_segments(coordinates)))
+            yield coordinates_to_segment_array(coordinates)
 
 
 def svg_to_segment_blocks(svg_path, precision=5):
@@ -392,17 +777,16 @@ def svg_to_segment_blocks(svg_path, precision=5):
     root = tree.getroot()
     for i, path in enumerate(root.findall('.//sn:path', ns)):
         # Parse the path in d:
-        d = path.attrib['d'].replace(',', ' ')
-        parts = d.split()
         coordinates = []
 
-        for (x, y), c in svg_to_coordinate_chomper(inp=repart(parts), PRECISION=precision):
-            #print(x)
-
-            coordinates.append([x, y])
+        for coord in svg_to_coordinate_chomper(tokenize_path(path.attrib['d']), PRECISION=precision):
+            if coord == 'UP':
+                coordinates.append([np.nan, np.nan])
+            elif coord not in ('DOWN', 'Z'):
+                coordinates.append(coord)
 
         if len(coordinates) > 0:
-            yield np.array(list(coordinates_to_segments(coordinates)))
+            yield coordinates_to_segment_array(coordinates)
 
 
 def coordinates_to_segments(coordinates):
@@ -427,3 +811,16 @@ def coordinates_to_segments(coordinates):
                 # Dont write duplicate coordinates. Waste of space
                 pass
             prev = current
+
+
+#coordinates_to_segment_array: Vectorized coordinates_to_segments, returns the (K,2,2) segment array directly.
+def coordinates_to_segment_array(coordinates):
+    coordinates = np.asarray(coordinates, dtype=float)
+    # Drop consecutive duplicates (NaN rows never compare equal, so pen ups are kept)
+    keep = np.ones(len(coordinates), dtype=bool)
+    keep[1:] = np.any(coordinates[1:] != coordinates[:-1], axis=1)
+    coordinates = coordinates[keep]
+    # A segment joins two consecutive pen-down coordinates
+    valid = ~np.isnan(coordinates[:, 0])
+    pairs = valid[:-1] & valid[1:]
+    return np.stack([coordinates[:-1][pairs], coordinates[1:][pairs]], axis=1)
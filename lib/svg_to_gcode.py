@@ -13,13 +13,22 @@ import numpy as np
 import sys
 import serial
 import re
+import math
+import time
 import svgpathtools
 
 
 from copy import copy
-from .svg_interpreter import svg_to_coordinate_chomper, repart, svg_to_segment_blocks, path_to_cordinate_chomper, path_to_segment_blocks
-from .raycaster import cast_rays
-from .pydexarm import Dexarm
+from more_itertools import chunked
+from .svg_interpreter import svg_to_coordinate_chomper, svg_to_toolpath, tokenize_path, repart, path_to_cordinate_chomper, path_to_coordinate_array
+from .raycaster import cast_rays, hatch_fill
+from .simplify import simplify_polyline
+from .spatial import PointGrid
+from .toolpath import Toolpath, LINE, ARC, FILL
+from .gcode_writer import format_moves, write_gcode
+from .job_file import write_job, read_job, SVG_JOB, CANVAS_JOB
+from .transform import translation, scaling, compose, apply_affine, linear_scale, is_mirrored, is_similarity, svg_transforms
+from .arm_session import get_session
 
 
 
@@ -30,12 +39,15 @@ from .pydexarm import Dexarm
 port = "COM5"
 #mac_port = "/dev/tty.usbmodem305A366030311"
 mac_port = "COM5"
+FIXED_PRECISION = 3  # decimals of the G2 / G3 / G5 words when no coordinate_precision is set
 
 ##########################################################################################
 # Helper Functions   (optimization and shit)
 ##########################################################################################
 
 #get_optimal_scaler: This function calculates the optimal scaling factor for an image to fit onto a print bed. It considers the aspect ratios of the image and the print bed.
+# f(s) = (X - a*s)^2 + (Y - b*s)^2 is a parabola in the scaler s, so its minimum is solved directly and then clamped to
+# keep the image on the bed (X - a*s >= 0, Y - b*s >= 0) with s in [0, 1].
 def get_optimal_scaler(bed_size_x: int, bed_size_y: int, im_length_x: int, im_length_y: int, longest_edge: float):
     X = bed_size_x
     Y = bed_size_y
@@ -43,12 +55,14 @@ def get_optimal_scaler(bed_size_x: int, bed_size_y: int, im_length_x: int, im_le
     b = im_length_y
     # if the aspect ratio of the image and the print bed are similar...
     if ((X/Y)-1)*((a/b)-1) >= 0:
-        S = np.linspace(0, 1, 10000)
-        # obtained from the derivative of f(s) = ((X - a*s)^2 + (Y - b*s)^2) where s is the scaler
-        dfds = np.array([-2*a*(X-s*a) - 2*b*(Y-s*b) for s in S])
-        condition = np.array([(Y - s*b) >= 0 and (X - s*a) >= 0 for s in S])
-        scaler_idx = np.argmin(np.abs(dfds)[condition])
-        scaler = S[scaler_idx]
+        # df/ds = -2*a*(X-s*a) - 2*b*(Y-s*b) = 0
+        scaler = (a*X + b*Y) / (a*a + b*b)
+        limits = [1.0]
+        if a > 0:
+            limits.append(X/a)
+        if b > 0:
+            limits.append(Y/b)
+        scaler = max(0.0, min(scaler, *limits))
     else:
         scale_x = longest_edge/im_length_x
         scale_y = longest_edge/im_length_y
@@ -60,40 +74,317 @@ def get_pass_list(z_surface: float, z_bottom: float, passes: int) -> list:
     return np.linspace(z_surface, z_bottom, passes).tolist()
 
 #get_optimal_ordering: This function determines the optimal ordering of blocks for some process.
+# Greedy nearest neighbour: starting with the last block, always continue with the block whose start is closest to the
+# current end. Block starts live in a PointGrid, so every pick is a grid lookup instead of a scan of all blocks.
 def get_optimal_ordering(blockset):
-    remaining_blocks = copy(blockset)
+    if len(blockset) == 0:
+        return
+    starts = np.array([block[-1][0][0] for block in blockset], dtype=float)
+    ends = np.array([block[-1][-1][1] for block in blockset], dtype=float)
+    for current in nearest_neighbour_order(starts, ends):
+        yield blockset[current][-1]
+
+#nearest_neighbour_order: Greedy tour over paths given by their start and end points: starting with the last path,
+# always continue with the path starting closest to where the previous one ended. Returns the path indices.
+def nearest_neighbour_order(starts, ends):
+    n = len(starts)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+    grid = PointGrid(starts)
+
+    current = n - 1
+    grid.remove(current)
+    order = [current]
+
+    while len(grid) > 0:
+        current, _ = grid.nearest(ends[current])
+        grid.remove(current)
+        order.append(current)
+    return np.array(order, dtype=np.intp)
+
+
+#path_travel: Total pen-up travel when drawing paths in order, flipped paths being drawn from their end.
+def path_travel(starts, ends, order, flipped=None):
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    order = np.asarray(order, dtype=np.intp)
+    if len(order) < 2:
+        return 0.0
+    flipped = np.zeros(len(order), dtype=bool) if flipped is None else np.asarray(flipped, dtype=bool)
+    entry = np.where(flipped[:, None], ends[order], starts[order])
+    exit = np.where(flipped[:, None], starts[order], ends[order])
+    return float(np.sum(np.hypot(*(entry[1:] - exit[:-1]).T)))
+
+#greedy_reversible_order: Nearest neighbour tour that may enter a reversible path at its end. Like
+# get_optimal_ordering it starts with the last path. Returns the order and, per position, whether the path is flipped.
+def greedy_reversible_order(starts, ends, reversible):
+    n = len(starts)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=bool)
+    # Entries 0..n-1 are path starts, n..2n-1 path ends (entering there draws the path reversed)
+    grid = PointGrid(np.vstack([starts, ends]))
+    for i in np.flatnonzero(~reversible):
+        grid.remove(n + i)
+    order = [n - 1]
+    flipped = [False]
+    grid.remove(n - 1)
+    grid.remove(2 * n - 1)
+    while len(grid) > 0:
+        end = starts[order[-1]] if flipped[-1] else ends[order[-1]]
+        entry, _ = grid.nearest(end)
+        path = entry % n
+        grid.remove(path)
+        grid.remove(n + path)
+        order.append(path)
+        flipped.append(entry >= n)
+    return np.array(order, dtype=np.intp), np.array(flipped, dtype=bool)
+
+#improve_order: Time bounded 2-opt / Or-opt refinement of a path tour, minimizing pen-up travel.
+# 2-opt reverses a stretch of the tour (which flips every path in it, so only stretches of reversible paths qualify),
+# Or-opt moves a single path elsewhere, flipped if that is shorter and allowed. All candidate positions for one move
+# are evaluated in one numpy expression; passes repeat until nothing improves or time_limit seconds have passed.
+def improve_order(starts, ends, reversible, order, flipped, time_limit=0.5):
+    order = np.array(order, dtype=np.intp)
+    flipped = np.array(flipped, dtype=bool)
+    n = len(order)
+    if n < 3 or time_limit <= 0:
+        return order, flipped
+    deadline = time.monotonic() + time_limit
+    eps = 1e-9
+
+    def dist(a, b):
+        return np.hypot(a[..., 0] - b[..., 0], a[..., 1] - b[..., 1])
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+
+        # 2-opt: reverse positions i+1..j
+        for i in range(n - 2):
+            if time.monotonic() >= deadline:
+                break
+            entry = np.where(flipped[:, None], ends[order], starts[order])
+            exit = np.where(flipped[:, None], starts[order], ends[order])
+            rev = reversible[order]
+            # The stretch may only reach up to the first non reversible path after i
+            fixed = np.flatnonzero(~rev[i + 1:])
+            last = n - 1 if len(fixed) == 0 else i + fixed[0]
+            if last <= i + 1:
+                continue
+            j = np.arange(i + 2, last + 1)
+            before = dist(exit[i], entry[i + 1]) + np.where(j < n - 1, dist(exit[j], entry[np.minimum(j + 1, n - 1)]), 0)
+            after = dist(exit[i], exit[j]) + np.where(j < n - 1, dist(entry[i + 1], entry[np.minimum(j + 1, n - 1)]), 0)
+            k = int(np.argmin(after - before))
+            if after[k] - before[k] < -eps:
+                jk = j[k]
+                order[i + 1:jk + 1] = order[i + 1:jk + 1][::-1].copy()
+                flipped[i + 1:jk + 1] = ~flipped[i + 1:jk + 1][::-1]
+                improved = True
+
+        # Or-opt: move the path at position k between positions m and m+1
+        for k in range(1, n):
+            if time.monotonic() >= deadline:
+                break
+            entry = np.where(flipped[:, None], ends[order], starts[order])
+            exit = np.where(flipped[:, None], starts[order], ends[order])
+            removed = dist(exit[k - 1], entry[k])
+            if k < n - 1:
+                removed = removed + dist(exit[k], entry[k + 1]) - dist(exit[k - 1], entry[k + 1])
+            keep = np.ones(n, dtype=bool)
+            keep[k] = False
+            rest_entry, rest_exit = entry[keep], exit[keep]
+            m = np.arange(n - 1)
+            nxt = np.minimum(m + 1, n - 2)
+            has_next = m < n - 2
+            best_delta, best = -eps, None
+            options = [(entry[k], exit[k], flipped[k])]
+            if reversible[order[k]]:
+                options.append((exit[k], entry[k], not flipped[k]))
+            for p_entry, p_exit, p_flipped in options:
+                added = dist(rest_exit[m], p_entry) + np.where(
+                    has_next, dist(p_exit, rest_entry[nxt]) - dist(rest_exit[m], rest_entry[nxt]), 0)
+                delta = added - removed
+                if p_flipped == flipped[k]:
+                    # Reinserting unflipped at its own place is not a move
+                    delta[k - 1] = np.inf
+                mi = int(np.argmin(delta))
+                if delta[mi] < best_delta:
+                    best_delta, best = delta[mi], (mi, p_flipped)
+            if best is not None:
+                mi, p_flipped = best
+                path = order[k]
+                order = np.insert(np.delete(order, k), mi + 1, path)
+                flipped = np.insert(np.delete(flipped, k), mi + 1, p_flipped)
+                improved = True
+    return order, flipped
+
+#optimize_order: Reorder (and, where allowed, reverse) paths given by their start and end points to minimize pen-up
+# travel. Closed paths are never reversed, improve_time seconds of 2-opt / Or-opt follow the greedy tour.
+# Returns the order, which paths are flipped and the pen-up travel before / after.
+def optimize_order(starts, ends, reverse=True, improve_time=0.5):
+    reversible = np.any(starts != ends, axis=1) if reverse else np.zeros(len(starts), dtype=bool)
+    travel_before = path_travel(starts, ends, np.arange(len(starts)))
+    order, flipped = greedy_reversible_order(starts, ends, reversible)
+    order, flipped = improve_order(starts, ends, reversible, order, flipped, improve_time)
+    travel_after = path_travel(starts, ends, order, flipped)
+    return order, flipped, travel_before, travel_after
+
+#circumcenter: Center of the circle through three points, None when they are (nearly) collinear.
+def circumcenter(p0, p1, p2):
+    (ax, ay), (bx, by), (cx, cy) = p0, p1, p2
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    return np.array([(a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d,
+                     (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d])
+
+#fit_arc: Check whether a run of points lies on one circular arc within tolerance, returns (center, ccw) or None.
+# The points must all lie within tolerance of the circle, turn consistently, cover less than a full turn, and the arc
+# between consecutive points may not bulge out of the chord by more than the tolerance.
+def fit_arc(run, tolerance, max_radius=1000):
+    center = circumcenter(run[0], run[len(run) // 2], run[-1])
+    if center is None:
+        return None
+    radius = np.hypot(*(run[0] - center))
+    if radius > max_radius:
+        return None
+    if np.max(np.abs(np.hypot(run[:, 0] - center[0], run[:, 1] - center[1]) - radius)) > tolerance:
+        return None
+    chords = np.diff(run, axis=0)
+    turns = chords[:-1, 0] * chords[1:, 1] - chords[:-1, 1] * chords[1:, 0]
+    if not (np.all(turns > 0) or np.all(turns < 0)):
+        return None
+    half = np.hypot(chords[:, 0], chords[:, 1]) / 2
+    if np.any(half > radius) or np.max(radius - np.sqrt(radius ** 2 - half ** 2)) > tolerance:
+        return None
+    if np.sum(2 * np.arcsin(half / radius)) >= 2 * np.pi - 1e-6:
+        return None
+    return center, bool(turns[0] > 0)
+
+#fit_arcs: Greedily cover a polyline with arcs. points[0] is the current position, returns the moves for points[1:]
+# as ('G1', end) and ('ARC', end, center, ccw) tuples. Runs are grown by doubling and then bisected, so long arcs
+# cost O(log n) fits instead of one per point.
+def fit_arcs(points, tolerance, min_points=4, max_radius=1000):
+    pts = np.asarray(points, dtype=float)
+    n = len(pts)
+    moves = []
     i = 0
-
-    current_block = remaining_blocks.pop()
-    yield current_block[-1]
-
-    while len(remaining_blocks) > 0:
-        # find nearest block
-        if len(remaining_blocks) == 0:
-            return
-        end = current_block[-1][-1][1]
-
-        best = None
-        best_dist = None
-        best_idx = None
-
-        for j, rblock in enumerate(remaining_blocks):
-
-            (xstart, ystart) = rblock[-1][0][0]
-
-            dist = np.sqrt(np.power(xstart-end[0], 2) +
-                           np.power(ystart-end[1], 2))
-            # print(dist)
-            if best is None or dist < best_dist:
-                best = rblock
-                best_dist = dist
-                best_idx = j
-
-        print('next best block is ', best_idx, best_dist)
-        current_block = best
-
-        yield best[-1]
-        remaining_blocks.pop(best_idx)
+    while i < n - 1:
+        good, good_fit = None, None
+        step = min_points - 1
+        bad = None
+        while True:
+            j = min(i + step, n - 1)
+            if j - i + 1 < min_points:
+                break
+            fit = fit_arc(pts[i:j + 1], tolerance, max_radius)
+            if fit is None:
+                bad = j
+                break
+            good, good_fit = j, fit
+            if j == n - 1:
+                break
+            step *= 2
+        if good is not None and bad is not None:
+            while bad - good > 1:
+                mid = (good + bad) // 2
+                fit = fit_arc(pts[i:mid + 1], tolerance, max_radius)
+                if fit is None:
+                    bad = mid
+                else:
+                    good, good_fit = mid, fit
+        if good is None:
+            moves.append(('G1', pts[i + 1].tolist()))
+            i += 1
+        else:
+            moves.append(('ARC', pts[good].tolist(), good_fit[0].tolist(), good_fit[1]))
+            i = good
+    return moves
+
+#format_compact: A quantized value (an integer count of resolution steps) with trailing zeros, a leading zero and the
+# sign of zero stripped, e.g. 50 steps of 0.01 -> '.5'.
+def format_compact(steps, resolution, decimals):
+    text = f'{steps * resolution:.{decimals}f}'
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    if text.startswith('0.'):
+        text = text[1:]
+    elif text.startswith('-0.'):
+        text = '-' + text[2:]
+    return '0' if text in ('', '-', '-0') else text
+
+
+_GCODE_WORD_RE = re.compile(r'([A-Za-z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+_MOTION_CODES = {'G0', 'G1', 'G2', 'G3', 'G5'}
+_MODE_CODES = {'G20', 'G21', 'G90', 'G91'}
+
+#compact_gcode: Re-encode gcode lines with as few bytes as possible for the serial link, without changing what the arm
+# does. Coordinates are quantized to resolution (mm) and written without redundant zeros. In absolute mode (G90) axes
+# that don't change are dropped, in relative mode (G91) axes that don't move, the rounding error being carried over
+# to the next move so it never adds up. Feedrates equal to the current one are dropped (Marlin keeps one feedrate for
+# all its moves, G0 included), and so are G0/G1 moves that are left with nothing to do. G words are kept on every
+# line, Marlin has no modal motion. Lines it can't parse pass through as they are and make it forget the position and
+# feedrate. stat(key, bytes) is called with the bytes of
+# every line before / after, newline included.
+def compact_gcode(lines, resolution=0.01, stat=None):
+    decimals = max(0, math.ceil(-math.log10(resolution) - 1e-9))
+    relative = False
+    target = {}  # exact position the job asked for, in relative mode
+    sent = {}  # position (in resolution steps) the arm was sent to
+    feed = None
+    for line in lines:
+        text = line.strip()
+        end = '\n' if line.endswith('\n') else ''
+        words = _GCODE_WORD_RE.findall(text)
+        out = text
+        if words and ''.join(letter + value for letter, value in words) == ''.join(text.split()):
+            codes = [f'{letter.upper()}{float(value):g}' for letter, value in words if letter.upper() in 'GM']
+            if len(codes) == 1 and codes[0] in _MOTION_CODES and words[0][0].upper() == 'G':
+                code = codes[0]
+                parts = [code]
+                for letter, value in words[1:]:
+                    letter, value = letter.upper(), float(value)
+                    if letter in 'XYZE':
+                        if relative:
+                            target[letter] = target.get(letter, 0.0) + value
+                            steps = round(target[letter] / resolution) - sent.get(letter, 0)
+                            sent[letter] = sent.get(letter, 0) + steps
+                            if steps == 0 and code in ('G0', 'G1'):
+                                continue
+                        else:
+                            steps = round(value / resolution)
+                            if sent.get(letter) == steps and code in ('G0', 'G1'):
+                                continue
+                            sent[letter] = steps
+                        parts.append(letter + format_compact(steps, resolution, decimals))
+                    elif letter == 'F':
+                        if feed == value:
+                            continue
+                        feed = value
+                        parts.append(f'F{value:g}')
+                    else:
+                        parts.append(letter + format_compact(round(value / resolution), resolution, decimals))
+                if len(parts) == 1 and code in ('G0', 'G1'):
+                    out = None
+                else:
+                    out = ' '.join(parts)
+            elif codes and all(code in _MODE_CODES for code in codes):
+                for code in codes:
+                    if code in ('G90', 'G91'):
+                        relative = code == 'G91'
+                        target, sent = {}, {}
+            else:
+                # Homing, G92 and machine commands can move the arm, forget where it is
+                target, sent = {}, {}
+        elif words:
+            target, sent, feed = {}, {}, None
+        if stat is not None:
+            stat('gcode_bytes_before', len(text) + 1)
+        if out is not None:
+            if stat is not None:
+                stat('gcode_bytes_after', len(out) + 1)
+            yield out + end
 
 
 ##########################################################################################
@@ -108,6 +399,23 @@ class SVG_GCode:
     def __init__(
         self,
         precision=10,  # precision of curves
+        tolerance=None,  # max chordal deviation of flattened curves in bed mm, overrides precision when set
+        arc_tolerance=None,  # emit G2/G3 arcs for curves that are circular within this many bed mm, None for G1 only
+        g5=False,  # pass cubic bezier segments through as Marlin G5 moves instead of flattening them
+        g5_tolerance=0.01,  # bed mm a quadratic / arc may move when converted to a G5 cubic, else it is flattened
+        simplify_tolerance=None,  # drop polyline points within this many bed mm of the simplified line, None to keep all
+        simplify_method='rdp',  # 'rdp' (Ramer-Douglas-Peucker) or 'visvalingam'
+        reverse_paths=False,  # allow open paths to be drawn backwards when ordering
+        ordering_time=0,  # seconds of 2-opt / Or-opt refinement of the path order, 0 for greedy only
+        merge_tolerance=None,  # join svg strokes whose endpoints are within this many bed mm, None to keep them apart
+        fill_spacing=None,  # hatch the inside of svg paths with lines this many bed mm apart, None for no fill
+        fill_serpentine=True,  # alternate hatch direction and link neighbouring hatches without lifting the pen
+        fill_angles=(0,),  # hatch angles in degrees (0 is along x), several angles for a cross-hatch
+        fill_min_length=0,  # don't fill with hatches shorter than this many bed mm
+        coordinate_precision=None,  # decimals of the svg_to_gcode coordinates, None for the full float repr
+        compact_gcode=False,  # encode the job with as few bytes as possible for the serial link, see compact_gcode
+        gcode_resolution=0.01,  # mm the arm can resolve, compact_gcode quantizes coordinates to it
+        stream_window=None,  # order canvas paths in windows of this many paths so streaming memory stays bounded, None orders all at once
         z_feedrate=4000,
         x_offset=50,
         y_offset=50,
@@ -121,9 +429,28 @@ class SVG_GCode:
         canvas_height=668,  # pixels
         verbose=False,
         fit_canvas=False,
-        debug=False
+        debug=False,
+        svg_units_per_mm=80,  # svg_to_gcode divides svg coordinates by this
+        apply_svg_transforms=False,  # apply the transform attributes of svg groups and shapes, off by default as svg_units_per_mm is tuned for potrace output without them
     ):
         self.precision = precision
+        self.tolerance = tolerance
+        self.arc_tolerance = arc_tolerance
+        self.g5 = g5
+        self.g5_tolerance = g5_tolerance
+        self.simplify_tolerance = simplify_tolerance
+        self.simplify_method = simplify_method
+        self.reverse_paths = reverse_paths
+        self.ordering_time = ordering_time
+        self.merge_tolerance = merge_tolerance
+        self.fill_spacing = fill_spacing
+        self.fill_serpentine = fill_serpentine
+        self.fill_angles = fill_angles
+        self.fill_min_length = fill_min_length
+        self.coordinate_precision = coordinate_precision
+        self.compact_gcode = compact_gcode
+        self.gcode_resolution = gcode_resolution
+        self.stream_window = stream_window
         self.z_feedrate = z_feedrate
         self.x_offset = x_offset
         self.y_offset = y_offset
@@ -138,6 +465,9 @@ class SVG_GCode:
         self.verbose = verbose
         self.fit_canvas = fit_canvas
         self.debug = debug
+        self.svg_units_per_mm = svg_units_per_mm
+        self.apply_svg_transforms = apply_svg_transforms
+        self.job_stats = {}  # counters of the last conversion, see report_job_stats
 
     # def svg_to_paths(self, svg_path):
     #     tree = et.parse(svg_path)
@@ -222,37 +552,72 @@ class SVG_GCode:
 
     #     return max_x, min_x, max_y, min_y, scaler
 
-    #new helper function to handle current_pos
+    #parse_path: Tokenize a path's d attribute (string, or svgpathtools Path) into typed (command, args) arrays.
     def parse_path(self, path):
-        #print(f"Debug: Parsing path data: {path_data}")
-        path_data = path.d()  # Convert Path object to string
-        path_data = re.findall(r'[MmLlHhVvCcSsQqTtAaZz]|-?\d*\.?\d+|-?\.\d+', path_data)
-        #print(f"Debug: Parsed path data: {path_data}")
-        path_commands = []
-        i = 0
-        while i < len(path_data):
-            cmd = path_data[i]
-            if cmd in 'MmLlHhVvCcSsQqTtAaZz':
-                command = [cmd]
-                i += 1
-                while i < len(path_data) and path_data[i] not in 'MmLlHhVvCcSsQqTtAaZz':
-                    command.append(path_data[i])
-                    i += 1
-                path_commands.append(command)
-            else:
-                i += 1
-        return path_commands
+        path_data = path if isinstance(path, str) else path.d()
+        return tokenize_path(path_data)
 
+    #svg_to_path_data: The raw d attribute of every path in the SVG file, falling back to svgpathtools' d() for
+    # shapes (polyline, rect, circle...) which svg2paths converted to paths.
+    def svg_to_path_data(self, svg_file):
+        paths, attributes = svgpathtools.svg2paths(svg_file)
+        return [attribute.get('d') or path.d() for path, attribute in zip(paths, attributes)]
+
+    #svg_to_path_transforms: The svg transform of each of the count paths of svg_to_path_data (None for every path
+    # without apply_svg_transforms). Raises ValueError when the svg's shape elements don't line up with those paths.
+    def svg_to_path_transforms(self, svg_file, count):
+        if not self.apply_svg_transforms:
+            return [None] * count
+        transforms = svg_transforms(svg_file)
+        if len(transforms) != count:
+            raise ValueError(f'{svg_file} has {len(transforms)} shape elements with transforms but {count} paths')
+        return transforms
+
+    #bed_to_input_units: A length in bed millimetres expressed in input units, given the mm per unit scale of the output.
+    def bed_to_input_units(self, value, scale):
+        if value is None:
+            return None
+        if scale is None or scale == 0:
+            return value
+        return value / scale
+
+    #curve_tolerance: The flattening tolerance in input units.
+    def curve_tolerance(self, scale):
+        return self.bed_to_input_units(self.tolerance, scale)
+
+##########################################################################################
+# Job Statistics
+##########################################################################################
+
+    #encode_gcode: Run the job through compact_gcode when enabled, adding its byte counts to the job stats.
+    def encode_gcode(self, lines):
+        if not self.compact_gcode:
+            return lines
+        return compact_gcode(lines, self.gcode_resolution, stat=self.add_job_stat)
+
+    def add_job_stat(self, key, value):
+        self.job_stats[key] = self.job_stats.get(key, 0) + value
+
+    def report_job_stats(self):
+        if self.job_stats:
+            print('Job stats: ' + ', '.join(f'{key}={value:g}' for key, value in self.job_stats.items()))
+        return self.job_stats
 
 
     #new code that works with current_pos
     def svg_to_coordinates(self, paths):
-        all_coordinates = []
+        return list(self.iter_svg_coordinates(paths))
+
+    #iter_svg_coordinates: The chomped coordinates of one path at a time, see svg_to_coordinates.
+    def iter_svg_coordinates(self, paths):
+        tolerance = self.curve_tolerance(1 / self.svg_units_per_mm)
+        arc_tolerance = None if self.arc_tolerance is None else self.arc_tolerance * self.svg_units_per_mm
+        cubic_tolerance = self.g5_tolerance * self.svg_units_per_mm if self.g5 else None
         for path in paths:
             commands = self.parse_path(path)
             coordinates = []
             
-            for coord in svg_to_coordinate_chomper(commands, PRECISION=self.precision, verbose=self.verbose):
+            for coord in svg_to_coordinate_chomper(commands, PRECISION=self.precision, verbose=self.verbose, TOLERANCE=tolerance, ARC_TOLERANCE=arc_tolerance, CUBIC_TOLERANCE=cubic_tolerance):
                 #print(f" _svg_to_coordinates_ post chomp: {coord}")
                 if coord == 'UP':
                     coordinates.append('UP')
@@ -260,8 +625,43 @@ class SVG_GCode:
                     coordinates.append('DOWN')
                 else:
                     coordinates.append(coord)
-            all_coordinates.append(coordinates)
-        return all_coordinates
+            yield coordinates
+
+
+    #svg_to_toolpath: A path's d attribute as a Toolpath in bed mm, one path per subpath. transform is the path's svg
+    # transform, if any. Circular arcs only stay arcs if the transform keeps them circular.
+    def svg_to_toolpath(self, path, transform=None):
+        matrix = self.svg_bed_matrix() if transform is None else self.svg_bed_matrix() @ transform
+        scale = linear_scale(matrix)
+        tolerance = self.curve_tolerance(scale)
+        arc_tolerance = self.bed_to_input_units(self.arc_tolerance, scale) if is_similarity(matrix) else None
+        cubic_tolerance = self.bed_to_input_units(self.g5_tolerance, scale) if self.g5 else None
+        toolpath = svg_to_toolpath(self.parse_path(path), PRECISION=self.precision, TOLERANCE=tolerance,
+                                   ARC_TOLERANCE=arc_tolerance, CUBIC_TOLERANCE=cubic_tolerance)
+        return toolpath.map_points(lambda coords: self.svg_to_bed(coords, transform), mirrored=is_mirrored(matrix))
+
+    #svg_to_fill_toolpath: Hatches filling a path at every fill angle, in bed mm. Every subpath is taken as a closed
+    # ring and the rings are filled even-odd, so holes stay empty. The hatching is done in (transformed) svg units and
+    # only the hatches are mapped to the bed, which is a uniform scale so the spacing is the same either way.
+    def svg_to_fill_toolpath(self, path, transform=None):
+        matrix = self.svg_bed_matrix() if transform is None else self.svg_bed_matrix() @ transform
+        tolerance = self.curve_tolerance(linear_scale(matrix))
+        rings = svg_to_toolpath(self.parse_path(path), PRECISION=self.precision, TOLERANCE=tolerance)
+        rings = rings.take(np.flatnonzero(rings.lengths >= 3))
+        if len(rings) == 0:
+            return Toolpath.empty()
+        coords = rings.coords if transform is None else apply_affine(transform, rings.coords)
+        # Every vertex joined to the next one, the last vertex of a ring to its first
+        following = np.arange(1, rings.vertex_count + 1)
+        following[rings.offsets[1:] - 1] = rings.offsets[:-1]
+        segarr = np.stack([coords, coords[following]], axis=1)
+        polylines = hatch_fill(segarr, self.fill_spacing * self.svg_units_per_mm, angles=self.fill_angles,
+                               serpentine=self.fill_serpentine,
+                               min_length=self.fill_min_length * self.svg_units_per_mm)
+        fill = Toolpath.from_polylines(polylines, flags=FILL).map_points(self.svg_to_bed)
+        self.add_job_stat('fill_hatches', int(np.sum(fill.lengths // 2)))
+        self.add_job_stat('fill_strokes', len(fill))
+        return fill
 
 
     def path_to_coordinates(self, paths):
@@ -282,11 +682,14 @@ class SVG_GCode:
 
         scaler = None
         if self.longest_edge is not None:
-            scaler = get_optimal_scaler(
-                self.bed_size_x, self.bed_size_y, max_x - min_x, max_y - min_y, self.longest_edge)
+            scaler = self.optimal_scaler(max_x - min_x, max_y - min_y)
 
         return max_x, min_x, max_y, min_y, scaler
 
+    #optimal_scaler: Scale of an image of the given size on this bed, see get_optimal_scaler.
+    def optimal_scaler(self, im_length_x, im_length_y):
+        return get_optimal_scaler(self.bed_size_x, self.bed_size_y, im_length_x, im_length_y, self.longest_edge)
+
     def fit_to_canvas_coordinates(self, coordinates, max_x, min_x, max_y, min_y):
         if self.fit_canvas:
             bot = np.nanmin(coordinates[:, 0])
@@ -351,9 +754,43 @@ class SVG_GCode:
 
     def plot_to_file(self, data, gcode_path):
         print(f"Writing to {gcode_path}")
-        o = open(gcode_path, 'w')
-        for line in data:
-            o.write(f'{line}\n')
+        return write_gcode(data, gcode_path)
+
+
+##########################################################################################
+# Compiled Jobs
+##########################################################################################
+
+    #compile_svg: Convert an svg file as svg_to_gcode does, but save its bed toolpaths as a compiled job (see
+    # job_file) to be drawn again with iter_job_gcode. Returns the number of bytes written.
+    def compile_svg(self, svg_file, job_path):
+        self.job_stats = {}
+        path_data = self.svg_to_path_data(svg_file)
+        transforms = self.svg_to_path_transforms(svg_file, len(path_data))
+        written = write_job(job_path, self.iter_svg_toolpaths(path_data, transforms), SVG_JOB)
+        self.report_job_stats()
+        return written
+
+    #compile_paths: compile_svg for canvas paths, see path_to_gcode.
+    def compile_paths(self, paths, job_path):
+        self.job_stats = {}
+        written = write_job(job_path, self.iter_path_bed_toolpaths(paths), CANVAS_JOB)
+        self.report_job_stats()
+        return written
+
+    #iter_job_gcode: The gcode of a compiled job, emitted from the memory mapped file with this converter's output
+    # settings (z offsets, simplification, arcs, precision, compact_gcode).
+    def iter_job_gcode(self, job_path):
+        return self.encode_gcode(self.iter_job_lines(job_path))
+
+    #iter_job_lines: The plain gcode lines of iter_job_gcode, before encoding.
+    def iter_job_lines(self, job_path):
+        self.job_stats = {}
+        with read_job(job_path) as job:
+            if job.kind == CANVAS_JOB:
+                yield from self.canvas_toolpath_lines(job.groups())
+            else:
+                yield from self.svg_toolpath_lines(job.groups())
 
 
 ##########################################################################################
@@ -363,18 +800,135 @@ class SVG_GCode:
     # G92.1  (Reset Cordinate Command)
     # G92 X0 Y300 Z0 E0 (Set current position as Work Height)
 
-    def plot_to_draw(self, data):
-        arm = Dexarm(port=mac_port)
-        x, y, z, e, a, b, c = arm.get_current_position()
+    # The arm's session keeps its port open, so consecutive jobs start without reconnecting
+    def plot_to_draw(self, data, port=mac_port):
+        session = get_session(port)
+        x, y, z, e, a, b, c = session.current_position()
         message = "x: {}, y: {}, z: {}, e: {}\na: {}, b: {}, c: {}".format(
             x, y, z, e, a, b, c)
         print(f'--> Robot Connected on {port} with {message}')
-        for line in data:
-            calibrated_line = line.replace("Z0", f"Z{self.z_surface_touch}")
-            arm._send_cmd(f'{calibrated_line}\r')
-        arm.close()
+        session.stream(line.replace("Z0", f"Z{self.z_surface_touch}") for line in data)
 
 
+##########################################################################################
+# Moves to Gcode
+##########################################################################################
+
+    #svg_bed_matrix: svg units to bed millimetres, the way svg_to_gcode always has mapped them.
+    def svg_bed_matrix(self):
+        return compose(translation(0, 250), scaling(1 / self.svg_units_per_mm))
+
+    #svg_to_bed: Map (N,2) svg coordinates to bed millimetres, through the svg transform first when given. The bed
+    # mapping divides by svg_units_per_mm instead of multiplying with the matrix's 1 / svg_units_per_mm, so the
+    # coordinates come out exactly as svg_to_gcode always wrote them.
+    def svg_to_bed(self, coords, transform=None):
+        if transform is not None:
+            coords = apply_affine(transform, coords)
+        return np.column_stack([coords[:, 0] / self.svg_units_per_mm, (coords[:, 1] / self.svg_units_per_mm) + 250])
+
+    #canvas_bed_matrix: Canvas coordinates to bed millimetres. With longest_edge set the drawing's bounding box is
+    # scaled onto the bed and flipped to y up (see calculate_coordinates), then the offsets are added.
+    def canvas_bed_matrix(self, max_x, min_x, max_y, min_y, scaler):
+        offsets = translation(self.x_offset, self.y_offset)
+        if self.longest_edge is None:
+            return offsets
+        return compose(offsets, scaling(scaler, -scaler), translation(-min_x, -max_y))
+
+    #format_coordinate: A coordinate as written to the gcode, at coordinate_precision decimals when set, otherwise its
+    # shortest repr, written out in positional notation: the firmware stops reading a number at the 'e' of 6.25e-05.
+    def format_coordinate(self, value):
+        if self.coordinate_precision is None:
+            text = f'{value}'
+            return text if 'e' not in text else np.format_float_positional(value, trim='0')
+        return f'{value:.{self.coordinate_precision}f}'
+
+    #format_fixed: A value at coordinate_precision decimals, FIXED_PRECISION when that is None. Arc and cubic words are
+    # always written like this, their offsets are differences that come out as e.g. 5.55e-17 instead of 0.
+    def format_fixed(self, value):
+        precision = FIXED_PRECISION if self.coordinate_precision is None else self.coordinate_precision
+        return f'{value:.{precision}f}'
+
+    #arc_to_gcode: G2 (clockwise) / G3 (counter clockwise) move from position, I J being the center offset.
+    def arc_to_gcode(self, position, end, center, ccw):
+        x, y, i, j = map(self.format_fixed, (end[0], end[1], center[0] - position[0], center[1] - position[1]))
+        return f'{"G3" if ccw else "G2"} X{x} Y{y} I{i} J{j}\n'
+
+    #cubic_to_gcode: G5 cubic bezier from position, I J / P Q being the control points relative to the start / end.
+    def cubic_to_gcode(self, position, end, control1, control2):
+        i, j, p, q, x, y = map(self.format_fixed, (control1[0] - position[0], control1[1] - position[1],
+                                                   control2[0] - end[0], control2[1] - end[1], end[0], end[1]))
+        return f'G5 I{i} J{j} P{p} Q{q} X{x} Y{y}\n'
+
+    #simplify_points: Simplify a pen-down run (bed mm) starting at position, counting the points removed.
+    def simplify_points(self, position, points):
+        if self.simplify_tolerance is None or len(points) < 2:
+            return points
+        polyline = np.array([position] + points if position is not None else points, dtype=float)
+        keep = simplify_polyline(polyline, self.simplify_tolerance, self.simplify_method)
+        self.add_job_stat('simplify_points_in', len(keep))
+        self.add_job_stat('simplify_points_removed', len(keep) - np.count_nonzero(keep))
+        if position is not None:
+            polyline, keep = polyline[1:], keep[1:]
+        return polyline[keep].tolist()
+
+    #points_to_gcode: Gcode for a pen-down run of bed points starting at position. With arc_tolerance set, stretches
+    # that fit a circle become one G2/G3 instead of a G1 per point. Returns the lines and the new position.
+    def points_to_gcode(self, position, points):
+        data = []
+        points = self.simplify_points(position, points)
+        if len(points) == 0:
+            return data, position
+        if position is None:
+            data.append(f'G1 X{self.format_coordinate(points[0][0])} Y{self.format_coordinate(points[0][1])}\n')
+            position, points = points[0], points[1:]
+        if self.coordinate_precision is not None and (self.arc_tolerance is None or len(points) < 3):
+            # The whole run is formatted in one batch
+            data.extend(format_moves('G1', points, self.coordinate_precision).splitlines(keepends=True))
+            return data, points[-1] if len(points) else position
+        if self.arc_tolerance is None or len(points) < 3:
+            moves = [('G1', point) for point in points]
+        else:
+            moves = fit_arcs([position] + points, self.arc_tolerance)
+        for move in moves:
+            if move[0] == 'G1':
+                data.append(f'G1 X{self.format_coordinate(move[1][0])} Y{self.format_coordinate(move[1][1])}\n')
+            else:
+                data.append(self.arc_to_gcode(position, *move[1:]))
+            position = move[1]
+        return data, position
+
+
+    #toolpath_to_gcode: Pen up, travel to the start and pen down for every path of a bed toolpath, then its moves.
+    # Straight runs go through points_to_gcode so they can be simplified and fitted with arcs.
+    def toolpath_to_gcode(self, toolpath, position):
+        data = []
+        coords = toolpath.coords.tolist()
+        offsets = toolpath.offsets.tolist()
+        curves = np.flatnonzero(toolpath.vertex_kinds() != LINE).tolist()
+        aux = toolpath.aux.tolist() if curves else None
+        kinds = toolpath.kinds.tolist() if curves else None
+        next_curve = 0
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            data.append('G0 Z10\n')
+            lines, position = self.points_to_gcode(position, coords[start:start + 1])
+            data.extend(lines)
+            data.append('G0 Z0\n')
+            run = start + 1
+            while next_curve < len(curves) and curves[next_curve] < end:
+                i = curves[next_curve]
+                next_curve += 1
+                lines, position = self.points_to_gcode(position, coords[run:i])
+                data.extend(lines)
+                if kinds[i] == ARC:  # from a circular svg arc
+                    data.append(self.arc_to_gcode(position, coords[i], aux[i][:2], aux[i][2] > 0.5))
+                else:  # cubic passed through as G5
+                    data.append(self.cubic_to_gcode(position, coords[i], aux[i][:2], aux[i][2:]))
+                position = coords[i]
+                run = i + 1
+            lines, position = self.points_to_gcode(position, coords[run:end])
+            data.extend(lines)
+        return data, position
+
 ##########################################################################################
 # SVG to Gcode Conversion
 ##########################################################################################
@@ -383,10 +937,39 @@ class SVG_GCode:
     def svg_to_gcode(self, svg_file, scale_x=True, scale_y=True, keep_aspect_ratio=True, output_file='output.gcode'):
         
         print(f"Debug: Starting svg_to_gcode with {output_file}")
-        paths, attributes = svgpathtools.svg2paths(svg_file)
-        coordinates = self.svg_to_coordinates(paths)
-        #print(f"Debug: Extracted coordinates: {coordinates}")
-        
+        return list(self.iter_svg_gcode(svg_file))
+
+    #iter_svg_toolpaths: Parse -> flatten -> transform -> fill, lazily, yielding the bed Toolpath of one svg path at
+    # a time. Joining paths (merge_tolerance) needs all of them at once, so then they are collected and yielded as a
+    # single toolpath.
+    def iter_svg_toolpaths(self, path_data, transforms=None):
+        transforms = [None] * len(path_data) if transforms is None else transforms
+        if len(transforms) != len(path_data):
+            raise ValueError(f'{len(transforms)} transforms for {len(path_data)} paths')
+        toolpaths = (self.svg_to_toolpath(path, transform) for path, transform in zip(path_data, transforms))
+        if self.fill_spacing is not None:
+            toolpaths = (Toolpath.concatenate([toolpath if self.create_outline else Toolpath.empty(),
+                                               self.svg_to_fill_toolpath(path, transform)])
+                         for toolpath, path, transform in zip(toolpaths, path_data, transforms))
+        if self.merge_tolerance is None:
+            yield from toolpaths
+            return
+        toolpath = Toolpath.concatenate(list(toolpaths))
+        merged, joins = toolpath.merge(self.merge_tolerance)
+        self.add_job_stat('lifts_before', len(toolpath))
+        self.add_job_stat('lifts_saved', joins)
+        yield merged
+
+    #iter_svg_gcode: svg_to_gcode as a generator. Lines of a path are ready as soon as that path is converted, so a
+    # sender consuming it starts drawing right away and only one path is held in memory at a time.
+    def iter_svg_gcode(self, svg_file):
+        return self.encode_gcode(self.iter_svg_lines(svg_file))
+
+    #iter_svg_lines: The plain gcode lines of iter_svg_gcode, before encoding.
+    def iter_svg_lines(self, svg_file):
+        self.job_stats = {}
+        path_data = self.svg_to_path_data(svg_file)
+        transforms = self.svg_to_path_transforms(svg_file, len(path_data))
         # with open(output_file, 'w') as f:
         #     f.write(f'M888 P0\n')
         #     f.write(f'G0 F4000\n')
@@ -408,25 +991,24 @@ class SVG_GCode:
         #         f.write(f'G0 Z{self.z_up_offset}\n')
         #         f.write(f'M1112\n')
         
-        data = []
-        data.append(f'M1112\n')
-        data.append(f'M888 P0\n')
-        data.append(f'G0 F2000\n')
-        data.append(f'G1 F2000\n')
-        data.append(f'G0 Z10\n')
-        data.append(f'G21 G91\n')
-        for path in coordinates:
-            for coord in path:
-                #print(f"Debug: Parsed path data: {coord}")
-                if coord == 'UP':
-                    data.append('G0 Z10\n')
-                elif coord == 'DOWN':
-                    data.append('G0 Z0\n')
-                else:
-                    data.append(f'G1 X{(coord[0]/80)} Y{((coord[1]/80) + 250)}\n')
-            data.append(f'G1 Z10\n')
-        data.append(f'M1112\n')
-        return data
+        yield from self.svg_toolpath_lines(self.iter_svg_toolpaths(path_data, transforms))
+
+    #svg_toolpath_lines: The gcode job drawing bed toolpaths, given one svg path (or the merged job) at a time.
+    def svg_toolpath_lines(self, toolpaths):
+        yield 'M1112\n'
+        yield 'M888 P0\n'
+        yield 'G0 F2000\n'
+        yield 'G1 F2000\n'
+        yield 'G0 Z10\n'
+        yield 'G21 G91\n'
+
+        position = None
+        for toolpath in toolpaths:
+            lines, position = self.toolpath_to_gcode(toolpath, position)
+            yield from lines
+            yield 'G1 Z10\n'
+        yield 'M1112\n'
+        self.report_job_stats()
 
 
     #old
@@ -515,57 +1097,7 @@ class SVG_GCode:
                       plot_arm=False,
                       gcode_path=None):
 
-        max_x, min_x, max_y, min_y, scaler = self.path_to_coordinates(self.svg_to_paths(paths))
-        segment_blocks = list(path_to_segment_blocks(paths))
-
-        prev = None
-        blockset = []
-        data = []
-
-        print(f'Plotting Start')
-        data.append(f'M2000')
-        data.append(f'M888 P0')
-        data.append(f'G0 Z{self.z_up_offset}')
-        data.append(f'G0 F{self.z_feedrate}')
-        data.append(f'G1 F{self.z_feedrate}')
-
-        for block in segment_blocks:
-            blockset.append([block[0][0], block[-1][1], block])
-
-        for block in get_optimal_ordering(blockset):
-            for ii, ((x1, y1), (x2, y2)) in enumerate(block):
-
-                if self.longest_edge is not None:
-                    x1, x2, y1, y2 = self.calculate_coordinates(
-                        x1, x2, y1, y2, max_x, min_x, max_y, min_y, scaler)
-
-                # if x1>self.bed_size_x or y1>self.bed_size_y or x2>self.bed_size_x or y2>self.bed_size_y:
-                #     raise ValueError(f'Coordinates generated which fall outside of supplied printer bed size, adjust printer bed size or add "-longest_edge {min(self.bed_size_x,self.bed_size_y)}" to the command to scale the coordinates')
-
-                if prev is None or prev != (x1, y1):
-                    if self.debug:
-                        print(
-                            f'Travelling to X{self.x_offset+x1:.2f} Y{self.y_offset+y1:.2f}')
-                    data.append(f'G0 Z{self.z_up_offset}')
-                    data.append(
-                        f'G0 X{self.x_offset+x1:.2f} Y{self.y_offset+y1:.2f}')
-                    data.append(f'G1 Z0')
-
-                if self.debug:
-                    print(
-                        f'Plotting X{self.x_offset+x1:.2f} Y{self.y_offset+y1:.2f}')
-                    print(
-                        f'Plotting X{self.x_offset+x2:.2f} Y{self.y_offset+y2:.2f}')
-                data.append(
-                    f'G1 X{self.x_offset+x1:.2f} Y{self.y_offset+y1:.2f}')
-                data.append(
-                    f'G1 X{self.x_offset+x2:.2f} Y{self.y_offset+y2:.2f}')
-                # plt.plot([x1,x2],[y1,y2],c='r')
-                prev = (x2, y2)
-
-        print(f'Plotting End')
-        data.append(f'G0 Z{self.z_up_offset}')
-        # data.append(f'G1 X{self.x_offset+x2:.2f} Y{self.y_offset+y2:.2f}')
+        data = list(self.iter_path_gcode(paths))
 
         if plot_image:
             self.plot_to_image(gcode_path)
@@ -577,3 +1109,119 @@ class SVG_GCode:
             self.plot_to_draw(data)
 
         return data
+
+    #iter_path_polylines: The flattened canvas paths as (K,2) polylines without repeated points, one at a time.
+    # Single point paths have nothing to draw and are skipped.
+    def iter_path_polylines(self, paths, scaler):
+        tolerance = self.curve_tolerance(scaler if self.longest_edge is not None else 1)
+        # Canvas strokes are straight point to point cubics, so in g5 mode each one passes through as a single move
+        precision = 2 if self.g5 else 5
+        for path in paths:
+            coords = path_to_coordinate_array(path['paths'], PRECISION=precision, TOLERANCE=tolerance)
+            coords = coords[~np.isnan(coords[:, 0])]
+            keep = np.ones(len(coords), dtype=bool)
+            keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+            if np.count_nonzero(keep) >= 2:
+                yield coords[keep]
+
+    #iter_path_toolpaths: The canvas paths as (simplified) Toolpaths. With stream_window set, that many paths at a
+    # time, so only one window is held in memory and the first paths are sent before the rest are flattened.
+    def iter_path_toolpaths(self, paths, scaler):
+        polylines = self.iter_path_polylines(paths, scaler)
+        windows = [list(polylines)] if self.stream_window is None else chunked(polylines, self.stream_window)
+        simplify_tolerance = self.bed_to_input_units(self.simplify_tolerance, scaler if self.longest_edge is not None else 1)
+        for window in windows:
+            toolpath = Toolpath.from_polylines(window)
+            if simplify_tolerance is not None:
+                toolpath, before, after = toolpath.simplified(simplify_tolerance, self.simplify_method)
+                self.add_job_stat('simplify_points_in', before)
+                self.add_job_stat('simplify_points_removed', before - after)
+            yield toolpath
+
+    #order_toolpath: The paths of a toolpath in drawing order, see get_optimal_ordering / optimize_order.
+    def order_toolpath(self, toolpath, scaler):
+        if len(toolpath) == 0:
+            return toolpath
+        if self.reverse_paths or self.ordering_time > 0:
+            order, flipped, travel_before, travel_after = optimize_order(
+                toolpath.starts, toolpath.ends, reverse=self.reverse_paths, improve_time=self.ordering_time)
+            travel_scale = scaler if self.longest_edge is not None else 1
+            self.add_job_stat('travel_mm_before', travel_before * travel_scale)
+            self.add_job_stat('travel_mm_after', travel_after * travel_scale)
+            return toolpath.take(order, flipped)
+        return toolpath.take(nearest_neighbour_order(toolpath.starts, toolpath.ends))
+
+    #canvas_toolpath_to_gcode: Two G1 per segment of every path of a bed toolpath (offsets applied), all formatted in one batch, with a
+    # pen up travel in front of every path not starting where the last one ended. Returns the lines and that end.
+    def canvas_toolpath_to_gcode(self, toolpath, prev):
+        data = []
+        coords = toolpath.coords
+        # Segment i runs from vertex i to vertex i + 1, except across path ends
+        segment = np.ones(len(coords), dtype=bool)
+        segment[toolpath.offsets[1:] - 1] = False
+        first = np.flatnonzero(segment)
+        moves = np.empty((2 * len(first), 2))
+        moves[0::2] = coords[first]
+        moves[1::2] = coords[first + 1]
+        lines = format_moves('G1', moves, 2).splitlines()
+
+        starts = toolpath.starts.tolist()
+        ends = toolpath.ends.tolist()
+        line = 0
+        for start, end, count in zip(starts, ends, (toolpath.lengths - 1).tolist()):
+            x1, y1 = start
+            if prev is None or prev != (x1, y1):
+                if self.debug:
+                    print(f'Travelling to X{x1:.2f} Y{y1:.2f}')
+                data.append(f'G0 Z{self.z_up_offset}')
+                data.append(f'G0 X{x1:.2f} Y{y1:.2f}')
+                data.append(f'G1 Z0')
+            if self.debug:
+                for plotted in lines[line:line + 2 * count]:
+                    print(plotted.replace('G1', 'Plotting', 1))
+            data.extend(lines[line:line + 2 * count])
+            line += 2 * count
+            prev = tuple(end)
+        return data, prev
+
+    #iter_path_gcode: path_to_gcode as a generator, parse -> flatten -> order -> transform -> emit, one block at a time.
+    def iter_path_gcode(self, paths=[]):
+        return self.encode_gcode(self.iter_path_lines(paths))
+
+    #iter_path_lines: The plain gcode lines of iter_path_gcode, before encoding.
+    def iter_path_lines(self, paths=[]):
+
+        self.job_stats = {}
+        return self.canvas_toolpath_lines(self.iter_path_bed_toolpaths(paths))
+
+    #iter_path_bed_toolpaths: The canvas paths as ordered bed toolpaths, one stream_window at a time. The drawing's
+    # bounds are measured up front, as the bed fit needs them.
+    def iter_path_bed_toolpaths(self, paths):
+        max_x, min_x, max_y, min_y, scaler = self.path_to_coordinates(paths)
+        matrix = self.canvas_bed_matrix(max_x, min_x, max_y, min_y, scaler)
+        return (self.order_toolpath(toolpath, scaler).map_points(lambda coords: apply_affine(matrix, coords),
+                                                                 mirrored=is_mirrored(matrix))
+                for toolpath in self.iter_path_toolpaths(paths, scaler))
+
+    #canvas_toolpath_lines: The gcode job drawing canvas bed toolpaths.
+    def canvas_toolpath_lines(self, toolpaths):
+        prev = None
+
+        print(f'Plotting Start')
+        yield f'M2000'
+        yield f'M888 P0'
+        yield f'G0 Z{self.z_up_offset}'
+        yield f'G0 F{self.z_feedrate}'
+        yield f'G1 F{self.z_feedrate}'
+
+        for toolpath in toolpaths:
+            # if x1>self.bed_size_x or y1>self.bed_size_y or x2>self.bed_size_x or y2>self.bed_size_y:
+            #     raise ValueError(f'Coordinates generated which fall outside of supplied printer bed size, adjust printer bed size or add "-longest_edge {min(self.bed_size_x,self.bed_size_y)}" to the command to scale the coordinates')
+
+            lines, prev = self.canvas_toolpath_to_gcode(toolpath, prev)
+            yield from lines
+
+        print(f'Plotting End')
+        yield f'G0 Z{self.z_up_offset}'
+        # data.append(f'G1 X{self.x_offset+x2:.2f} Y{self.y_offset+y2:.2f}')
+        self.report_job_stats()
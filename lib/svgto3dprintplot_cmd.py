@@ -1,7 +1,8 @@
 import argparse
-from .svg_to_gcode import svg_to_gcode
+from .svg_to_gcode import SVG_GCode
+from .gcode_writer import write_gcode
 
-def  main():
+def  main(argv=None):
     argparser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         description='Convert SVG into gcode for plotting on a 3d printer')
@@ -55,27 +56,27 @@ def  main():
     argparser.add_argument(
             '-x_offset',
             type=int,
-            default=45,
-            help="X - Offset/margin from bottom left corner of print bed in mm")
+            default=None,
+            help="X - Offset/margin from bottom left corner of print bed in mm (not supported for svg jobs)")
 
     argparser.add_argument(
             '-y_offset',
             type=int,
-            default=40,
-            help="Y - Offset/margin from bottom of print bed in mm")
+            default=None,
+            help="Y - Offset/margin from bottom of print bed in mm (not supported for svg jobs)")
 
     argparser.add_argument(
             '-z_surface',
             type=int,
-            default=-2,
-            help="Z-coordinate for drawing/cutting to begin [mm].")
+            default=None,
+            help="Z-coordinate for drawing/cutting to begin [mm] (not supported for svg jobs)")
 
 
     argparser.add_argument(
             '-z_up',
             type=int,
-            default=0,
-            help="Z-coordinate height for transport moves [mm].")
+            default=None,
+            help="Z-coordinate height for transport moves [mm] (not supported for svg jobs)")
 
     argparser.add_argument(
             '-z_safe',
@@ -95,11 +96,29 @@ def  main():
             default=2.0,
             help="Don't fill with lines shorter than this value")
 
+    argparser.add_argument(
+            '-fill_spacing',
+            type=float,
+            default=1.0,
+            help="Distance between fill lines [mm]")
+
+    argparser.add_argument(
+            '-fill_angles',
+            type=float,
+            nargs='+',
+            default=[0],
+            help="Fill line angles in degrees, give several for a cross-hatch (e.g. -fill_angles 45 135)")
+
+    argparser.add_argument(
+            '--no_serpentine',
+            action='store_true',
+            help="Draw every fill line on its own instead of linking neighbouring lines")
+
     argparser.add_argument(
             '-longest_edge',
             type=float,
             default=None,
-            help=" Rescale longest edge of the image to this length")
+            help=" Rescale longest edge of the image to this length (not supported for svg jobs)")
 
     argparser.add_argument(
             '-bed_size_x',
@@ -118,28 +137,37 @@ def  main():
             type=int,
             default=1,
             help="Number of passes for CNC tool to perform.")
+
+    argparser.add_argument(
+            '--svg_transforms',
+            action='store_true',
+            help="Apply the transform attributes of svg groups and shapes.")
         
 
 
-    args = argparser.parse_args()
-    svg_to_gcode(
-        svg_path=args.svg_path,
-        gcode_path=args.gcode_path,
+    args = argparser.parse_args(argv)
+    # xy_feedrate, z_safe, cut_depth and num_passes are accepted for compatibility, the arm jobs don't use them.
+    # The svg jobs are placed by svg_units_per_mm and lift the pen by a fixed 10 mm, so placement and pen heights
+    # given here would be silently ignored
+    unsupported = [f'-{name}' for name in ('x_offset', 'y_offset', 'z_surface', 'z_up', 'longest_edge')
+                   if getattr(args, name) is not None]
+    if unsupported:
+        argparser.error(f'{", ".join(unsupported)} not supported for svg jobs')
+    converter = SVG_GCode(
         precision=args.precision,
-        xy_feedrate=args.xy_feedrate,
         z_feedrate=args.z_feedrate,
-        x_offset=args.x_offset,
-        y_offset=args.y_offset,
-        z_surface=args.z_surface,
-        z_up=args.z_up,
-        z_safe=args.z_safe,
-        cut_depth=args.cut_depth,
-        create_outline=args.stroke,
-        create_fill=args.fill,
-        min_fill_segment_size=args.min_fill_segment_size,
-        longest_edge=args.longest_edge,
+        create_outline=args.stroke or not args.fill,
+        fill_spacing=args.fill_spacing if args.fill else None,
+        fill_angles=args.fill_angles,
+        fill_serpentine=not args.no_serpentine,
+        fill_min_length=args.min_fill_segment_size,
         bed_size_x=args.bed_size_x,
         bed_size_y=args.bed_size_y,
         verbose=args.verbose,
-        passes=args.num_passes,
+        apply_svg_transforms=args.svg_transforms,
     )
+    write_gcode(converter.iter_svg_gcode(args.svg_path), args.gcode_path)
+
+
+if __name__ == '__main__':
+    main()
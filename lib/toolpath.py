@@ -0,0 +1,239 @@
+import numpy as np
+
+from .simplify import simplify_polyline
+from .spatial import PointGrid
+
+# Toolpaths as flat arrays: every vertex of every path in one contiguous (N,2) coordinate array, CSR style offsets so
+# path i is coords[offsets[i]:offsets[i + 1]], and one flags byte per path. A path is drawn pen down from its first
+# vertex to its last. kinds tells how each vertex is reached from the one before (LINE, ARC or CUBIC) and aux holds
+# the arc center / cubic control points of those moves; both stay None while a toolpath only has straight lines.
+
+LINE = 0
+ARC = 1  # aux: center x, center y, 1 if counter clockwise else 0, unused
+CUBIC = 2  # aux: control1 x, control1 y, control2 x, control2 y
+
+CLOSED = 1  # path was closed (svg Z)
+FILL = 2  # path is fill hatching
+
+
+class Toolpath:
+
+    def __init__(self, coords, offsets, flags=None, kinds=None, aux=None):
+        self.coords = np.ascontiguousarray(coords, dtype=float).reshape(-1, 2)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        paths = len(self.offsets) - 1
+        self.flags = np.zeros(paths, dtype=np.uint8) if flags is None else np.ascontiguousarray(flags, dtype=np.uint8)
+        self.kinds = None if kinds is None else np.ascontiguousarray(kinds, dtype=np.uint8)
+        self.aux = None if aux is None else np.ascontiguousarray(aux, dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 2)), [0])
+
+    #from_polylines: One straight line path per (K,2) polyline, empty ones are skipped.
+    @classmethod
+    def from_polylines(cls, polylines, flags=0):
+        polylines = [np.asarray(polyline, dtype=float).reshape(-1, 2) for polyline in polylines]
+        polylines = [polyline for polyline in polylines if len(polyline)]
+        if not polylines:
+            return cls.empty()
+        offsets = np.concatenate([[0], np.cumsum([len(polyline) for polyline in polylines])])
+        return cls(np.concatenate(polylines), offsets, np.full(len(polylines), flags))
+
+    @classmethod
+    def concatenate(cls, toolpaths):
+        toolpaths = [toolpath for toolpath in toolpaths if len(toolpath)]
+        if not toolpaths:
+            return cls.empty()
+        if len(toolpaths) == 1:
+            return toolpaths[0]
+        bases = np.cumsum([0] + [toolpath.vertex_count for toolpath in toolpaths[:-1]])
+        offsets = np.concatenate([[0]] + [toolpath.offsets[1:] + base for toolpath, base in zip(toolpaths, bases)])
+        curved = any(toolpath.kinds is not None for toolpath in toolpaths)
+        return cls(np.concatenate([toolpath.coords for toolpath in toolpaths]), offsets,
+                   np.concatenate([toolpath.flags for toolpath in toolpaths]),
+                   np.concatenate([toolpath.vertex_kinds() for toolpath in toolpaths]) if curved else None,
+                   np.concatenate([toolpath.vertex_aux() for toolpath in toolpaths]) if curved else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return f'Toolpath({len(self)} paths, {self.vertex_count} vertices)'
+
+    @property
+    def vertex_count(self):
+        return len(self.coords)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def starts(self):
+        return self.coords[self.offsets[:-1]]
+
+    @property
+    def ends(self):
+        return self.coords[self.offsets[1:] - 1]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.coords, self.offsets, self.flags, self.kinds, self.aux)
+                   if array is not None)
+
+    def path(self, i):
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    #paths: Paths start..stop as a Toolpath sharing this one's coordinate arrays.
+    def paths(self, start, stop):
+        first, last = int(self.offsets[start]), int(self.offsets[stop])
+        return Toolpath(self.coords[first:last], self.offsets[start:stop + 1] - first, self.flags[start:stop],
+                        None if self.kinds is None else self.kinds[first:last],
+                        None if self.aux is None else self.aux[first:last])
+
+    def vertex_kinds(self):
+        return self.kinds if self.kinds is not None else np.zeros(self.vertex_count, dtype=np.uint8)
+
+    def vertex_aux(self):
+        return self.aux if self.aux is not None else np.zeros((self.vertex_count, 4))
+
+    #has_curves: Whether any vertex is reached by an arc or a cubic.
+    def has_curves(self):
+        return self.kinds is not None and bool(np.any(self.kinds != LINE))
+
+    #map_points: Apply fn, taking and returning (N,2) arrays, to every vertex and to the arc centers and control
+    # points. mirrored tells the mapping flips orientation, so arcs change direction.
+    def map_points(self, fn, mirrored=False):
+        aux = self.aux
+        if aux is not None:
+            aux = aux.copy()
+            arcs = self.kinds == ARC
+            cubics = self.kinds == CUBIC
+            aux[arcs, :2] = fn(aux[arcs, :2])
+            if mirrored:
+                aux[arcs, 2] = 1 - aux[arcs, 2]
+            aux[cubics, :2] = fn(aux[cubics, :2])
+            aux[cubics, 2:] = fn(aux[cubics, 2:])
+        return Toolpath(fn(self.coords), self.offsets, self.flags, self.kinds, aux)
+
+    #take: The paths in the given order, flipped ones drawn from their end (arcs change direction and cubics swap
+    # their control points).
+    def take(self, order, flipped=None):
+        order = np.asarray(order, dtype=np.intp)
+        lengths = self.lengths[order]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        position = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+        flip = None
+        if flipped is not None and np.any(flipped):
+            flip = np.repeat(np.asarray(flipped, dtype=bool), lengths)
+            position = np.where(flip, np.repeat(lengths, lengths) - 1 - position, position)
+        src = np.repeat(self.offsets[order], lengths) + position
+
+        kinds = aux = None
+        if self.kinds is not None:
+            # A reversed vertex is reached by the reversed move into the vertex that followed it
+            move = src if flip is None else np.where(flip, src + 1, src)
+            first = np.zeros(len(src), dtype=bool)
+            first[offsets[:-1][lengths > 0]] = True
+            move = np.where(first, src, move)
+            kinds = np.where(first, LINE, self.kinds[np.minimum(move, self.vertex_count - 1)])
+            aux = self.aux[np.minimum(move, self.vertex_count - 1)]
+            aux[first] = 0
+            if flip is not None:
+                reverse = flip & ~first
+                arcs = reverse & (kinds == ARC)
+                aux[arcs, 2] = 1 - aux[arcs, 2]
+                cubics = reverse & (kinds == CUBIC)
+                aux[cubics] = aux[cubics][:, [2, 3, 0, 1]]
+        return Toolpath(self.coords[src], offsets, self.flags[order], kinds, aux)
+
+    #join: Draw consecutive paths with the same group id as one path. A path's first vertex is dropped when it is
+    # exactly where the previous one ended, otherwise it is reached by a straight connecting line.
+    def join(self, groups):
+        groups = np.asarray(groups)
+        if len(self) == 0:
+            return self
+        group_start = np.ones(len(self), dtype=bool)
+        group_start[1:] = groups[1:] != groups[:-1]
+        firsts = self.offsets[:-1]
+        keep = np.ones(self.vertex_count, dtype=bool)
+        continued = ~group_start
+        touching = np.all(self.coords[firsts[continued]] == self.coords[firsts[continued] - 1], axis=1)
+        keep[firsts[continued][touching]] = False
+        kept = np.add.reduceat(keep, firsts) if self.vertex_count else np.zeros(len(self), dtype=np.int64)
+        starts = np.flatnonzero(group_start)
+        counts = np.add.reduceat(kept, starts)
+        flags = np.bitwise_or.reduceat(self.flags, starts)
+        flags = np.where(np.diff(np.append(starts, len(self))) > 1, flags & ~np.uint8(CLOSED), flags)
+        return Toolpath(self.coords[keep], np.concatenate([[0], np.cumsum(counts)]), flags,
+                        None if self.kinds is None else self.kinds[keep],
+                        None if self.aux is None else self.aux[keep])
+
+    #merge: Chain paths whose endpoints lie within tolerance of each other, see endpoint_chains. Returns the merged
+    # toolpath and the number of joins, i.e. pen lifts saved.
+    def merge(self, tolerance):
+        if len(self) < 2:
+            return self, 0
+        chains, joins = endpoint_chains(self.starts, self.ends, tolerance)
+        order = [i for chain in chains for i, _ in chain]
+        flipped = [flip for chain in chains for _, flip in chain]
+        groups = np.repeat(np.arange(len(chains)), [len(chain) for chain in chains])
+        return self.take(order, flipped).join(groups), joins
+
+    #simplified: Simplify every straight line path, see simplify_polyline. Returns the toolpath and the number of
+    # vertices before / after.
+    def simplified(self, tolerance, method='rdp'):
+        if self.has_curves():
+            raise ValueError('Only straight line toolpaths can be simplified')
+        keep = np.ones(self.vertex_count, dtype=bool)
+        for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            keep[start:end] = simplify_polyline(self.coords[start:end], tolerance, method)
+        counts = np.add.reduceat(keep, self.offsets[:-1]) if self.vertex_count else self.lengths
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return Toolpath(self.coords[keep], offsets, self.flags), self.vertex_count, int(offsets[-1])
+
+
+#endpoint_chains: Chain paths (given by their start and end points) whose endpoints lie within tolerance of each
+# other, looking endpoints up in a PointGrid. Each chain grows forwards from its end, then backwards from its start.
+# Returns the chains as lists of (path, flipped) in drawing order, and the number of joins.
+def endpoint_chains(starts, ends, tolerance):
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    n = len(starts)
+    # Entries 0..n-1 are path starts, n..2n-1 path ends
+    grid = PointGrid(np.vstack([starts, ends]))
+
+    def take(entry):
+        i = entry % n
+        grid.remove(i)
+        grid.remove(n + i)
+        return i, entry >= n
+
+    def closest(point):
+        candidates = grid.within(point, tolerance)
+        if not candidates:
+            return None
+        d = np.hypot(*(grid.points[candidates] - point).T)
+        return candidates[int(np.argmin(d))]
+
+    chains = []
+    joins = 0
+    for i in range(n):
+        if not grid.alive[i]:
+            continue
+        take(i)
+        forward, backward = [(i, False)], []
+        head, tail = starts[i], ends[i]
+        while (entry := closest(tail)) is not None:
+            j, at_end = take(entry)
+            forward.append((j, at_end))
+            tail = starts[j] if at_end else ends[j]
+            joins += 1
+        while (entry := closest(head)) is not None:
+            j, at_end = take(entry)
+            backward.append((j, not at_end))
+            head = starts[j] if at_end else ends[j]
+            joins += 1
+        chains.append(backward[::-1] + forward)
+    return chains, joins
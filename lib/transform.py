@@ -0,0 +1,113 @@
+import math
+import re
+import numpy as np
+
+from xml.dom import minidom
+
+# 2D affine transforms as 3x3 matrices acting on column vectors (x, y, 1). Everything a coordinate goes through
+# between the svg / canvas file and the bed (svg transform attributes, fit to the bed, y flip, offsets) is composed
+# into one matrix, which is then applied to a whole (N,2) coordinate array at once.
+
+TRANSFORM_RE = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+NUMBER_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# Elements svgpathtools.svg2paths turns into paths, in the order it returns them
+SVG_SHAPE_TAGS = ('path', 'polyline', 'polygon', 'line', 'ellipse', 'circle', 'rect')
+
+
+def identity():
+    return np.eye(3)
+
+
+def translation(tx, ty=0):
+    return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=float)
+
+
+def scaling(sx, sy=None):
+    return np.array([[sx, 0, 0], [0, sx if sy is None else sy, 0], [0, 0, 1]], dtype=float)
+
+
+#rotation: Counter clockwise (in y up coordinates) by degrees, around (cx, cy).
+def rotation(degrees, cx=0, cy=0):
+    c, s = math.cos(math.radians(degrees)), math.sin(math.radians(degrees))
+    return compose(translation(cx, cy), np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]]), translation(-cx, -cy))
+
+
+def skew(x_degrees=0, y_degrees=0):
+    return np.array([[1, math.tan(math.radians(x_degrees)), 0], [math.tan(math.radians(y_degrees)), 1, 0], [0, 0, 1]])
+
+
+#compose: The product of the matrices, the last one being applied first (like an svg transform list).
+def compose(*matrices):
+    result = identity()
+    for matrix in matrices:
+        result = result @ matrix
+    return result
+
+
+#apply_affine: Map a (N,2) coordinate array through a 3x3 matrix.
+def apply_affine(matrix, coords):
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return coords @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+#linear_scale: How much the matrix scales lengths on average (the square root of its area scale).
+def linear_scale(matrix):
+    return math.sqrt(abs(matrix[0, 0] * matrix[1, 1] - matrix[0, 1] * matrix[1, 0]))
+
+
+#is_mirrored: Whether the matrix flips orientation, turning clockwise arcs counter clockwise.
+def is_mirrored(matrix):
+    return matrix[0, 0] * matrix[1, 1] - matrix[0, 1] * matrix[1, 0] < 0
+
+
+#is_similarity: Whether the matrix keeps circles circular (uniform scale, rotation, mirroring and translation only).
+def is_similarity(matrix, rtol=1e-9):
+    a = matrix[:2, :2]
+    gram = a.T @ a
+    scale = (gram[0, 0] + gram[1, 1]) / 2
+    return bool(np.allclose(gram, scale * np.eye(2), rtol=0, atol=rtol * max(scale, 1e-300)))
+
+
+#parse_transform: An svg transform attribute ('translate(10,20) scale(0.1,-0.1)' ...) as one matrix.
+def parse_transform(text):
+    matrix = identity()
+    if not text:
+        return matrix
+    for name, args in TRANSFORM_RE.findall(text):
+        values = [float(value) for value in NUMBER_RE.findall(args)]
+        if name == 'matrix':
+            if len(values) != 6:
+                raise ValueError(f'Malformed svg transform {name}({args})')
+            a, b, c, d, e, f = values
+            step = np.array([[a, c, e], [b, d, f], [0, 0, 1]])
+        elif name == 'translate':
+            step = translation(*values[:2])
+        elif name == 'scale':
+            step = scaling(*values[:2])
+        elif name == 'rotate':
+            step = rotation(*values[:3])
+        elif name == 'skewX':
+            step = skew(x_degrees=values[0])
+        else:
+            step = skew(y_degrees=values[0])
+        matrix = matrix @ step
+    return matrix
+
+
+#element_transform: The transform of a dom element including those of all the groups around it.
+def element_transform(element):
+    matrices = []
+    while element is not None and element.nodeType == element.ELEMENT_NODE:
+        matrices.append(parse_transform(element.getAttribute('transform')))
+        element = element.parentNode
+    return compose(*reversed(matrices))
+
+
+#svg_transforms: The transform of every shape in an svg file, lined up with the paths svgpathtools.svg2paths returns.
+def svg_transforms(svg_file):
+    doc = minidom.parse(svg_file)
+    try:
+        return [element_transform(element) for tag in SVG_SHAPE_TAGS for element in doc.getElementsByTagName(tag)]
+    finally:
+        doc.unlink()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tests import the repo's modules the way custom_draw.py does (from lib import ...)
+sys.path.insert(0, ROOT)
+
+from lib.svg_to_gcode import SVG_GCode  # noqa: E402
+
+
+@pytest.fixture
+def converter():
+    """ SVG_GCode(**options), the converter's prints are captured by pytest """
+    return lambda **options: SVG_GCode(**options)
+
+
+@pytest.fixture
+def svg_path():
+    """ Path of one of the repo's sample drawings, e.g. svg_path('cat.svg') """
+    return lambda name: os.path.join(ROOT, 'svg', name)
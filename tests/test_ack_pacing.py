@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+import custom_draw
+from lib.arm_session import ArmSession
+from lib.sim_port import simulated_arm
+
+LINES = [f'G1 X{x} Y{300 + x % 7} F6000' for x in range(40)]
+
+
+@pytest.fixture
+def sim_session(monkeypatch):
+    """ custom_draw drawing on a simulated arm that moves instantly """
+    session = ArmSession('sim', arm_factory=lambda port: simulated_arm(port, time_scale=0))
+    monkeypatch.setattr(custom_draw, 'session', session)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ The durations of every time.sleep, which then returns right away """
+    slept = []
+    monkeypatch.setattr(time, 'sleep', slept.append)
+    return slept
+
+
+def test_draw_is_paced_by_acks_only(sim_session, sleeps):
+    custom_draw.plot_gcode(iter(LINES))
+    received = sim_session.arm.ser.received
+    # Whatever the connection asked first, the job is every line then one M400
+    assert received[-len(LINES) - 1:] == LINES + ['M400']
+    assert sim_session.arm.ser.overflows == 0
+    assert sleeps == []
+
+
+def test_without_wait_for_moves(sim_session, monkeypatch):
+    monkeypatch.setattr(custom_draw, 'wait_for_moves', False)
+    custom_draw.plot_gcode(LINES)
+    assert sim_session.arm.ser.received[-len(LINES):] == LINES
+    assert 'M400' not in sim_session.arm.ser.received
+
+
+def test_send_rate_caps_the_pace(sim_session, monkeypatch):
+    monkeypatch.setattr(custom_draw, 'send_rate', 400)
+    started = time.perf_counter()
+    custom_draw.plot_gcode(LINES)
+    # 41 lines at 400 per second: the last one goes out 40 / 400 s after the first
+    assert time.perf_counter() - started >= 40 / 400
+    assert sim_session.arm.ser.received[-1] == 'M400'
+
+
+def test_max_rate_of_the_streamer(sleeps):
+    arm = simulated_arm(time_scale=0)
+    streamer = arm.stream(LINES, max_rate=50)
+    assert streamer.stats()['acked'] == len(LINES)
+    # Every line after the first waits for its slot, 1 / 50 s apart
+    assert len(sleeps) == len(LINES) - 1
+    assert all(0 < sleep <= 1 / 50 * len(LINES) for sleep in sleeps)
+
+
+def test_several_lines_in_flight():
+    # A slow arm: the sender runs ahead of it by the planner and receive buffer, not one line at a time
+    arm = simulated_arm(time_scale=0.05)
+    streamer = arm.streamer()
+    most = 0
+    for line in LINES:
+        streamer.send(line)
+        most = max(most, streamer.in_flight)
+    streamer.flush()
+    assert most > 1
+    assert arm.ser.overflows == 0
+
+
+def test_failing_conversion_lifts_the_pen(sim_session):
+    def lines():
+        yield from LINES[:5]
+        raise ValueError('broken path')
+    custom_draw.plot_gcode(lines())
+    assert sim_session.arm.ser.received[-6:] == LINES[:5] + ['G1 Z10']
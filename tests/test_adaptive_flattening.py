@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from lib.svg_interpreter import bernstein_basis, flatten_beziers_adaptive, svg_to_coordinate_chomper, tokenize_path
+
+
+def distance_to_polyline(points, polyline):
+    """ Distance of every point to the nearest segment of the polyline """
+    start, end = polyline[:-1], polyline[1:]
+    direction = end - start
+    length2 = np.maximum(np.sum(direction ** 2, axis=1), 1e-300)
+    t = np.clip(np.einsum('pnd,nd->pn', points[:, None] - start[None], direction) / length2, 0, 1)
+    nearest = start[None] + t[..., None] * direction[None]
+    return np.min(np.hypot(*(points[:, None] - nearest).transpose(2, 0, 1)), axis=1)
+
+
+@pytest.mark.parametrize('degree', [2, 3])
+@pytest.mark.parametrize('tolerance', [1, 0.1, 0.01])
+def test_deviation_within_tolerance(degree, tolerance):
+    segments = np.random.default_rng(degree).uniform(-50, 50, (40, degree + 1, 2))
+    coords, offsets = flatten_beziers_adaptive(segments, tolerance)
+    curves = np.einsum('sk,nkd->nsd', bernstein_basis(degree, 2000), segments)
+    for curve, start, end in zip(curves, offsets[:-1], offsets[1:]):
+        polyline = coords[start:end]
+        np.testing.assert_allclose(polyline[[0, -1]], curve[[0, -1]], atol=1e-9)
+        assert np.max(distance_to_polyline(curve, polyline)) <= tolerance * (1 + 1e-9)
+
+
+def test_samples_follow_the_curve_size():
+    # The same curve at 1x and 100x: the large one needs ~10x the samples (n grows with the square root)
+    small = np.array([[[0, 0], [1, 2], [2, -2], [3, 0]]], dtype=float)
+    _, small_offsets = flatten_beziers_adaptive(small, 0.01)
+    _, large_offsets = flatten_beziers_adaptive(small * 100, 0.01)
+    assert 5 * np.diff(small_offsets)[0] < np.diff(large_offsets)[0]
+
+
+def test_flat_segment_is_one_line():
+    coords, offsets = flatten_beziers_adaptive(np.array([[[0, 0], [1, 0.001], [2, -0.001], [3, 0]]]), 0.01)
+    assert offsets.tolist() == [0, 2]
+    np.testing.assert_allclose(coords, [[0, 0], [3, 0]])
+
+
+def test_bad_tolerance():
+    with pytest.raises(ValueError):
+        flatten_beziers_adaptive(np.zeros((1, 4, 2)), 0)
+
+
+def test_chomper_is_quiet(capsys):
+    list(svg_to_coordinate_chomper(tokenize_path('M0 0 C1 2 2 -2 3 0'), TOLERANCE=0.01))
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,46 @@
+import re
+
+import numpy as np
+import pytest
+
+from lib.svg_to_gcode import circumcenter, fit_arcs
+
+
+def circle_points(center, radius, start, stop, count):
+    angles = np.radians(np.linspace(start, stop, count))
+    return np.column_stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)])
+
+
+def test_circumcenter():
+    points = circle_points((10, 20), 5, 0, 120, 3)
+    np.testing.assert_allclose(circumcenter(*points), [10, 20])
+    assert circumcenter((0, 0), (1, 1), (2, 2)) is None
+
+
+@pytest.mark.parametrize('start, stop, ccw', [(0, 180, True), (180, 0, False)])
+def test_fit_arcs_sampled_circle(start, stop, ccw):
+    points = circle_points((10, 20), 5, start, stop, 40)
+    moves = fit_arcs(points, 0.01)
+    assert len(moves) == 1
+    kind, end, center, move_ccw = moves[0]
+    assert kind == 'ARC' and move_ccw == ccw
+    np.testing.assert_allclose(end, points[-1])
+    np.testing.assert_allclose(center, [10, 20], atol=1e-9)
+
+
+def test_fit_arcs_keeps_lines():
+    moves = fit_arcs([(0, 0), (1, 0), (2, 0), (3, 0), (4, 1)], 0.01)
+    assert [move[0] for move in moves] == ['G1'] * 4
+
+
+@pytest.mark.parametrize('start, stop, code', [(-90, 90, 'G3'), (90, -90, 'G2')])
+def test_arc_gcode(converter, start, stop, code):
+    points = circle_points((10, 20), 5, start, stop, 40).tolist()
+    lines, position = converter(arc_tolerance=0.01).points_to_gcode(points[0], points[1:])
+    assert len(lines) == 1
+    match = re.fullmatch(r'(G[23]) X(\S+) Y(\S+) I(\S+) J(\S+)\n', lines[0])
+    assert match.group(1) == code
+    # Fixed precision: the offsets of 0 come out as 0.000, not as 6e-16
+    assert match.groups()[1:] == ('10.000', '25.000' if code == 'G3' else '15.000', '0.000',
+                                  '5.000' if code == 'G3' else '-5.000')
+    assert position == points[-1]
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+
+import pytest
+import serial
+
+from lib.async_dexarm import AsyncDexarm
+from lib.sim_port import SimulatedPort
+
+
+class BrokenPort(SimulatedPort):
+    """ A SimulatedPort whose connection drops on the first read """
+
+    def read(self, size=1):
+        raise OSError('device disconnected')
+
+
+def run(coroutine, timeout=10):
+    async def bounded():
+        return await asyncio.wait_for(coroutine, timeout)
+    return asyncio.run(bounded())
+
+
+def test_commands_on_simulated_port_without_timeout():
+    async def session():
+        arm = AsyncDexarm('sim', ser=SimulatedPort(time_scale=0, timeout=None))
+        position = await arm.get_current_position()
+        await arm.move_to(x=10, y=300, z=0)
+        # close must not wait for a read that never returns
+        await asyncio.wait_for(arm.close(), 2)
+        return position
+    assert run(session())[:3] == (0.0, 300.0, 0.0)
+
+
+def test_lost_connection_fails_new_commands():
+    async def session():
+        arm = AsyncDexarm('sim', ser=BrokenPort(time_scale=0))
+        with pytest.raises(ConnectionError):
+            await arm.move_to(x=10)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(arm.move_to(x=20), 2)
+        await arm.close()
+    run(session())
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='file descriptor watching is POSIX only')
+def test_watches_file_descriptor():
+    master, slave = os.openpty()
+
+    def firmware():
+        buffer = b''
+        while True:
+            try:
+                buffer += os.read(master, 256)
+            except OSError:
+                return
+            while b'\r' in buffer:
+                command, buffer = buffer.split(b'\r', 1)
+                if command.startswith(b'M114'):
+                    os.write(master, b'X:1.00 Y:300.00 Z:0.00 E:0.00\n')
+                os.write(master, b'ok\n')
+
+    threading.Thread(target=firmware, daemon=True).start()
+    port = serial.Serial(os.ttyname(slave), timeout=3000)
+
+    async def session():
+        arm = AsyncDexarm('pty', ser=port)
+        threads = threading.active_count()
+        position = await arm.get_current_position()
+        await asyncio.gather(*(arm.move_to(x=x, y=300) for x in range(20)))
+        assert arm._fd is not None
+        assert threading.active_count() == threads
+        await asyncio.wait_for(arm.close(), 2)
+        return position
+
+    try:
+        assert run(session())[:2] == (1.0, 300.0)
+    finally:
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from lib.svg_interpreter import bernstein_basis, elevate_quadratics, flatten_beziers, interpolateBezier
+
+
+def de_casteljau(control, t):
+    """ The point at t of the bezier curve with the given control points, by repeated interpolation """
+    points = np.asarray(control, dtype=float)
+    while len(points) > 1:
+        points = (1 - t) * points[:-1] + t * points[1:]
+    return points[0]
+
+
+@pytest.mark.parametrize('degree', [2, 3])
+@pytest.mark.parametrize('steps', [2, 5, 10])
+def test_flatten_matches_de_casteljau(degree, steps):
+    segments = np.random.default_rng(steps).uniform(-100, 100, (25, degree + 1, 2))
+    coords, offsets = flatten_beziers(segments, steps)
+    assert coords.shape == (25 * steps, 2)
+    assert offsets.tolist() == list(range(0, 25 * steps + 1, steps))
+    for segment, start in zip(segments, offsets[:-1]):
+        expected = [de_casteljau(segment, t) for t in np.linspace(0, 1, steps)]
+        np.testing.assert_allclose(coords[start:start + steps], expected, atol=1e-9)
+
+
+def test_basis_is_a_partition_of_unity():
+    basis = bernstein_basis(3, 7)
+    np.testing.assert_allclose(basis.sum(axis=1), 1)
+    assert basis is bernstein_basis(3, 7)
+    assert not basis.flags.writeable
+
+
+def test_elevated_quadratics_are_the_same_curves():
+    quadratics = np.random.default_rng(1).uniform(-10, 10, (10, 3, 2))
+    cubics = elevate_quadratics(quadratics)
+    for quadratic, cubic in zip(quadratics, cubics):
+        for t in np.linspace(0, 1, 9):
+            np.testing.assert_allclose(de_casteljau(cubic, t), de_casteljau(quadratic, t), atol=1e-12)
+
+
+def test_interpolate_bezier():
+    control = [(0, 0), (1, 3), (4, 3), (5, 0)]
+    np.testing.assert_allclose(interpolateBezier(control, t=0.3), de_casteljau(control, 0.3))
+    points = list(interpolateBezier(control, steps=4))
+    np.testing.assert_allclose(points, [de_casteljau(control, t) for t in np.linspace(0, 1, 4)], atol=1e-12)
+
+
+def test_flatten_rejects_other_shapes():
+    assert flatten_beziers(np.empty((0, 4, 2)))[1].tolist() == [0]
+    with pytest.raises(Exception):
+        flatten_beziers(np.zeros((3, 5, 2)))
@@ -0,0 +1,60 @@
+import re
+
+import pytest
+
+from lib.svg_to_gcode import compact_gcode
+
+WORD_RE = re.compile(r'([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))')
+
+
+def replay(lines):
+    """ The (X, Y, Z, feedrate) after every G0 / G1 that moves the arm, the way Marlin follows them """
+    relative = False
+    position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}
+    feed = None
+    moves = []
+    for line in lines:
+        words = WORD_RE.findall(line.upper())
+        codes = {letter + value for letter, value in words if letter == 'G'}
+        if 'G90' in codes or 'G91' in codes:
+            relative = 'G91' in codes
+            continue
+        if not codes & {'G0', 'G1'}:
+            continue
+        before = dict(position)
+        for letter, value in words:
+            if letter in position:
+                position[letter] = position[letter] + float(value) if relative else float(value)
+            elif letter == 'F':
+                feed = float(value)
+        if position != before:
+            moves.append((position['X'], position['Y'], position['Z'], feed))
+    return moves
+
+
+def assert_same_moves(original, compacted, resolution):
+    expected, actual = replay(original), replay(compacted)
+    assert len(actual) == len(expected)
+    for (*expected_xyz, expected_feed), (*actual_xyz, actual_feed) in zip(expected, actual):
+        assert actual_xyz == pytest.approx(expected_xyz, abs=resolution / 2 + 1e-9)
+        assert actual_feed == expected_feed
+
+
+@pytest.mark.parametrize('name', ['bt.svg', 'cat.svg'])
+def test_round_trip(converter, svg_path, name):
+    original = converter().svg_to_gcode(svg_path(name))
+    compacted = list(compact_gcode(original, resolution=0.01))
+    assert_same_moves(original, compacted, 0.01)
+    assert len(''.join(compacted)) < len(''.join(original))
+
+
+def test_relative_rounding_is_carried_over():
+    original = ['G91\n'] + ['G1 X0.004 F3000\n'] * 10
+    compacted = list(compact_gcode(original, resolution=0.01))
+    assert replay(compacted)[-1][0] == pytest.approx(0.04)
+
+
+def test_one_modal_feedrate():
+    # Marlin's G0 and G1 share the feedrate: a G0 at the G1's feedrate needs no F, a different one does
+    compacted = list(compact_gcode(['G90\n', 'G1 X1 F3000\n', 'G0 X2 F3000\n', 'G0 X3 F2000\n', 'G1 X4 F2000\n']))
+    assert compacted == ['G90\n', 'G1 X1 F3000\n', 'G0 X2\n', 'G0 X3 F2000\n', 'G1 X4\n']
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from lib.raycaster import hatch_fill
+from lib.svgto3dprintplot_cmd import main
+
+
+def ring(points):
+    points = np.asarray(points, dtype=float)
+    return np.stack([points, np.roll(points, -1, axis=0)], axis=1)
+
+
+SQUARE = ring([[0, 0], [20, 0], [20, 20], [0, 20]])
+
+
+def hatch_angles(polylines):
+    """ Direction of every hatch line in degrees, modulo 180 """
+    angles = []
+    for polyline in polylines:
+        for start, end in zip(polyline[:-1:2], polyline[1::2]):
+            angles.append(np.degrees(np.arctan2(end[1] - start[1], end[0] - start[0])) % 180)
+    return np.round(angles, 6) % 180
+
+
+@pytest.mark.parametrize('angle', [0, 30, 45, 90, 135])
+def test_hatches_at_the_angle(angle):
+    polylines = hatch_fill(SQUARE, 2, angles=(angle,), serpentine=False)
+    assert polylines
+    assert set(hatch_angles(polylines)) == {angle % 180}
+    points = np.concatenate(polylines)
+    assert np.all((points > -1e-9) & (points < 20 + 1e-9))
+
+
+def test_cross_hatch_is_every_angle_in_turn():
+    # One batched pass over both angles gives the hatches of the angles one at a time
+    hexagon = ring([[3.3, 0.7], [17.1, 1.9], [21.7, 11.3], [15.2, 19.6], [2.9, 18.4], [-1.3, 9.1]])
+    cross = hatch_fill(hexagon, 2, angles=(30, 120), serpentine=False)
+    single = hatch_fill(hexagon, 2, angles=(30,), serpentine=False) + \
+        hatch_fill(hexagon, 2, angles=(120,), serpentine=False)
+    assert len(cross) == len(single)
+    for got, expected in zip(cross, single):
+        np.testing.assert_allclose(got, expected, atol=1e-9)
+
+
+def test_spacing_across_the_hatches():
+    # Hatches at 45 degrees across a 20 mm square: one every 2 mm along the 20 * sqrt(2) mm diagonal
+    polylines = hatch_fill(SQUARE, 2, angles=(45,), serpentine=False)
+    assert abs(len(polylines) - 20 * np.sqrt(2) / 2) <= 1
+
+
+def test_cli_cross_hatch(svg_path, tmp_path):
+    gcode_path = tmp_path / 'out.gcode'
+    main([svg_path('bt.svg'), str(gcode_path), '--fill', '-fill_angles', '45', '135'])
+    assert 'G1' in gcode_path.read_text()
+
+
+@pytest.mark.parametrize('option', [['-x_offset', '10'], ['-z_up', '5'], ['-longest_edge', '100']])
+def test_cli_rejects_what_svg_jobs_ignore(svg_path, tmp_path, option):
+    with pytest.raises(SystemExit):
+        main([svg_path('bt.svg'), str(tmp_path / 'out.gcode')] + option)
+    assert not (tmp_path / 'out.gcode').exists()
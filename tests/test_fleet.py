@@ -0,0 +1,81 @@
+import functools
+import time
+
+from lib.fleet import Fleet, offset_gcode
+from lib.sim_port import simulated_arm
+
+
+def arm_factory(arms, **options):
+    """ simulated_arm keeping every arm it creates in arms, by port """
+    def create(port):
+        arms[port] = simulated_arm(port, **options)
+        return arms[port]
+    return create
+
+
+def dwell(ms):
+    # M400: the job only ends once the arm has finished the dwell
+    return ['G4 P%d' % ms, 'M400']
+
+
+def test_offset_absolute_moves():
+    lines = ['G90', 'G0 X1 Y2 Z3', 'G2 X1.5 Y2 I0.25 J0', 'M888 P0']
+    assert list(offset_gcode(lines, 10, -1, 0.5)) == ['G90', 'G0 X11.00 Y1.00 Z3.50', 'G2 X11.50 Y1.00 I0.25 J0',
+                                                      'M888 P0']
+
+
+def test_offset_relative_moves():
+    lines = ['M1112\n', 'G0 Z10\n', 'G21 G91\n', 'G0 Z10\n', 'G1 X1 Y2\n', 'G1 X-1 Y-2\n', 'M1112\n']
+    shifted = list(offset_gcode(lines, 5, -3))
+    # One relative move by the offset before the first relative move, the relative moves themselves stay
+    assert shifted == ['M1112\n', 'G0 Z10.00\n', 'G21 G91\n', 'G0 X5.000 Y-3.000\n', 'G0 Z10\n', 'G1 X1 Y2\n',
+                       'G1 X-1 Y-2\n', 'M1112\n']
+    # Axes an absolute move already shifted are not shifted again, homing starts over
+    lines = ['G90', 'G0 X1', 'G91', 'G1 X1', 'G90', 'M1112', 'G91', 'G1 X1']
+    assert list(offset_gcode(lines, 1, 2)) == ['G90', 'G0 X2.00', 'G91', 'G0 Y2.000', 'G1 X1', 'G90', 'M1112', 'G91',
+                                               'G0 X1.000 Y2.000', 'G1 X1']
+
+
+def test_jobs_run_concurrently():
+    arms = {}
+    with Fleet(['a', 'b'], arm_factory=arm_factory(arms, time_scale=1)) as fleet:
+        start = time.monotonic()
+        jobs = [fleet.submit(dwell(300), name=str(i)) for i in range(4)]
+        fleet.join(10)
+        elapsed = time.monotonic() - start
+        stats = fleet.stats()
+    assert all(job.error is None for job in jobs)
+    assert {job.arm for job in jobs} == {'a', 'b'}
+    # Two arms draw the four jobs in about two job lengths
+    assert elapsed < 4 * 0.3
+    assert stats['a']['jobs'] + stats['b']['jobs'] == 4
+    for port in ('a', 'b'):
+        assert stats[port]['errors'] == 0
+        assert stats[port]['busy_seconds'] > 0.25
+        assert 0 < stats[port]['utilization'] <= 1
+        assert stats[port]['mean_queue_wait'] >= 0
+
+
+def test_port_pinning_and_calibration():
+    arms = {}
+    with Fleet(['a', 'b'], calibrations={'b': (10, 0)}, arm_factory=arm_factory(arms, time_scale=0)) as fleet:
+        jobs = [fleet.submit(['G90', 'G1 X1 Y300'], port='b') for _ in range(3)]
+        for job in jobs:
+            job.wait(10)
+    assert [job.arm for job in jobs] == ['b'] * 3
+    assert arms['b'].ser.received.count('G1 X11.00 Y300.00') == 3
+    # Nothing ran on a, so it was never even connected
+    assert 'a' not in arms
+
+
+def test_close_cancel_drops_queued_jobs():
+    fleet = Fleet(['a'], arm_factory=functools.partial(simulated_arm, time_scale=1))
+    running = fleet.submit(dwell(300))
+    while running.started is None:
+        time.sleep(0.01)
+    queued = [fleet.submit(dwell(300)) for _ in range(3)]
+    fleet.close(cancel=True)
+    assert running.error is None and running.done()
+    for job in queued:
+        assert job.done() and job.started is None
+        assert isinstance(job.error, RuntimeError)
@@ -0,0 +1,37 @@
+import re
+
+import pytest
+
+# A number with an exponent, which the firmware reads only up to the 'e'
+EXPONENT_RE = re.compile(r'\d[eE][-+]?\d')
+
+ARCS_SVG = '''<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">
+  <path d="M 10 10 A 5 5 0 0 1 20 10 A 5 5 0 0 1 10 10 Z"/>
+  <path d="M 30 30 Q 40 40 50 30 T 70 30 C 70 40 80 40 80 30"/>
+</svg>'''
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'g5': True},
+    {'arc_tolerance': 0.05},
+    {'g5': True, 'arc_tolerance': 0.05, 'simplify_tolerance': 0.01},
+    {'coordinate_precision': 3},
+    {'compact_gcode': True},
+    {'fill_spacing': 1},
+])
+def test_no_exponents(converter, svg_path, tmp_path, options):
+    arcs = tmp_path / 'arcs.svg'
+    arcs.write_text(ARCS_SVG)
+    for svg_file in (str(arcs), svg_path('cat.svg')):
+        for line in converter(**options).iter_svg_gcode(svg_file):
+            assert not EXPONENT_RE.search(line), line
+
+
+def test_g5_words(converter, tmp_path):
+    arcs = tmp_path / 'arcs.svg'
+    arcs.write_text(ARCS_SVG)
+    lines = [line for line in converter(g5=True).iter_svg_gcode(str(arcs)) if line.startswith('G5')]
+    assert lines
+    for line in lines:
+        assert re.fullmatch(r'G5( [IJPQXY]-?\d+\.\d{3}){6}\n', line), line
@@ -0,0 +1,29 @@
+import io
+import os
+import stat
+
+import pytest
+
+from lib.gcode_writer import write_gcode, new_file_mode
+
+
+def test_write_gcode_to_file_object():
+    target = io.BytesIO()
+    assert write_gcode(['G0 X1', 'G1 Y2\n'], target) == 12
+    assert target.getvalue() == b'G0 X1\nG1 Y2\n'
+
+
+def test_written_file_follows_umask(tmp_path):
+    path = tmp_path / 'out.gcode'
+    write_gcode(['G0 X1'], path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == new_file_mode()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason='the umask is only read back from /proc')
+def test_new_file_mode_follows_umask_changes():
+    umask = os.umask(0o027)
+    try:
+        assert new_file_mode() == 0o640
+    finally:
+        os.umask(umask)
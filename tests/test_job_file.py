@@ -0,0 +1,18 @@
+import os
+import stat
+
+from lib.gcode_writer import new_file_mode
+
+
+def test_replay_matches_direct_conversion(converter, svg_path, tmp_path):
+    job_path = tmp_path / 'cat.job'
+    svg_gcode = converter()
+    svg_gcode.compile_svg(svg_path('cat.svg'), job_path)
+    replayed = list(svg_gcode.iter_job_gcode(job_path))
+    assert replayed == list(converter().iter_svg_gcode(svg_path('cat.svg')))
+
+
+def test_job_file_follows_umask(converter, svg_path, tmp_path):
+    job_path = tmp_path / 'cat.job'
+    converter().compile_svg(svg_path('cat.svg'), job_path)
+    assert stat.S_IMODE(os.stat(job_path).st_mode) == new_file_mode()
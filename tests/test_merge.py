@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from lib.toolpath import Toolpath, endpoint_chains
+
+
+def broken_polyline(count, seed, jitter=0.0):
+    """ A random walk cut into count paths, shuffled and every other one reversed, ends moved up to jitter """
+    rng = np.random.default_rng(seed)
+    walk = np.cumsum(rng.uniform(-5, 5, (3 * count + 1, 2)), axis=0)
+    pieces = [walk[3 * i:3 * i + 4].copy() for i in range(count)]
+    for piece in pieces:
+        piece[[0, -1]] += rng.uniform(-jitter, jitter, (2, 2))
+    pieces = [piece[::-1] if i % 2 else piece for i, piece in enumerate(pieces)]
+    return [pieces[i] for i in rng.permutation(count)]
+
+
+@pytest.mark.parametrize('jitter', [0, 0.01])
+def test_chains_a_broken_polyline(jitter):
+    toolpath = Toolpath.from_polylines(broken_polyline(20, 1, jitter))
+    chains, joins = endpoint_chains(toolpath.starts, toolpath.ends, 0.05)
+    assert len(chains) == 1 and joins == 19
+    # Every path is entered where the one before it ended
+    exits = [toolpath.starts[i] if flip else toolpath.ends[i] for i, flip in chains[0]]
+    entries = [toolpath.ends[i] if flip else toolpath.starts[i] for i, flip in chains[0]]
+    assert np.all(np.hypot(*(np.array(entries[1:]) - exits[:-1]).T) <= 0.05)
+
+
+def test_merge_saves_a_lift_per_join():
+    toolpath = Toolpath.from_polylines(broken_polyline(12, 2) + broken_polyline(5, 3))
+    merged, joins = toolpath.merge(1e-9)
+    assert len(merged) == len(toolpath) - joins
+    # Touching ends are drawn once
+    assert merged.vertex_count == toolpath.vertex_count - joins
+    assert {tuple(point) for point in merged.coords.tolist()} == {tuple(point) for point in toolpath.coords.tolist()}
+
+
+def test_ends_too_far_apart_stay_apart():
+    toolpath = Toolpath.from_polylines([np.array([[0, 0], [1, 0]]), np.array([[1.2, 0], [2, 0]])])
+    merged, joins = toolpath.merge(0.1)
+    assert joins == 0 and len(merged) == 2
+    merged, joins = toolpath.merge(0.5)
+    assert joins == 1 and len(merged) == 1 and merged.vertex_count == 4
+
+
+def test_svg_job_lifts_saved(converter, svg_path):
+    plain = converter().svg_to_gcode(svg_path('cat.svg'))
+    svg_gcode = converter(merge_tolerance=0.05)
+    merged = svg_gcode.svg_to_gcode(svg_path('cat.svg'))
+    saved = svg_gcode.job_stats['lifts_saved']
+    assert saved > 0
+    assert merged.count('G0 Z10\n') == plain.count('G0 Z10\n') - saved
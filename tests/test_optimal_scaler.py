@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_optimal_scaler import SAMPLES, sampled_optimal_scaler
+from lib.svg_to_gcode import get_optimal_scaler
+
+STEP = 1 / (SAMPLES - 1)
+
+
+@pytest.mark.parametrize('bed_x, bed_y, im_x, im_y, longest_edge', [
+    (250, 200, 1024, 668, 150),  # landscape image on the landscape bed
+    (250, 200, 668, 1024, 150),  # portrait image on the landscape bed
+    (200, 250, 668, 1024, 150),  # portrait image on a portrait bed
+    (200, 250, 1024, 668, 150),  # landscape image on a portrait bed
+    (250, 200, 1024, 668, 400),  # longest edge larger than the bed
+    (250, 200, 668, 1024, 400),
+    (250, 200, 100, 80, 150),  # image smaller than the bed, never scaled up
+    (250, 200, 250, 200, 150),  # image exactly the bed
+    (200, 200, 300, 300, 150),  # square bed and image
+])
+def test_matches_sampled_reference(converter, bed_x, bed_y, im_x, im_y, longest_edge):
+    reference = sampled_optimal_scaler(bed_x, bed_y, im_x, im_y, longest_edge)
+    assert get_optimal_scaler(bed_x, bed_y, im_x, im_y, longest_edge) == pytest.approx(reference, abs=STEP)
+    svg_gcode = converter(bed_size_x=bed_x, bed_size_y=bed_y, longest_edge=longest_edge)
+    assert svg_gcode.optimal_scaler(im_x, im_y) == pytest.approx(reference, abs=STEP)
+
+
+def test_matches_sampled_reference_random():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        bed_x, bed_y = rng.uniform(50, 400, 2)
+        im_x, im_y = rng.uniform(1, 4000, 2)
+        longest_edge = rng.uniform(10, 300)
+        reference = sampled_optimal_scaler(bed_x, bed_y, im_x, im_y, longest_edge)
+        assert get_optimal_scaler(bed_x, bed_y, im_x, im_y, longest_edge) == pytest.approx(reference, abs=STEP)
+
+
+def test_longest_edge_none():
+    # Same orientation as the bed: longest_edge is not needed
+    reference = sampled_optimal_scaler(250, 200, 1024, 668, None)
+    assert get_optimal_scaler(250, 200, 1024, 668, None) == pytest.approx(reference, abs=STEP)
+    # Other orientation: both need longest_edge
+    with pytest.raises(TypeError):
+        sampled_optimal_scaler(250, 200, 668, 1024, None)
+    with pytest.raises(TypeError):
+        get_optimal_scaler(250, 200, 668, 1024, None)
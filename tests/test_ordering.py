@@ -0,0 +1,93 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from lib.svg_to_gcode import greedy_reversible_order, improve_order, nearest_neighbour_order, optimize_order, path_travel
+
+
+def random_paths(n, seed, closed=0.0):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 100, (n, 2))
+    ends = starts + rng.uniform(-10, 10, (n, 2))
+    loops = rng.random(n) < closed
+    ends[loops] = starts[loops]
+    return starts, ends
+
+
+def two_opt_moves(order, flipped, reversible):
+    """ Every tour one 2-opt move away: positions i+1..j reversed (and flipped), all of them reversible """
+    n = len(order)
+    for i in range(n - 2):
+        for j in range(i + 2, n):
+            if reversible[order[i + 1:j + 1]].all():
+                new_order, new_flipped = order.copy(), flipped.copy()
+                new_order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                new_flipped[i + 1:j + 1] = ~flipped[i + 1:j + 1][::-1]
+                yield new_order, new_flipped
+
+
+def or_opt_moves(order, flipped, reversible):
+    """ Every tour one Or-opt move away: one path (not the first) moved elsewhere, flipped where allowed """
+    n = len(order)
+    for k in range(1, n):
+        rest_order, rest_flipped = np.delete(order, k), np.delete(flipped, k)
+        for m in range(n - 1):
+            for flip in ([flipped[k], not flipped[k]] if reversible[order[k]] else [flipped[k]]):
+                yield np.insert(rest_order, m + 1, order[k]), np.insert(rest_flipped, m + 1, flip)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_improved_tour_is_a_local_optimum(seed):
+    starts, ends = random_paths(25, seed, closed=0.3)
+    reversible = np.any(starts != ends, axis=1)
+    order, flipped = greedy_reversible_order(starts, ends, reversible)
+    greedy_travel = path_travel(starts, ends, order, flipped)
+    order, flipped = improve_order(starts, ends, reversible, order, flipped, time_limit=30)
+
+    assert sorted(order.tolist()) == list(range(25)) and order[0] == 24
+    assert not flipped[~reversible[order]].any()
+    travel = path_travel(starts, ends, order, flipped)
+    assert travel <= greedy_travel + 1e-9
+    for moves in (two_opt_moves, or_opt_moves):
+        for new_order, new_flipped in moves(order, flipped, reversible):
+            assert path_travel(starts, ends, new_order, new_flipped) >= travel - 1e-6
+
+
+def test_two_opt_reverses_a_stretch():
+    # Segments along the x axis, drawn 0, 2, 1, 3: drawing 2 and 1 the other way round and swapped is shorter
+    starts = np.array([[0, 0], [2, 0], [4, 0], [6, 0]], dtype=float)
+    ends = starts + [1, 0]
+    order, flipped = improve_order(starts, ends, np.ones(4, dtype=bool), [0, 2, 1, 3], [False] * 4)
+    assert path_travel(starts, ends, order, flipped) == pytest.approx(3)
+
+
+def test_or_opt_moves_closed_paths():
+    # Loops can't be reversed, so only moving them helps
+    starts = np.array([[0, 0], [2, 0], [1, 0], [3, 0]], dtype=float)
+    order, flipped = improve_order(starts, starts, np.zeros(4, dtype=bool), [0, 1, 2, 3], [False] * 4)
+    assert order.tolist() == [0, 2, 1, 3] and not flipped.any()
+
+
+def test_optimize_order_small_tours_are_optimal():
+    # With the first path fixed, 5 paths have 4! * 2^4 tours: the local search finds the best here
+    starts, ends = random_paths(5, 7)
+    order, flipped, before, after = optimize_order(starts, ends, improve_time=5)
+    assert before == pytest.approx(path_travel(starts, ends, np.arange(5)))
+    assert after == pytest.approx(path_travel(starts, ends, order, flipped))
+    best = min(path_travel(starts, ends, [4] + list(rest), [False] + list(flips))
+               for rest in itertools.permutations(range(4)) for flips in itertools.product([False, True], repeat=4))
+    assert after <= best + 1e-9
+
+
+def test_without_reverse_nothing_is_flipped():
+    starts, ends = random_paths(30, 4)
+    order, flipped, before, after = optimize_order(starts, ends, reverse=False)
+    assert not flipped.any() and after <= before
+
+
+def test_nearest_neighbour_order():
+    starts = np.array([[0, 0], [5, 0], [1, 0], [10, 0]], dtype=float)
+    ends = starts + [0.5, 0]
+    assert nearest_neighbour_order(starts, ends).tolist() == [3, 1, 2, 0]
+    assert len(nearest_neighbour_order(np.empty((0, 2)), np.empty((0, 2)))) == 0
@@ -0,0 +1,160 @@
+import functools
+import os
+import queue
+import time
+
+import pytest
+
+from lib.pipeline import CANCELLED, DONE, PLOTTING, QUEUED, JobPipeline, MemoryBackend, RedisBackend
+from lib.sim_port import simulated_arm
+
+SQUARE = [{'paths': [{'x': 0, 'y': 0}, {'x': 100, 'y': 0}, {'x': 100, 'y': 100}, {'x': 0, 'y': 100}]}]
+
+arm_factory = functools.partial(simulated_arm, time_scale=0)
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def make_backend(request):
+    """ Backends of one shared queue: the same MemoryBackend, or RedisBackends on one fake Redis server """
+    if request.param == 'memory':
+        backend = MemoryBackend()
+        return lambda **options: backend if not options else MemoryBackend(**options)
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    return lambda **options: RedisBackend(fakeredis.FakeRedis(server=server), **options)
+
+
+def pipeline(backend, ports=('a',), **options):
+    return JobPipeline(list(ports), backend=backend, workers=1, arm_factory=arm_factory, **options)
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_backend_priority_order(make_backend):
+    backend = make_backend()
+    for job_id, priority in [('low', 0), ('high', 2), ('middle', 1), ('high2', 2)]:
+        backend.put(job_id, priority, {'name': job_id})
+    assert backend.remove('middle')
+    assert not backend.remove('missing')
+    assert [backend.get(0.1)[0] for _ in range(3)] == ['high', 'high2', 'low']
+    assert backend.get(0.05) is None
+
+
+def test_backend_full(make_backend):
+    backend = make_backend(capacity=2)
+    backend.put('a', 0, {})
+    backend.put('b', 0, {})
+    with pytest.raises(queue.Full):
+        backend.put('c', 0, {})
+
+
+def test_redis_put_is_atomic():
+    # Another pipeline's put lands between this put's length check and its write: the put is retried and refused
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    other = RedisBackend(fakeredis.FakeRedis(server=server))
+
+    class RacingRedis(fakeredis.FakeRedis):
+        def pipeline(self, *args, **kwargs):
+            transaction = super().pipeline(*args, **kwargs)
+            multi = transaction.multi
+
+            def racing_multi():
+                if len(other) == 0:
+                    other.put('other', 0, {})
+                multi()
+
+            transaction.multi = racing_multi
+            return transaction
+
+    backend = RedisBackend(RacingRedis(server=server), capacity=1)
+    with pytest.raises(queue.Full):
+        backend.put('mine', 0, {})
+    assert len(backend) == 1 and backend.get(0.1)[0] == 'other'
+
+
+def test_draws_jobs(make_backend, svg_path):
+    with pipeline(make_backend(), calibrations={'a': (5, 0)}) as p:
+        jobs = [p.submit_svg(svg_path('cat.svg'), priority=1), p.submit_paths(SQUARE)]
+        for job in jobs:
+            result = job.wait(60)
+            assert job.status == DONE and job.arm == 'a'
+            assert result['acked'] == result['sent'] > 0
+            assert not os.path.exists(job.job_path)
+        stats = p.stats()
+        assert stats[DONE] == 2 and stats['arms']['a']['jobs'] == 2
+
+
+def test_submit_full(make_backend):
+    # Without arms nothing leaves the queue
+    with pipeline(make_backend(), ports=(), capacity=2) as p:
+        jobs = [p.submit_paths(SQUARE), p.submit_paths(SQUARE)]
+        with pytest.raises(queue.Full):
+            p.submit_paths(SQUARE)
+        p.close(cancel=True)
+    assert all(job.status == CANCELLED for job in jobs)
+
+
+def test_close_timeout(make_backend):
+    with pipeline(make_backend(), ports=()) as p:
+        job = p.submit_paths(SQUARE)
+        with pytest.raises(TimeoutError):
+            p.close(timeout=0.2)
+        assert not job.done()
+        p.close(cancel=True, timeout=10)
+    assert job.status == CANCELLED
+
+
+def test_cancel_while_converting(make_backend, svg_path):
+    with pipeline(make_backend()) as p:
+        job = p.submit_svg(svg_path('cat.svg'))
+        assert p.cancel(job.id)
+        with pytest.raises(RuntimeError):
+            job.wait(60)
+        assert job.status == CANCELLED
+    assert not os.path.exists(job.job_path)
+
+
+def test_cancel_queued(make_backend):
+    backend = make_backend()
+    with pipeline(backend, ports=()) as p:
+        job = p.submit_paths(SQUARE)
+        wait_for(lambda: job.status == QUEUED)
+        assert len(backend) == 1
+        assert p.cancel(job.id)
+        assert job.status == CANCELLED and len(backend) == 0
+        assert not os.path.exists(job.job_path)
+        assert not p.cancel(job.id)
+
+
+def test_cancel_plotting(make_backend, svg_path):
+    # 200 lines per second: the 4000 line drawing takes a while
+    with pipeline(make_backend(), stream_options={'max_rate': 200}) as p:
+        job = p.submit_svg(svg_path('cat.svg'))
+        wait_for(lambda: job.status == PLOTTING)
+        assert p.cancel(job.id)
+        with pytest.raises(RuntimeError):
+            job.wait(10)
+        assert job.status == CANCELLED
+        assert job.result['sent'] < 4000
+
+
+def test_pipelines_share_the_queue(make_backend, svg_path):
+    # p1 has no arm of its own: p2 draws its jobs, p1 still learns how they ended
+    with pipeline(make_backend(), ports=('b',)) as p2, pipeline(make_backend(), ports=()) as p1:
+        jobs = [p1.submit_paths(SQUARE) for _ in range(4)]
+        for job in jobs:
+            job.wait(20)
+            assert job.status == DONE and job.arm == 'b'
+        slow = p1.submit_svg(svg_path('cat.svg'))
+        p2.fleet.stream_options['max_rate'] = 200
+        wait_for(lambda: slow.status == PLOTTING)
+        assert p1.cancel(slow.id)
+        with pytest.raises(RuntimeError):
+            slow.wait(10)
+        assert slow.status == CANCELLED
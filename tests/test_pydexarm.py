@@ -0,0 +1,52 @@
+import pytest
+
+from lib.pydexarm import DexarmError, GcodeStreamer
+from lib.sim_port import simulated_arm
+
+
+class ScriptedPort:
+    """ Answers every readline with the next of the given responses """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.written = []
+        self.reads = 0
+
+    def write(self, data):
+        self.written.append(data.decode().strip())
+
+    def readline(self):
+        self.reads += 1
+        return (self.responses.pop(0) + '\n').encode() if self.responses else b''
+
+
+def test_advanced_ok_limits_commands_in_flight():
+    port = ScriptedPort(['ok P0 B5', 'ok P1 B5', 'ok P4 B5', 'ok P4 B5'])
+    streamer = GcodeStreamer(port, max_in_flight=4)
+    for command in ('G1 X1', 'G1 X2', 'G1 X3'):
+        streamer.send(command)
+    assert port.reads == 0
+    # The first ack reports a full planner: the 2 commands outstanding then are all the arm takes
+    streamer.read_response()
+    assert not streamer._has_room(8)
+    # The next one frees a planner block, so one more command may follow
+    streamer.send('G1 X4')
+    assert port.reads == 2
+    assert streamer.in_flight == 2
+    streamer.flush()
+    assert port.written == ['G1 X1', 'G1 X2', 'G1 X3', 'G1 X4']
+
+
+def test_stream_on_simulated_arm():
+    arm = simulated_arm(time_scale=0)
+    commands = [f'G1 X{x} Y300 F6000' for x in range(50)]
+    streamer = arm.stream(commands)
+    assert streamer.stats()['acked'] == 50
+    assert arm.ser.received == commands
+    assert arm.ser.overflows == 0
+
+
+def test_stream_error():
+    arm = simulated_arm(time_scale=0)
+    with pytest.raises(DexarmError):
+        arm.stream(['G1 X1', 'BOGUS', 'G1 X2'])
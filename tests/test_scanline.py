@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+from lib.raycaster import cast_rays, np_seg_intersect, scanline_hatches
+
+
+def reference_cast_rays(segarr, coords, ray_distance):
+    """ The per ray loop cast_rays used to be: np_seg_intersect of every segment with every ray """
+    minx, maxx = coords[:, 0].min(), coords[:, 0].max()
+    for y_ray in np.arange(coords[:, 1].min(), coords[:, 1].max(), ray_distance):
+        ray = np.array([[minx, y_ray], [maxx, y_ray]])
+        xs = [hit[0] for hit in (np_seg_intersect(segment, ray) for segment in segarr) if hit is not None]
+        xs.sort()
+        prev = None
+        for i, (s, e) in enumerate(zip(xs[:-1], xs[1:])):
+            if i % 2 == 0:
+                if prev is not None and (s, e) == prev:
+                    continue
+                yield ([s, y_ray], [e, y_ray])
+                prev = (s, e)
+
+
+def rings(*outlines):
+    segments = []
+    for outline in outlines:
+        points = np.asarray(outline, dtype=float)
+        segments.append(np.stack([points, np.roll(points, -1, axis=0)], axis=1))
+    segarr = np.concatenate(segments)
+    return segarr, segarr.reshape(-1, 2)
+
+
+def star(n, inner, outer, seed):
+    angles = np.linspace(0, 2 * np.pi, 2 * n, endpoint=False) + np.random.default_rng(seed).uniform(0, 0.1)
+    radii = np.where(np.arange(2 * n) % 2 == 0, outer, inner)
+    return np.column_stack([np.cos(angles) * radii + 50, np.sin(angles) * radii + 50])
+
+
+SHAPES = {
+    'square': rings([[0, 0], [20, 0], [20, 20], [0, 20]]),
+    'square with hole': rings([[0, 0], [40, 0], [40, 40], [0, 40]], [[10, 10], [30, 10], [30, 30], [10, 30]]),
+    'u shape': rings([[0, 0], [30, 0], [30, 20], [20, 20], [20, 5], [10, 5], [10, 20], [0, 20]]),
+    'star': rings(star(7, 10, 40, 1)),
+    'random polygon': rings(np.random.default_rng(5).uniform(0, 100, (30, 2))),
+}
+
+
+@pytest.mark.parametrize('name', SHAPES)
+@pytest.mark.parametrize('ray_distance', [0.7, 2, 5])
+def test_same_hatches_as_per_ray_intersection(name, ray_distance):
+    segarr, coords = SHAPES[name]
+    expected = list(reference_cast_rays(segarr, coords, ray_distance))
+    got = list(cast_rays(segarr, coords, ray_distance))
+    assert len(got) == len(expected)
+    np.testing.assert_allclose(np.array(got, dtype=float).reshape(-1, 2, 2),
+                               np.array(expected, dtype=float).reshape(-1, 2, 2), atol=1e-9)
+
+
+def test_ray_index_of_every_hatch():
+    segarr, coords = SHAPES['square with hole']
+    hatches, rays = scanline_hatches(segarr, coords, 2)
+    np.testing.assert_allclose(hatches[:, 0, 1], rays * 2.0)
+    assert np.all(np.diff(rays) >= 0)
+
+
+def test_empty_shapes():
+    hatches, rays = scanline_hatches(np.empty((0, 2, 2)), np.zeros((1, 2)), 2)
+    assert hatches.shape == (0, 2, 2) and len(rays) == 0
+
+
+def test_full_bed_shape_is_fast():
+    # A 2000 segment outline over a 200 mm bed, hatched every 0.5 mm
+    segarr, coords = rings(star(1000, 60, 100, 2))
+    started = time.perf_counter()
+    hatches, _ = scanline_hatches(segarr, coords, 0.5)
+    assert len(hatches) > 400
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,69 @@
+import numpy as np
+from matplotlib.path import Path
+
+from lib.raycaster import serpentine_fill
+
+
+def ring(points):
+    points = np.asarray(points, dtype=float)
+    return np.stack([points, np.roll(points, -1, axis=0)], axis=1)
+
+
+SQUARE = [[0, 0], [20, 0], [20, 20], [0, 20]]
+# A U: the two arms can't be joined above the notch
+U_SHAPE = [[0, 0], [30, 0], [30, 20], [20, 20], [20, 5], [10, 5], [10, 20], [0, 20]]
+
+
+def fill(outline, **options):
+    segarr = ring(outline)
+    return serpentine_fill(segarr, segarr.reshape(-1, 2), 2, **options)
+
+
+def hatch_set(polylines):
+    """ Every hatch as a sorted ((x, y), (x, y)) pair, whichever way it was drawn """
+    hatches = set()
+    for polyline in polylines:
+        for start, end in zip(polyline[:-1:2], polyline[1::2]):
+            hatches.add(tuple(sorted((tuple(np.round(start, 9)), tuple(np.round(end, 9))))))
+    return hatches
+
+
+def inside_or_on(outline, points, eps=1e-6):
+    """ Whether every point is inside the outline or on it """
+    segarr = ring(outline)
+    start, direction = segarr[:, 0], segarr[:, 1] - segarr[:, 0]
+    t = np.clip(np.einsum('pnd,nd->pn', points[:, None] - start, direction) / np.sum(direction ** 2, axis=1), 0, 1)
+    distance = np.min(np.hypot(*(points[:, None] - start - t[..., None] * direction).transpose(2, 0, 1)), axis=1)
+    return Path(outline).contains_points(points) | (distance <= eps)
+
+
+def test_square_in_one_pen_down():
+    polylines = fill(SQUARE)
+    assert len(polylines) == 1
+    # Neighbouring hatches run in opposite directions
+    directions = np.sign(polylines[0][1::2, 0] - polylines[0][::2, 0])
+    assert np.all(directions[1:] == -directions[:-1])
+
+
+def test_same_hatches_as_plain_fill():
+    for outline in (SQUARE, U_SHAPE):
+        assert hatch_set(fill(outline)) == hatch_set(fill(outline, serpentine=False))
+
+
+def test_connectors_stay_inside():
+    polylines = fill(U_SHAPE)
+    assert len(polylines) > 1
+    for polyline in polylines:
+        for start, end in zip(polyline[1:-1:2], polyline[2::2]):
+            assert inside_or_on(U_SHAPE, start + np.linspace(0, 1, 50)[:, None] * (end - start)).all()
+
+
+def test_no_zero_length_hatches():
+    # The lowest corner of the diamond lies on the first ray
+    polylines = fill([[10, 0], [20, 10], [10, 20], [0, 10]], serpentine=False)
+    assert polylines and all(np.hypot(*(polyline[1] - polyline[0])) > 0 for polyline in polylines)
+
+
+def test_min_length():
+    polylines = fill([[10, 0], [20, 10], [10, 20], [0, 10]], serpentine=False, min_length=5)
+    assert all(polyline[1, 0] - polyline[0, 0] >= 5 for polyline in polylines)
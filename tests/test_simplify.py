@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from lib.simplify import rdp_mask, simplify_polyline, visvalingam_mask
+
+
+def noisy_curve(n=400, noise=0.02, seed=0):
+    t = np.linspace(0, 2 * np.pi, n)
+    points = np.column_stack([t * 10, np.sin(t) * 10])
+    return points + np.random.default_rng(seed).uniform(-noise, noise, points.shape)
+
+
+def rdp_reference(points, tolerance):
+    """ Textbook recursive Ramer-Douglas-Peucker, the kept indices """
+    start, end = points[0], points[-1]
+    chord = end - start
+    length = np.hypot(*chord)
+    rel = points[1:-1] - start
+    dist = np.abs(chord[0] * rel[:, 1] - chord[1] * rel[:, 0]) / length
+    if len(dist) == 0 or dist.max() <= tolerance:
+        return [0, len(points) - 1]
+    split = int(np.argmax(dist)) + 1
+    left = rdp_reference(points[:split + 1], tolerance)
+    right = rdp_reference(points[split:], tolerance)
+    return left + [split + i for i in right[1:]]
+
+
+def deviation(points, keep):
+    """ How far every dropped point is from the segment between the kept points around it """
+    kept = np.flatnonzero(keep)
+    worst = 0.0
+    for i, j in zip(kept[:-1], kept[1:]):
+        start, chord = points[i], points[j] - points[i]
+        for point in points[i + 1:j]:
+            t = np.clip(np.dot(point - start, chord) / np.dot(chord, chord), 0, 1)
+            worst = max(worst, float(np.hypot(*(point - start - t * chord))))
+    return worst
+
+
+@pytest.mark.parametrize('tolerance', [0.01, 0.1, 1])
+def test_rdp_matches_the_recursive_definition(tolerance):
+    points = noisy_curve()
+    assert np.flatnonzero(rdp_mask(points, tolerance)).tolist() == rdp_reference(points, tolerance)
+
+
+@pytest.mark.parametrize('mask', [rdp_mask, visvalingam_mask])
+@pytest.mark.parametrize('tolerance', [0.05, 0.5])
+def test_simplified_line_stays_close(mask, tolerance):
+    points = noisy_curve()
+    keep = mask(points, tolerance)
+    assert keep[0] and keep[-1]
+    assert 2 < np.count_nonzero(keep) < len(points)
+    if mask is rdp_mask:
+        assert deviation(points, keep) <= tolerance
+
+
+def test_visvalingam_keeps_large_triangles():
+    points = noisy_curve()
+    tolerance = 0.3
+    kept = points[visvalingam_mask(points, tolerance)]
+    a, b, c = kept[:-2], kept[1:-1], kept[2:]
+    areas = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])) / 2
+    assert np.all(areas >= tolerance ** 2)
+
+
+@pytest.mark.parametrize('method', ['rdp', 'visvalingam'])
+def test_straight_line_and_short_runs(method):
+    line = np.column_stack([np.linspace(0, 10, 50), np.linspace(0, 5, 50)])
+    assert np.flatnonzero(simplify_polyline(line, 0.01, method)).tolist() == [0, 49]
+    assert simplify_polyline(line[:2], 0.01, method).tolist() == [True, True]
+
+
+def test_closed_run():
+    # Start and end coincide, the farthest point from them is kept
+    square = np.array([[0, 0], [1, 0], [2, 0], [2, 2], [0, 2], [0, 0]], dtype=float)
+    keep = rdp_mask(square, 0.1)
+    assert keep[[0, 3, 5]].all() and not keep[1]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        simplify_polyline(noisy_curve(), 0.1, 'douglas')
+
+
+def test_job_reports_removed_points(converter, svg_path):
+    plain = converter().svg_to_gcode(svg_path('cat.svg'))
+    svg_gcode = converter(simplify_tolerance=0.05)
+    simplified = svg_gcode.svg_to_gcode(svg_path('cat.svg'))
+    removed = svg_gcode.job_stats['simplify_points_removed']
+    assert removed > 0 and len(simplified) <= len(plain) - removed
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+from lib.spatial import PointGrid
+
+
+def brute_nearest(points, alive, query):
+    d = np.hypot(*(points - query).T)
+    d[~alive] = np.inf
+    return float(d.min())
+
+
+@pytest.mark.parametrize('cell_size', [None, 0.5, 7])
+def test_nearest_matches_brute_force(cell_size):
+    rng = np.random.default_rng(7)
+    points = rng.uniform(0, 100, (500, 2))
+    grid = PointGrid(points, cell_size=cell_size)
+    for i in rng.choice(len(points), 300, replace=False):
+        grid.remove(i)
+    for query in rng.uniform(-50, 150, (200, 2)):
+        index, distance = grid.nearest(query)
+        assert grid.alive[index]
+        assert distance == pytest.approx(brute_nearest(points, grid.alive, query))
+
+
+def test_nearest_far_outside_the_grid():
+    # Clamped to the grid: no scan of the millions of empty rings out there
+    points = np.random.default_rng(1).uniform(0, 10, (100, 2))
+    grid = PointGrid(points, cell_size=0.1)
+    started = time.perf_counter()
+    for query in ([1e7, 5], [-1e7, -1e7], [5, 1e7]):
+        index, distance = grid.nearest(query)
+        assert distance == pytest.approx(brute_nearest(points, grid.alive, np.array(query)))
+    assert time.perf_counter() - started < 1
+
+
+def test_remove_restore_and_empty():
+    grid = PointGrid([[0, 0], [10, 0]])
+    grid.remove(0)
+    assert grid.nearest([1, 0])[0] == 1
+    grid.restore(0)
+    assert grid.nearest([1, 0])[0] == 0
+    grid.remove(0)
+    grid.remove(1)
+    assert len(grid) == 0 and grid.nearest([0, 0]) == (None, np.inf)
+
+
+def test_within():
+    rng = np.random.default_rng(3)
+    points = rng.uniform(0, 50, (300, 2))
+    grid = PointGrid(points)
+    query = np.array([25.0, 25.0])
+    expected = np.flatnonzero(np.hypot(*(points - query).T) <= 8)
+    assert sorted(grid.within(query, 8)) == expected.tolist()
@@ -0,0 +1,94 @@
+import itertools
+
+import pytest
+
+import lib.svg_to_gcode
+from lib.svg_to_gcode import SVG_GCode
+
+
+def counting(monkeypatch, owner, name):
+    """ Wrap owner.name so every call is counted, returns the list of calls """
+    calls = []
+    wrapped = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return wrapped(*args, **kwargs)
+    monkeypatch.setattr(owner, name, wrapper)
+    return calls
+
+
+def first_drawing_move(lines):
+    """ Consume lines up to the first pen down move (the header's G1 F words aren't moves) """
+    for line in lines:
+        if line.split()[0] in ('G1', 'G2', 'G3', 'G5') and ' X' in line:
+            return line
+    raise AssertionError('no drawing move')
+
+
+def moves(lines):
+    return sum(line.startswith('G1 X') for line in lines)
+
+
+def square(x, y, size=10):
+    return {'paths': [{'x': x, 'y': y}, {'x': x + size, 'y': y}, {'x': x + size, 'y': y + size},
+                      {'x': x, 'y': y + size}, {'x': x, 'y': y}]}
+
+
+CANVAS = [square(40 * i, 25 * (i % 3)) for i in range(6)]
+
+
+@pytest.mark.parametrize('name', ['mickey.svg', 'cat.svg'])
+def test_svg_generator_matches_the_list(converter, svg_path, name):
+    assert list(converter().iter_svg_gcode(svg_path(name))) == converter().svg_to_gcode(svg_path(name))
+
+
+def test_svg_paths_are_converted_as_they_are_sent(converter, svg_path, monkeypatch):
+    svg_gcode = converter()
+    calls = counting(monkeypatch, svg_gcode, 'svg_to_toolpath')
+    total = len(svg_gcode.svg_to_path_data(svg_path('mickey.svg')))
+    assert total > 1
+
+    lines = svg_gcode.iter_svg_gcode(svg_path('mickey.svg'))
+    assert calls == []
+    first_drawing_move(lines)
+    assert len(calls) == 1
+    list(lines)
+    assert len(calls) == total
+
+
+def test_merging_needs_every_path_first(converter, svg_path, monkeypatch):
+    svg_gcode = converter(merge_tolerance=0.05)
+    calls = counting(monkeypatch, svg_gcode, 'svg_to_toolpath')
+    first_drawing_move(svg_gcode.iter_svg_gcode(svg_path('mickey.svg')))
+    assert len(calls) == len(svg_gcode.svg_to_path_data(svg_path('mickey.svg')))
+
+
+@pytest.mark.parametrize('stream_window', [None, 1, 4])
+def test_canvas_generator_matches_the_list(stream_window):
+    streamed = list(SVG_GCode(stream_window=stream_window).iter_path_gcode(CANVAS))
+    assert streamed == SVG_GCode(stream_window=stream_window).path_to_gcode(CANVAS)
+    # Every square is drawn whichever window it was ordered in
+    one = SVG_GCode().path_to_gcode(CANVAS[:1])
+    assert moves(streamed) == moves(one) * len(CANVAS)
+
+
+def test_canvas_window_is_flattened_before_the_rest(monkeypatch):
+    calls = counting(monkeypatch, lib.svg_to_gcode, 'path_to_coordinate_array')
+    lines = SVG_GCode(stream_window=2).iter_path_gcode(CANVAS)
+    first_drawing_move(lines)
+    assert len(calls) == 2
+    list(lines)
+    assert len(calls) == len(CANVAS)
+
+
+def test_canvas_single_points_are_skipped():
+    paths = CANVAS[:2] + [{'paths': [{'x': 5, 'y': 5}]}] + CANVAS[2:3]
+    lines = list(SVG_GCode(stream_window=2).iter_path_gcode(paths))
+    assert moves(lines) == moves(SVG_GCode().path_to_gcode(CANVAS[:1])) * 3
+
+
+def test_generator_stops_early():
+    lines = SVG_GCode(stream_window=1).iter_path_gcode(CANVAS)
+    assert len(list(itertools.islice(lines, 3))) == 3
+    lines.close()
@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+import pytest
+
+from lib.svg_interpreter import svg_to_toolpath, tokenize_path
+from lib.toolpath import CLOSED
+
+
+def test_tokenize_path():
+    commands = tokenize_path('M0,0 10-5L1.5.5 1e1 2 a1 1 0 015 5z')
+    assert [cmd for cmd, _ in commands] == ['M', 'L', 'L', 'a', 'z']
+    np.testing.assert_array_equal(commands[1][1], [[10, -5]])
+    np.testing.assert_array_equal(commands[2][1], [[1.5, 0.5], [10, 2]])
+    np.testing.assert_array_equal(commands[3][1], [[1, 1, 0, 0, 1, 5, 5]])
+    assert commands[4][1].shape == (1, 0)
+
+
+@pytest.mark.parametrize('d', [
+    'M ' + '1' * 20 + 'x',
+    'M0 0 L' + ' 12.34 56.78' * 3 + ' 1e',
+    'M0 0 L' + ' 12.34 56.78' * 4 + ' 1e',
+    'M0 0 L' + ' 1234567890' * 50 + ' #',
+])
+def test_malformed_path_fails_quickly(d):
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        tokenize_path(d)
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize('d, lengths, flags', [
+    # A move to the current point doesn't lift the pen
+    ('M0 0 L1 1 M1 1 L2 0', [3], [0]),
+    ('M0 0 l1 1 m0 0 l1 -1', [3], [0]),
+    # Nor does one to the start of the subpath just closed, which then goes on open
+    ('M0 0 L1 0 L1 1 Z M0 0 L-1 0', [5], [0]),
+    ('M0 0 L1 0 L1 1 Z M5 5 L6 6', [4, 2], [CLOSED, 0]),
+    ('M0 0 L1 1 M2 2 L3 3', [2, 2], [0, 0]),
+])
+def test_moves_to_the_current_point(d, lengths, flags):
+    toolpath = svg_to_toolpath(tokenize_path(d))
+    assert toolpath.lengths.tolist() == lengths
+    assert toolpath.flags.tolist() == flags
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from lib.toolpath import ARC, CLOSED, CUBIC, FILL, LINE, Toolpath
+
+
+def curved_toolpath(lengths, seed):
+    """ Paths of the given vertex counts, every move after the first vertex a random line, arc or cubic """
+    rng = np.random.default_rng(seed)
+    count = sum(lengths)
+    kinds = rng.integers(0, 3, count).astype(np.uint8)
+    aux = rng.uniform(-50, 50, (count, 4))
+    aux[kinds == ARC, 2] = rng.integers(0, 2, np.count_nonzero(kinds == ARC))
+    aux[kinds == ARC, 3] = 0
+    aux[kinds == LINE] = 0
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    kinds[offsets[:-1]] = LINE
+    aux[offsets[:-1]] = 0
+    return Toolpath(rng.uniform(0, 100, (count, 2)), offsets, rng.integers(0, 4, len(lengths)), kinds, aux)
+
+
+def reversed_moves(coords, kinds, aux):
+    """ One path drawn from its end, move by move: the move into vertex i + 1, reversed, now leads into vertex i """
+    new_kinds, new_aux = [LINE], [np.zeros(4)]
+    for i in range(len(coords) - 1, 0, -1):
+        kind, move = kinds[i], aux[i].copy()
+        if kind == ARC:
+            move[2] = 1 - move[2]
+        elif kind == CUBIC:
+            move = move[[2, 3, 0, 1]]
+        new_kinds.append(kind)
+        new_aux.append(move)
+    return coords[::-1], np.array(new_kinds), np.array(new_aux)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_take_matches_path_by_path(seed):
+    toolpath = curved_toolpath([4, 1, 6, 2, 3], seed)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(toolpath))
+    flipped = rng.random(len(toolpath)) < 0.5
+    taken = toolpath.take(order, flipped)
+
+    assert taken.lengths.tolist() == toolpath.lengths[order].tolist()
+    assert taken.flags.tolist() == toolpath.flags[order].tolist()
+    for new, (i, flip) in enumerate(zip(order, flipped)):
+        span = slice(toolpath.offsets[i], toolpath.offsets[i + 1])
+        expected = (toolpath.coords[span], toolpath.kinds[span], toolpath.aux[span])
+        if flip:
+            expected = reversed_moves(*expected)
+        got_span = slice(taken.offsets[new], taken.offsets[new + 1])
+        np.testing.assert_array_equal(taken.coords[got_span], expected[0])
+        np.testing.assert_array_equal(taken.kinds[got_span], expected[1])
+        np.testing.assert_array_equal(taken.aux[got_span], expected[2])
+
+
+def test_flipped_arc_keeps_its_center():
+    # A counter clockwise quarter circle around the origin, drawn backwards is clockwise around the same center
+    toolpath = Toolpath([[10, 0], [0, 10]], [0, 2], kinds=[LINE, ARC], aux=[[0, 0, 0, 0], [0, 0, 1, 0]])
+    taken = toolpath.take([0], [True])
+    assert taken.coords.tolist() == [[0, 10], [10, 0]]
+    assert taken.kinds.tolist() == [LINE, ARC]
+    assert taken.aux[1].tolist() == [0, 0, 0, 0]
+
+
+def test_flipped_cubic_swaps_its_controls():
+    toolpath = Toolpath([[0, 0], [3, 0]], [0, 2], kinds=[LINE, CUBIC], aux=[[0, 0, 0, 0], [1, 1, 2, 1]])
+    taken = toolpath.take([0], [True])
+    assert taken.coords.tolist() == [[3, 0], [0, 0]]
+    assert taken.aux[1].tolist() == [2, 1, 1, 1]
+    # Flipping twice gives the path back
+    again = taken.take([0], [True])
+    np.testing.assert_array_equal(again.aux, toolpath.aux)
+    np.testing.assert_array_equal(again.kinds, toolpath.kinds)
+
+
+def test_straight_paths_stay_without_kinds():
+    toolpath = Toolpath.from_polylines([[[0, 0], [1, 0], [1, 1]], [[5, 5], [6, 6]]], flags=CLOSED)
+    taken = toolpath.take([1, 0], [False, True])
+    assert taken.kinds is None and taken.aux is None
+    assert taken.coords.tolist() == [[5, 5], [6, 6], [1, 1], [1, 0], [0, 0]]
+    assert taken.flags.tolist() == [CLOSED, CLOSED]
+    assert toolpath.take([1, 0]).starts.tolist() == [[5, 5], [0, 0]]
+
+
+def test_from_polylines_skips_empty_ones():
+    toolpath = Toolpath.from_polylines([np.empty((0, 2)), [[0, 0], [1, 1]], [[2, 2]]], flags=FILL)
+    assert len(toolpath) == 2 and toolpath.offsets.tolist() == [0, 2, 3]
+    assert toolpath.flags.tolist() == [FILL, FILL]
+    assert len(Toolpath.from_polylines([])) == 0
+
+
+def test_concatenate_mixes_straight_and_curved():
+    straight = Toolpath.from_polylines([[[0, 0], [1, 1]]])
+    curved = curved_toolpath([3, 2], 9)
+    joined = Toolpath.concatenate([straight, Toolpath.empty(), curved])
+    assert len(joined) == 3 and joined.offsets.tolist() == [0, 2, 5, 7]
+    assert joined.kinds[:2].tolist() == [LINE, LINE]
+    np.testing.assert_array_equal(joined.kinds[2:], curved.kinds)
+    np.testing.assert_array_equal(joined.aux[2:], curved.aux)
+    assert Toolpath.concatenate([straight]) is straight
+
+
+def test_paths_share_the_arrays():
+    toolpath = curved_toolpath([2, 3, 4], 3)
+    middle = toolpath.paths(1, 3)
+    assert middle.offsets.tolist() == [0, 3, 7]
+    assert np.shares_memory(middle.coords, toolpath.coords)
+    np.testing.assert_array_equal(middle.path(1), toolpath.path(2))
+    np.testing.assert_array_equal(middle.kinds, toolpath.kinds[2:])
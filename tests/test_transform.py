@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from lib.transform import apply_affine, compose, parse_transform, rotation, scaling, translation
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">
+  <path d="M0 0 L10 0" transform="translate(5 5)"/>
+  <g transform="scale(2)"><path d="M0 0 L0 10"/></g>
+</svg>'''
+
+
+def test_parse_transform():
+    matrix = parse_transform('translate(10, 20) rotate(90) scale(2 3)')
+    expected = compose(translation(10, 20), rotation(90), scaling(2, 3))
+    np.testing.assert_allclose(matrix, expected, atol=1e-12)
+    np.testing.assert_allclose(apply_affine(matrix, np.array([[1.0, 1.0]])), [[7, 22]], atol=1e-12)
+
+
+def test_path_transforms(converter, tmp_path):
+    svg_file = tmp_path / 'shapes.svg'
+    svg_file.write_text(SVG)
+    svg_gcode = converter(apply_svg_transforms=True)
+    transforms = svg_gcode.svg_to_path_transforms(str(svg_file), 2)
+    np.testing.assert_allclose(transforms[0], translation(5, 5))
+    np.testing.assert_allclose(transforms[1], scaling(2))
+    assert converter().svg_to_path_transforms(str(svg_file), 2) == [None, None]
+
+
+def test_svg_to_bed_divides(converter):
+    # x / units, not x * (1 / units): 3 * (1 / 20) is 0.15000000000000002
+    svg_gcode = converter(svg_units_per_mm=20)
+    coords = svg_gcode.svg_to_bed(np.array([[3.0, 3.0]]))
+    assert coords.tolist() == [[0.15, 250.15]]
+    coords = svg_gcode.svg_to_bed(np.array([[1.0, 1.0]]), translation(2, 2))
+    assert coords.tolist() == [[0.15, 250.15]]
+
+
+def test_path_transforms_count_mismatch(converter, tmp_path):
+    svg_file = tmp_path / 'shapes.svg'
+    svg_file.write_text(SVG)
+    svg_gcode = converter(apply_svg_transforms=True)
+    with pytest.raises(ValueError):
+        svg_gcode.svg_to_path_transforms(str(svg_file), 3)
+    with pytest.raises(ValueError):
+        list(svg_gcode.iter_svg_toolpaths(['M0 0 L1 1'], transforms=[]))